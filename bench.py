@@ -0,0 +1,574 @@
+"""
+Benchmarks for javapy. Run with ``python bench.py [name ...]``; with no names, runs all of them.
+"""
+import sys
+import time
+
+from javapy import tree
+
+BENCHMARKS = {}
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+def timed(func, *args, repeat=3):
+    """ Returns the best time of calling func(*args) repeat times. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(title, sizes, make, func):
+    print(title)
+    print(f"  {'n':>8} {'total (ms)':>12} {'per item (us)':>14}")
+    for n in sizes:
+        arg = make(n)
+        elapsed = timed(func, arg)
+        print(f"  {n:>8} {elapsed*1e3:>12.2f} {elapsed/n*1e6:>14.3f}")
+    print()
+
+def binary_chain(n):
+    expr = tree.MemberAccess(name=tree.Name('x0'))
+    for i in range(1, n):
+        expr = tree.BinaryExpression(op='+', lhs=expr, rhs=tree.MemberAccess(name=tree.Name(f'x{i}')))
+    return expr
+
+def argument_list(n):
+    return tree.FunctionCall(name=tree.Name('f'), args=[tree.Literal(str(i)) for i in range(n)])
+
+def type_argument_list(n):
+    return tree.GenericType(name=tree.Name('Tuple'), typeargs=[tree.GenericType(name=tree.Name(f'T{i}')) for i in range(n)])
+
+@benchmark
+def pretty():
+    """ The pretty printer should take time linear in the size of its output. """
+    sizes = (1000, 2000, 4000, 8000)
+    for title, make in (("binary chain", binary_chain), ("argument list", argument_list), ("type argument list", type_argument_list)):
+        report(f"pretty_str, {title}", sizes, make, lambda node: tree.pretty_str(node, width=80))
+
+@benchmark
+def traverse():
+    """ The overhead of NodeVisitor and NodeModifier per node visited. """
+    class Visitor(tree.NodeVisitor):
+        def visit_name(self, node, value=None):
+            return True
+    class Modifier(tree.NodeModifier):
+        def visit_name(self, node, value=None):
+            return True, node
+    def count(node):
+        return sum(1 for _ in walk(node))
+    def walk(node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(tree.iter_child_nodes(node))
+    sizes = (1000, 2000, 4000, 8000)
+    for title, engine in (("NodeVisitor", Visitor()), ("NodeModifier", Modifier())):
+        print(f"{title}, binary chain")
+        print(f"  {'terms':>8} {'nodes':>8} {'total (ms)':>12} {'per node (us)':>14}")
+        for n in sizes:
+            node = binary_chain(n)
+            elapsed = timed(engine, node)
+            nodes = count(node)
+            print(f"  {n:>8} {nodes:>8} {elapsed*1e3:>12.2f} {elapsed/nodes*1e6:>14.3f}")
+        print()
+
+@benchmark
+def prune():
+    """ Visitors which only handle a few Node types skip the subtrees which cannot contain them. """
+    import os.path
+    from javapy.parser import parse_file
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.javapy'), 'rb') as file:
+        unit = parse_file(file)
+    class Imports(tree.NodeVisitor):
+        def visit_import(self, node, value=None):
+            return True
+    class ImportsWithoutPruning(Imports):
+        def leave_node(self, node, value=None):
+            pass
+    class Calls(tree.NodeVisitor):
+        def visit_function_call(self, node, value=None):
+            return True
+    print("prune")
+    for title, visitor in (("imports", Imports()), ("imports, no pruning", ImportsWithoutPruning()), ("function calls", Calls())):
+        print(f"  {title:<22} {timed(visitor, unit)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def equality():
+    """ Comparing trees only walks them until their structural hashes are known. """
+    import os.path
+    from javapy.parser import parse_file, JavaParser
+    directory = os.path.join(os.path.dirname(__file__), 'javapy')
+    with open(os.path.join(directory, 'test.javapy'), 'rb') as file:
+        unit1 = parse_file(file)
+    with open(os.path.join(directory, 'test.java'), 'rb') as file:
+        unit2 = parse_file(file, parser=JavaParser)
+    method = next(member for member in unit1.types[0].members if isinstance(member, tree.FunctionDeclaration))
+    print("equality")
+    print(f"  first comparison       {timed(lambda: unit1 == unit2, repeat=1)*1e3:>8.2f} ms")
+    print(f"  equal                  {timed(lambda: unit1 == unit2)*1e3:>8.2f} ms")
+    method.name = tree.Name('changed')
+    print(f"  one name changed       {timed(lambda: unit1 == unit2)*1e6:>8.2f} us")
+    print(f"  members deduplicated   {len({*unit1.types[0].members, *unit2.types[0].members})} of {2*len(unit1.types[0].members)}")
+    print()
+
+@benchmark
+def rerender():
+    """ Rendering again after changing one statement should not cost the size of the file. """
+    import os.path
+    from javapy.parser import parse_file
+    with open(os.path.join(os.path.dirname(__file__), 'example.javapy'), 'rb') as file:
+        unit = parse_file(file)
+    first = timed(str, unit, repeat=1)
+    method = next(member for member in unit.types[0].members if isinstance(member, tree.FunctionDeclaration) and member.body)
+    stmts = method.body.stmts
+    def change():
+        stmts.append(tree.ReturnStatement())
+        str(unit)
+        stmts.pop()
+        str(unit)
+    print("rerender")
+    print(f"  first render      {first*1e3:>8.2f} ms")
+    print(f"  unchanged         {timed(str, unit)*1e6:>8.2f} us")
+    print(f"  one statement     {timed(change)/2*1e6:>8.2f} us")
+    print()
+
+@benchmark
+def serialize():
+    """ Loading a serialized tree should be cheaper than parsing its source again. """
+    import os.path
+    import pickle
+    from javapy.parser import parse_str
+    from javapy import serialize
+    with open(os.path.join(os.path.dirname(__file__), 'example.javapy'), 'rb') as file:
+        source = file.read()
+    unit = parse_str(source.decode('utf-8'))
+    data = serialize.dumps(unit)
+    pickled = pickle.dumps(unit, pickle.HIGHEST_PROTOCOL)
+    print("serialize")
+    print(f"  source                 {len(source):>10} bytes")
+    print(f"  dumps                  {len(data):>10} bytes {timed(serialize.dumps, unit)*1e3:>8.2f} ms")
+    print(f"  pickle.dumps           {len(pickled):>10} bytes {timed(pickle.dumps, unit, pickle.HIGHEST_PROTOCOL)*1e3:>8.2f} ms")
+    print(f"  parse                  {timed(parse_str, source.decode('utf-8'))*1e3:>21.2f} ms")
+    print(f"  loads                  {timed(serialize.loads, data)*1e3:>21.2f} ms")
+    print(f"  pickle.loads           {timed(pickle.loads, pickled)*1e3:>21.2f} ms")
+    print()
+
+@benchmark
+def snapshot():
+    """ Taking a Snapshot before a change and restoring it should not cost the size of the tree. """
+    import os.path
+    from javapy.parser import parse_file
+    with open(os.path.join(os.path.dirname(__file__), 'example.javapy'), 'rb') as file:
+        unit = parse_file(file)
+    method = next(member for member in unit.types[0].members if isinstance(member, tree.FunctionDeclaration) and member.body)
+    def rollback():
+        with unit.snapshot() as snapshot:
+            method.body.stmts.append(tree.ReturnStatement())
+            method.name = tree.Name('changed')
+            snapshot.restore()
+    print("snapshot")
+    print(f"  copy                   {timed(unit.copy)*1e3:>8.2f} ms")
+    print(f"  snapshot and restore   {timed(rollback)*1e6:>8.2f} us")
+    print()
+
+@benchmark
+def lookup():
+    """ Finding the Node at a position should not walk the tree. """
+    import io
+    import os.path
+    import random
+    from javapy.parser import JavaParser, SpanIndex
+    from javapy.tokenize import tokenize
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.java'), 'rb') as file:
+        source = file.read()
+    parser = JavaParser(tokenize(io.BytesIO(source).readline), spans=True)
+    unit = parser.parse_compilation_unit()
+    lines = source.decode('utf-8').splitlines()
+    random.seed(0)
+    positions = [(line, random.randrange(len(lines[line]) + 1)) for line in random.choices(range(len(lines)), k=1000)]
+    index = SpanIndex(unit, parser.spans)
+    def node_at():
+        for line, column in positions:
+            index.node_at(line, column)
+    def member_at():
+        for line, column in positions:
+            index.member_at(line, column)
+    nodes = [index.node_at(line, column) for line, column in positions]
+    nodes = [node for node in nodes if node is not None]
+    def span():
+        for node in nodes:
+            index.span(node)
+    print("lookup")
+    print(f"  build index            {timed(SpanIndex, unit, parser.spans)*1e3:>8.2f} ms for {len(index)} nodes")
+    print(f"  node_at                {timed(node_at)/len(positions)*1e6:>8.2f} us")
+    print(f"  member_at              {timed(member_at)/len(positions)*1e6:>8.2f} us")
+    print(f"  span                   {timed(span)/len(nodes)*1e6:>8.2f} us")
+    print()
+
+@benchmark
+def query():
+    """ Running many checks over one tree should walk it once, not once per check. """
+    import os.path
+    from javapy.parser import parse_file, JavaParser
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.java'), 'rb') as file:
+        unit = parse_file(file, parser=JavaParser)
+    names = ['FunctionCall', 'ClassCreator', 'ReturnStatement', 'FieldDeclaration', 'Lambda', 'IfStatement']
+    selectors = [f"{name}" for name in names] + [f"FunctionDeclaration {name}" for name in names] \
+              + [f"Block > {name}" for name in names] + [f"{name}[name=of]" for name in names] + [f"ClassDeclaration {name}" for name in names]
+    def with_visitors():
+        for selector in selectors:
+            selector = tree.Selector.compile(selector)
+            class Visitor(tree.NodeVisitor):
+                def visit_node(self, node, value=None):
+                    selector.matches(node)
+                    return True
+            Visitor()(unit)
+    def with_index():
+        index = tree.NodeIndex(unit)
+        for selector in selectors:
+            index.select(selector)
+    print(f"query, {len(selectors)} selectors")
+    print(f"  one walk per selector  {timed(with_visitors, repeat=1)*1e3:>8.2f} ms")
+    print(f"  one NodeIndex          {timed(with_index)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def memory():
+    """ Translating files one after another should free each tree as soon as it is dropped,
+        leaving the cyclic garbage collector nothing to find and RSS flat.
+    """
+    import gc
+    import resource
+    from javapy.parser import parse_str, JavaParser
+    source = '''package demo;
+
+class Point {
+    int x, y;
+
+    Point(int x, int y) {
+        this.x = x;
+        this.y = y;
+    }
+
+    int dist(Point other) {
+        return Math.abs(x - other.x) + Math.abs(y - other.y);
+    }
+}
+'''
+    translations = 10000
+    def rss():
+        try:
+            with open('/proc/self/statm') as file:
+                return int(file.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    pauses = {0: [], 1: [], 2: []}
+    collected = [0]
+    started = [0.0]
+    def callback(phase, info):
+        if phase == 'start':
+            started[0] = time.perf_counter()
+        else:
+            pauses[info['generation']].append(time.perf_counter() - started[0])
+            collected[0] += info['collected']
+    gc.collect()
+    gc.callbacks.append(callback)
+    try:
+        print(f"memory, {translations} translations")
+        print(f"  {'done':>8} {'RSS (MB)':>10}")
+        start = time.perf_counter()
+        for i in range(translations):
+            str(parse_str(source, parser=JavaParser))
+            if i % (translations // 10) == 0 or i == translations - 1:
+                print(f"  {i+1:>8} {rss()/2**20:>10.1f}")
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(callback)
+    print(f"  total time             {elapsed:>8.2f} s")
+    for generation, times in pauses.items():
+        print(f"  gen {generation} collections       {len(times):>8}, {sum(times)*1e3:>8.2f} ms total, {max(times, default=0)*1e3:>6.2f} ms max")
+    print(f"  objects freed by gc    {collected[0]:>8}")
+    print()
+
+@benchmark
+def columnar():
+    """ Analysing a corpus of serialized trees as columns should not create a Node per node. """
+    import os.path
+    from collections import Counter
+    from javapy.parser import parse_file, JavaParser
+    from javapy import serialize
+    from javapy.columnar import ColumnarTree
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.java'), 'rb') as file:
+        corpus = [serialize.dumps(parse_file(file, parser=JavaParser))] * 20
+    def with_objects():
+        kinds = Counter()
+        calls = 0
+        for data in corpus:
+            stack = [serialize.loads(data)]
+            while stack:
+                node = stack.pop()
+                kinds[type(node).__name__] += 1
+                if isinstance(node, tree.FunctionCall) and node.name == 'println':
+                    calls += 1
+                stack.extend(tree.iter_child_nodes(node))
+    def with_columns():
+        kinds = Counter()
+        calls = 0
+        for data in corpus:
+            columns = ColumnarTree.loads(data)
+            kinds.update(columns.count_kinds())
+            calls += len(columns.calls_to('println'))
+    print(f"columnar, {len(corpus)} files")
+    print(f"  Nodes                  {timed(with_objects, repeat=1)*1e3:>8.2f} ms")
+    print(f"  columns                {timed(with_columns, repeat=1)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def pipeline():
+    """ Six modifiers fused into one ModifierPipeline traverse the tree once instead of six times. """
+    import os.path
+    from javapy.parser import parse_file, JavaParser
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.java'), 'rb') as file:
+        unit = parse_file(file, parser=JavaParser)
+    class Names(tree.NodeModifier):
+        def visit_name(self, node, value=None):
+            return True, node
+    class Literals(tree.NodeModifier):
+        def visit_literal(self, node, value=None):
+            return True, node
+    class Operators(tree.NodeModifier):
+        def leave_binary_expression(self, node, value=None):
+            return node
+    class Accesses(tree.NodeModifier):
+        def visit_member_access(self, node, value=None):
+            return True, node
+    class Calls(tree.NodeModifier):
+        def visit_function_call(self, node, value=None):
+            return True, node
+    class Blocks(tree.NodeModifier):
+        def leave_block(self, node, value=None):
+            return node
+    modifiers = [Names(), Literals(), Operators(), Accesses(), Calls(), Blocks()]
+    fused = tree.ModifierPipeline(modifiers)
+    def one_by_one():
+        for modifier in modifiers:
+            modifier(unit)
+    print(f"pipeline, {len(modifiers)} modifiers")
+    print(f"  one after another      {timed(one_by_one)*1e3:>8.2f} ms")
+    print(f"  fused                  {timed(fused, unit)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def build():
+    """ A build starts the interpreter once per worker instead of once per file. """
+    import os
+    import os.path
+    import shutil
+    import subprocess
+    import tempfile
+    from pathlib import Path
+    from javapy.build import build
+    from javapy.cache import Cache
+    here = os.path.dirname(os.path.abspath(__file__))
+    count = 40
+    with tempfile.TemporaryDirectory() as directory:
+        src = Path(directory, 'src')
+        for i in range(count):
+            (src / f"pkg{i % 4}").mkdir(parents=True, exist_ok=True)
+            shutil.copy(os.path.join(here, 'example.javapy'), str(src / f"pkg{i % 4}" / f"Example{i}.javapy"))
+        def one_process_per_file():
+            for path in src.rglob('*.javapy'):
+                subprocess.run([sys.executable, os.path.join(here, 'javapy.py'), str(path), '--out', str(path.with_suffix('.java'))],
+                               check=True, stdout=subprocess.DEVNULL)
+        jobs = os.cpu_count() or 1
+        print(f"build, {count} files")
+        print(f"  one process per file   {timed(one_process_per_file, repeat=1)*1e3:>8.2f} ms")
+        print(f"  build -j 1             {timed(lambda: build(src, Path(directory, 'out'), jobs=1, force=True), repeat=1)*1e3:>8.2f} ms")
+        print(f"  build -j {jobs:<3}           {timed(lambda: build(src, Path(directory, 'out'), jobs=jobs, force=True), repeat=1)*1e3:>8.2f} ms")
+        print(f"  no-op rebuild          {timed(lambda: build(src, Path(directory, 'out'), jobs=jobs))*1e3:>8.2f} ms")
+        cache = Cache(Path(directory, 'cache'))
+        build(src, Path(directory, 'out'), jobs=jobs, force=True, cache=cache)
+        print(f"  new checkout, cached   {timed(lambda: build(src, Path(directory, 'checkout'), jobs=jobs, force=True, cache=cache), repeat=1)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def parse_cache():
+    """ Parsing the same source again with a ParseCache costs a hash and a lookup, plus a copy unless sharing. """
+    import os.path
+    from javapy.parser import parse_str, ParseCache
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.javapy'), encoding='utf-8') as file:
+        source = file.read()
+    copying = ParseCache()
+    sharing = ParseCache(copy=False)
+    parse_str(source, cache=copying)
+    parse_str(source, cache=sharing)
+    print("parse cache")
+    print(f"  no cache               {timed(parse_str, source)*1e3:>8.2f} ms")
+    print(f"  cached, copied         {timed(lambda: parse_str(source, cache=copying))*1e3:>8.2f} ms")
+    print(f"  cached, shared         {timed(lambda: parse_str(source, cache=sharing))*1e6:>8.2f} us")
+    print()
+
+@benchmark
+def reparse():
+    """ Editing one statement reparses only its member, but the whole file is still tokenized. """
+    import io
+    import os.path
+    from javapy.parser import Parser, reparse as reparse_file
+    from javapy.tokenize import tokenize
+    with open(os.path.join(os.path.dirname(__file__), 'javapy', 'test.javapy'), encoding='utf-8') as file:
+        source = file.read()
+    i = source.index('return', len(source)//2)
+    indent = source[source.rindex('\n', 0, i)+1:i]
+    versions = [source.encode('utf-8'), (source[:i] + 'x = 1\n' + indent + source[i:]).encode('utf-8')]
+
+    def parse():
+        parser = Parser(tokenize(io.BytesIO(versions[0]).readline), 'test.javapy', spans=True)
+        return parser.parse_compilation_unit(), parser
+
+    state = list(parse())
+    def edit():
+        # Alternates between the two versions, so every call has a change to reparse
+        versions.reverse()
+        state[:] = reparse_file(state[0], state[1], io.BytesIO(versions[0]))
+
+    print("reparse")
+    print(f"  full parse             {timed(parse)*1e3:>8.2f} ms")
+    print(f"  reparse one member     {timed(edit)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def watch():
+    """ A watcher translates a saved file without starting the interpreter or importing javapy. """
+    import os
+    import os.path
+    import shutil
+    import subprocess
+    import tempfile
+    from pathlib import Path
+    from javapy.watch import Watcher
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        src = Path(directory, 'src')
+        src.mkdir()
+        source = src / 'Example.javapy'
+        shutil.copy(os.path.join(here, 'example.javapy'), str(source))
+        original = source.read_text(encoding='utf-8')
+        i = original.index('return', len(original)//2)
+        indent = original[original.rindex('\n', 0, i)+1:i]
+        versions = [original, original[:i] + 'x = 1\n' + indent + original[i:]]
+        watcher = Watcher(src, Path(directory, 'out'), debounce=0)
+        watcher.start()
+
+        def save():
+            versions.reverse()
+            stat = source.stat()
+            source.write_text(versions[0], encoding='utf-8')
+            os.utime(str(source), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        def fresh_interpreter():
+            save()
+            subprocess.run([sys.executable, os.path.join(here, 'javapy.py'), str(source), '--out', str(Path(directory, 'Example.java'))],
+                           check=True, stdout=subprocess.DEVNULL)
+
+        def poll():
+            save()
+            changes = watcher.poll()
+            assert len(changes) == 1 and changes[0].action != 'failed', changes
+
+        print("watch, one save of example.javapy")
+        print(f"  fresh interpreter      {timed(fresh_interpreter)*1e3:>8.2f} ms")
+        print(f"  watcher                {timed(poll)*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def serve():
+    """ A translation server answers each file with the cost of the translation alone. """
+    import os
+    import os.path
+    import subprocess
+    import tempfile
+    from javapy.serve import Client
+    here = os.path.dirname(os.path.abspath(__file__))
+    source_path = os.path.join(here, 'example.javapy')
+    with open(source_path, encoding='utf-8') as file:
+        source = file.read()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'javapy.sock')
+        server = subprocess.Popen([sys.executable, os.path.join(here, 'javapy.py'), 'serve', '--socket', path, '-j', '1'],
+                                  stdout=subprocess.PIPE)
+        try:
+            server.stdout.readline()
+            with Client(path) as client:
+                client.translate(source)
+                def fresh_interpreter():
+                    subprocess.run([sys.executable, os.path.join(here, 'javapy.py'), source_path, '--out', os.path.join(directory, 'example.java')],
+                                   check=True, stdout=subprocess.DEVNULL)
+                print("serve, one translation of example.javapy")
+                print(f"  fresh interpreter      {timed(fresh_interpreter)*1e3:>8.2f} ms")
+                print(f"  server request         {timed(lambda: client.translate(source, 'example.javapy'))*1e3:>8.2f} ms")
+                stats = client.stats()
+                print(f"  server p50 / p99       {stats['latency']['p50']:>8.2f} ms / {stats['latency']['p99']:.2f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+    print()
+
+@benchmark
+def startup():
+    """ A short run costs mostly the start-up and the type checks, which JAVAPY_VALIDATE=0 skips. """
+    import os
+    import os.path
+    import subprocess
+    import tempfile
+    here = os.path.dirname(os.path.abspath(__file__))
+    source = os.path.join(here, 'example.javapy')
+    with tempfile.TemporaryDirectory() as directory:
+        out = os.path.join(directory, 'example.java')
+        def run(*args, **env):
+            subprocess.run([sys.executable, *args], env=dict(os.environ, **env), check=True, stdout=subprocess.DEVNULL)
+        def import_time(**env):
+            # The cumulative time of importing javapy, as reported by -X importtime
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import javapy'], env=dict(os.environ, **env),
+                                    check=True, stderr=subprocess.PIPE, universal_newlines=True)
+            for line in result.stderr.splitlines():
+                fields = line[len('import time:'):].split('|')
+                if len(fields) == 3 and fields[2].strip() == 'javapy':
+                    return int(fields[1]) / 1e6
+        print("startup")
+        print(f"  javapy import only     {min(import_time(JAVAPY_VALIDATE='0') for _ in range(3))*1e3:>8.2f} ms")
+        print(f"  import javapy          {timed(run, '-c', 'import javapy')*1e3:>8.2f} ms")
+        print(f"  import, no validation  {timed(lambda: run('-c', 'import javapy', JAVAPY_VALIDATE='0'))*1e3:>8.2f} ms")
+        print(f"  example.javapy         {timed(run, os.path.join(here, 'javapy.py'), source, '--out', out)*1e3:>8.2f} ms")
+        print(f"  example, --no-validate {timed(run, os.path.join(here, 'javapy.py'), source, '--out', out, '--no-validate')*1e3:>8.2f} ms")
+    print()
+
+@benchmark
+def profile():
+    """ Counting for --profile wraps a few of the parser's hottest methods, and only while it is on. """
+    import os.path
+    from javapy.parser import parse_file
+    from javapy.profiling import Profile
+    path = os.path.join(os.path.dirname(__file__), 'example.javapy')
+    def parse():
+        with open(path, 'rb') as file:
+            return parse_file(file)
+    def parse_counted():
+        with Profile(path).counting():
+            return parse()
+    print("profile, parse example.javapy")
+    print(f"  not counting  {timed(parse)*1e3:>8.2f} ms")
+    print(f"  counting      {timed(parse_counted)*1e3:>8.2f} ms")
+    print()
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
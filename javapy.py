@@ -1,3 +1,4 @@
+import sys
 from javapy import main
 
-main()
\ No newline at end of file
+sys.exit(main())
\ No newline at end of file
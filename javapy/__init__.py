@@ -17,44 +17,993 @@ class UnitTests(unittest.TestCase):
         java_unit_str = str(java_unit)
         javapy_unit_str = str(javapy_unit)
         self.assertEqual(java_unit_str, javapy_unit_str, f"str(java_unit) != str(javapy_unit).")
-        
-        
+
+    def test_emitter(self):
+        import os.path
+        import io
+        from .tree import Emitter
+        with open(os.path.join(os.path.dirname(__file__), 'test.javapy'), 'rb') as file:
+            unit = parse_file(file, parser=Parser)
+        unit_str = str(unit)
+        for sink in (io.StringIO(), []):
+            out = Emitter(sink)
+            out.emit(unit)
+            self.assertEqual(out.getvalue(), unit_str)
+        out = Emitter()
+        out.write('{\n')
+        with out.indented():
+            out.write('a\n  \n')
+            out.write('  b')
+        out.write('\n}\n  ')
+        self.assertEqual(out.getvalue(), '{\n\ta\n  \n\t  b\n}\n  ')
+
+    def test_pretty_emitter(self):
+        import os.path
+        from .tree import pretty_str
+        with open(os.path.join(os.path.dirname(__file__), 'test.javapy'), 'rb') as file:
+            unit = parse_file(file, parser=Parser)
+        for width, brace_style in ((40, 'same-line'), (80, 'next-line')):
+            formatted = pretty_str(unit, width=width, brace_style=brace_style)
+            self.assertEqual(parse_str(formatted, parser=JavaParser), unit, f"width={width}, brace_style={brace_style!r}")
+        unit = parse_str('class A { int x = foo(aaaa, bbbb, cccc + dddd); }', parser=JavaParser)
+        self.assertEqual(pretty_str(unit), str(unit))
+        self.assertEqual(pretty_str(unit, width=30), 'class A {\n\tint x = foo(\n\t\t\taaaa,\n\t\t\tbbbb,\n\t\t\tcccc + dddd);\n}')
+        # The text after a group, up to the next place a line can be broken, must fit too
+        unit = parse_str('class A { void f(int aaaa, int bbbb) throws IOException, InterruptedException { g(); } }', parser=JavaParser)
+        width = 64
+        formatted = pretty_str(unit, width=width)
+        self.assertEqual([line for line in formatted.splitlines() if len(line.expandtabs(4)) > width], [], formatted)
+        self.assertEqual(parse_str(formatted, parser=JavaParser), unit)
+        # Type arguments break like other lists, but a single one stays within its brackets
+        unit = parse_str('class A { void f(Function<? super F, ? extends Either<? extends F2, ? extends S2>> mapper, List<User> users) {} }', parser=JavaParser)
+        width = 60
+        formatted = pretty_str(unit, width=width)
+        self.assertEqual([line for line in formatted.splitlines() if len(line.expandtabs(4)) > width], [], formatted)
+        self.assertIn('\tList<User> users)', formatted)
+        self.assertEqual(parse_str(formatted, parser=JavaParser), unit)
+        # Only lines holding a string literal, which cannot be broken, may be too long
+        with open(os.path.join(os.path.dirname(__file__), 'test.java'), 'rb') as file:
+            unit = parse_file(file, parser=JavaParser)
+        width = 80
+        formatted = pretty_str(unit, width=width)
+        self.assertEqual([line for line in formatted.splitlines() if len(line.expandtabs(4)) > width and '"' not in line], [])
+
+    def test_rendering_cache(self):
+        import os.path
+        import io
+        from .tree import Emitter, FunctionDeclaration, ReturnStatement, Name
+        def render_uncached(node):
+            out = Emitter(io.StringIO())
+            out.emit(node)
+            return out.getvalue()
+        with open(os.path.join(os.path.dirname(__file__), 'test.javapy'), 'rb') as file:
+            unit = parse_file(file, parser=Parser)
+        unit_str = str(unit)
+        self.assertEqual(str(unit), unit_str)
+        func = next(member for member in unit.types[0].members if isinstance(member, FunctionDeclaration) and member.body)
+        self.assertIs(func.body.parent, func)
+        func.body.stmts.append(ReturnStatement())
+        self.assertEqual(str(unit), render_uncached(unit))
+        self.assertNotEqual(str(unit), unit_str)
+        func.name = Name('renamed')
+        self.assertEqual(str(unit), render_uncached(unit))
+        func.body.stmts.pop()
+        func.body.stmts.reverse()
+        self.assertEqual(str(unit), render_uncached(unit))
+
+        # A copy does not keep text which depended on where the original was
+        unit = parse_str('class A { void f() { if (a) {} else if (b) {} } }', parser=JavaParser)
+        str(unit)
+        branch = unit.types[0].members[0].body.stmts[0].elsebody
+        copy = branch.copy()
+        self.assertEqual(str(copy), render_uncached(copy))
+        self.assertEqual(str(copy), 'if(b) {}')
+
+    def test_visitor(self):
+        from .tree import NodeVisitor, NodeModifier, BinaryExpression, MemberAccess, Name
+        expr = MemberAccess(name=Name('x0'))
+        for i in range(1, 3000):
+            expr = BinaryExpression(op='+', lhs=expr, rhs=MemberAccess(name=Name(f'x{i}')))
+
+        class Visitor(NodeVisitor):
+            def __init__(self):
+                self.events = []
+            def visit_name(self, node, value=None):
+                self.events.append(str(node))
+                return True
+            def leave_binary_expression(self, node, value=None):
+                self.events.append(node.op)
+        visitor = Visitor()
+        visitor(expr)
+        self.assertEqual(visitor.events[:4], ['x0', 'x1', '+', 'x2'])
+        self.assertEqual(len(visitor.events), 3000 + 2999)
+
+        class Renamer(NodeModifier):
+            def visit_name(self, node, value=None):
+                return False, Name(str(node).replace('x', 'y'))
+        self.assertIs(Renamer()(expr), expr)
+        self.assertTrue(str(expr).startswith('y0 + y1 + y2'))
+
+    def test_pipeline(self):
+        import os.path
+        from .tree import NodeModifier, ModifierPipeline, Name, Literal, Parenthesis
+        events = []
+        class Increment(NodeModifier):
+            def visit_literal(self, node, value=None):
+                events.append(('increment', str(node)))
+                return True, Literal(str(int(str(node)) + 1))
+            def leave_parenthesis(self, node, value=None):
+                events.append(('increment', 'leave'))
+                return node
+        class Unwrap(NodeModifier):
+            def visit_literal(self, node, value=None):
+                events.append(('unwrap', str(node)))
+                return True, node
+            def leave_parenthesis(self, node, value=None):
+                events.append(('unwrap', 'leave'))
+                return node.expr
+        result = ModifierPipeline([Increment(), Unwrap()])(Parenthesis(Literal('1')))
+        self.assertEqual(str(result), '2')
+        self.assertEqual(events, [('increment', '1'), ('unwrap', '2'), ('increment', 'leave'), ('unwrap', 'leave')])
+
+        class Rename(NodeModifier):
+            def visit_name(self, node, value=None):
+                return False, Name('renamed') if str(node) == 'args' else node
+        path = os.path.join(os.path.dirname(__file__), 'test.javapy')
+        with open(path, 'rb') as file:
+            unit1 = parse_file(file, parser=Parser)
+        with open(path, 'rb') as file:
+            unit2 = parse_file(file, parser=Parser)
+        modifiers = [Rename(), Unwrap()]
+        for modifier in modifiers:
+            unit1 = modifier(unit1)
+        unit2 = ModifierPipeline(modifiers)(unit2)
+        self.assertEqual(str(unit1), str(unit2))
+        self.assertIn('renamed', str(unit2))
+
+    def test_reachability(self):
+        import os.path
+        from .tree import NodeVisitor, Import, ClassDeclaration, FunctionCall, reachable_node_types, iter_child_nodes
+        with open(os.path.join(os.path.dirname(__file__), 'test.javapy'), 'rb') as file:
+            unit = parse_file(file, parser=Parser)
+        stack = [(unit, [])]
+        while stack:
+            node, ancestors = stack.pop()
+            for ancestor in ancestors:
+                self.assertIn(type(node), reachable_node_types(type(ancestor)))
+            stack.extend((child, ancestors + [node]) for child in iter_child_nodes(node))
+
+        self.assertNotIn(Import, reachable_node_types(ClassDeclaration))
+        self.assertIn(FunctionCall, reachable_node_types(ClassDeclaration))
+
+        class ImportVisitor(NodeVisitor):
+            def __init__(self):
+                self.imports = []
+            def visit_import(self, node, value=None):
+                self.imports.append(node)
+                return True
+        visitor = ImportVisitor()
+        visitor(unit)
+        self.assertEqual(visitor.imports, list(unit.imports))
+
+    def test_structural_hash(self):
+        from .tree import Name, Literal, GenericType
+        source = 'class A { int f(int x) { return x + 1; } void g() {} }'
+        unit1, unit2 = parse_str(source, parser=JavaParser), parse_str(source, parser=JavaParser)
+        self.assertEqual(hash(unit1), hash(unit2))
+        self.assertEqual(unit1, unit2)
+        self.assertEqual(len({*unit1.types[0].members, *unit2.types[0].members}), 2)
+        func = unit1.types[0].members[0]
+        func.body.stmts[0].value.rhs = Literal('2')
+        self.assertNotEqual(hash(unit1), hash(unit2))
+        self.assertNotEqual(unit1, unit2)
+        self.assertEqual(unit1.types[0].members[1], unit2.types[0].members[1])
+        func.body.stmts[0].value.rhs = Literal('1')
+        self.assertEqual(hash(unit1), hash(unit2))
+        func.name = Name('h')
+        self.assertNotEqual(unit1, unit2)
+        # Types compare equal to their source code, so they must hash like it
+        types = {func.return_type: 'return', func.params[0].type: 'param'}
+        self.assertEqual(func.return_type, 'int')
+        self.assertEqual(hash(func.return_type), hash('int'))
+        self.assertEqual(len(types), 1)
+        self.assertEqual(types['int'], 'param')
+        # The hash is remembered like any structural hash, and forgotten when the Type changes
+        generic = parse_str('class A { List<String> x; }', parser=JavaParser).types[0].members[0].type
+        self.assertEqual(hash(generic), hash('List<String>'))
+        self.assertEqual(generic._hash, hash('List<String>'))
+        generic.typeargs[0] = GenericType(Name('Integer'))
+        self.assertIsNone(generic._hash)
+        self.assertEqual(hash(generic), hash('List<Integer>'))
+
+    def test_diff(self):
+        import os
+        import tempfile
+        from .tree import diff, patch_text, patch_file, Name, ReturnStatement
+        source = 'class A {\n\tint x;\n\tvoid f() {}\n\tvoid g() {}\n\tclass B {\n\t\tvoid h() {}\n\t}\n}'
+        old, new = parse_str(source, parser=JavaParser), parse_str(source, parser=JavaParser)
+        self.assertEqual(diff(old, new), [])
+        members = new.types[0].members
+        members[1].body.stmts.append(ReturnStatement())
+        members[3].members[0].name = Name('i')
+        del members[0]
+        edits = diff(old, new)
+        self.assertEqual([edit.op for edit in edits], ['delete', 'replace', 'delete', 'insert'])
+        self.assertEqual(str(edits[0].old), 'int x;')
+        self.assertIs(edits[1].new, members[0])
+        self.assertIs(edits[3].new, members[2].members[0])
+        old_text = str(old)
+        new_text, regions = patch_text(old_text, old, new, edits)
+        self.assertEqual(new_text, str(new))
+        self.assertNotIn('void g() {}', ''.join(replacement for start, end, replacement in regions))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'A.java')
+            with open(path, 'w') as file:
+                file.write(old_text)
+            patch_file(path, old, new, edits)
+            with open(path) as file:
+                self.assertEqual(file.read(), str(new))
+
+            # A write which fails part of the way leaves the file as it was
+            newer = new.copy()
+            newer.types[0].members[0].body.stmts.clear()
+            replace = os.replace
+            def fail(src, dst):
+                raise OSError('disk full')
+            os.replace = fail
+            try:
+                with self.assertRaises(OSError):
+                    patch_file(path, new, newer)
+            finally:
+                os.replace = replace
+            with open(path) as file:
+                self.assertEqual(file.read(), str(new))
+            self.assertEqual(os.listdir(directory), ['A.java'])
+            patch_file(path, new, newer)
+            with open(path) as file:
+                self.assertEqual(file.read(), str(newer))
+
+        # The positions stay right when remembered text is reused
+        from .tree import _SpanEmitter
+        out = _SpanEmitter([new, new.types[0]], [new, new.types[0], members[1]])
+        out.emit(new)
+        text = out.getvalue()
+        self.assertEqual(out.tell(), len(text))
+        start, end = out.spans[id(members[1])]
+        self.assertEqual(text[start:end], '\tvoid g() {}')
+
+    def test_serialize(self):
+        import io
+        import sys
+        import pickle
+        from .serialize import dumps, loads, dump, load, _resolve_class
+        from .tree import iter_child_nodes, Name, MemberAccess, BinaryExpression
+        unit = parse_str('package a.b;\nclass A {\n\tlong x = 1L << 40;\n\tvoid f(int[] args) { g(x, "s", 1.5d); }\n}', parser=JavaParser)
+        copy = loads(dumps(unit))
+        self.assertEqual(copy, unit)
+        self.assertEqual(str(copy), str(unit))
+        self.assertIsNone(copy.parent)
+        stack = [copy]
+        while stack:
+            node = stack.pop()
+            for child in iter_child_nodes(node):
+                self.assertIs(child.parent, node)
+                stack.append(child)
+        copy.types[0].name = Name('B')
+        self.assertIn('class B', str(copy))
+        self.assertIn('class A', str(unit))
+        file = io.BytesIO()
+        dump(unit, file)
+        file.seek(0)
+        self.assertEqual(load(file), unit)
+        self.assertEqual(pickle.loads(pickle.dumps(unit)), unit)
+        expr = MemberAccess(name=Name('x0'))
+        for i in range(1, 2000):
+            expr = BinaryExpression(op='+', lhs=expr, rhs=MemberAccess(name=Name(f'x{i}')))
+        self.assertEqual(loads(dumps(expr)).structural_hash(), expr.structural_hash())
+        with self.assertRaises(ValueError):
+            loads(b'not a tree')
+        with self.assertRaises(ValueError):
+            loads(dumps(unit)[:-1])
+        # Classes are only looked up in javapy.tree, nothing named in the data is imported
+        imported = 'pickletools' in sys.modules
+        with self.assertRaises(ValueError):
+            loads(dumps(unit).replace(b'javapy.tree:', b'pickletools:'))
+        self.assertEqual('pickletools' in sys.modules, imported)
+        for name in ('javapy.tree:Emitter', 'javapy.tree:Missing', 'javapy.tree:CompilationUnit.emit'):
+            with self.assertRaises(ValueError):
+                _resolve_class(name)
+
+    def test_spans(self):
+        import io
+        import gc
+        from .tree import iter_child_nodes
+        source = 'class A {\n\tint x = 1 + (2 * 3);\n\tvoid f() {\n\t\tg("s");\n\t}\n}\n'
+        parser = JavaParser(tokenize(io.BytesIO(source.encode()).readline), 'A.java', spans=True)
+        unit = parser.parse_compilation_unit()
+        lines = source.splitlines(keepends=True)
+        def text(node):
+            start, end = parser.spans.span(node)
+            if start.line == end.line:
+                return lines[start.line][start.column:end.column]
+            return lines[start.line][start.column:] + ''.join(lines[start.line+1:end.line]) + lines[end.line][:end.column]
+        field, method = unit.types[0].members
+        self.assertEqual(text(field), 'int x = 1 + (2 * 3);')
+        self.assertEqual(text(field.declarators[0]), 'x = 1 + (2 * 3)')
+        self.assertEqual(text(field.declarators[0].init.rhs), '(2 * 3)')
+        self.assertEqual(text(method.body.stmts[0]), 'g("s");')
+        self.assertEqual(text(method), 'void f() {\n\t\tg("s");\n\t}')
+        start = parser.spans.start(method.body.stmts[0])
+        self.assertEqual((start.line, start.column, start.linestr), (3, 2, '\t\tg("s");\n'))
+        self.assertNotIn(unit.copy(), parser.spans)
+        with self.assertRaises(KeyError):
+            parser.spans.span(unit.copy())
+
+        # The Nodes of speculative branches which failed are not kept alive
+        gc.collect()
+        spanned = 0
+        stack = [unit]
+        while stack:
+            node = stack.pop()
+            spanned += node in parser.spans
+            stack.extend(iter_child_nodes(node))
+        self.assertEqual(len(parser.spans), spanned)
+        self.assertLess(len(parser.spans), len(parser.spans._nodes))
+
+        # Spans are only recorded when asked for
+        parser = JavaParser(tokenize(io.BytesIO(source.encode()).readline), 'A.java')
+        self.assertIsNone(parser.spans)
+        self.assertNotIn('parse_compilation_unit', vars(parser))
+        self.assertEqual(parser.parse_compilation_unit(), unit)
+
+    def test_span_index(self):
+        import io
+        from .parser import SpanIndex
+        from .tree import FunctionDeclaration, FunctionCall, Literal
+        def parse(source):
+            parser = JavaParser(tokenize(io.BytesIO(source.encode()).readline), spans=True)
+            return parser, parser.parse_compilation_unit()
+        source = 'class A {\n\tint x = 1;\n\tvoid f() {\n\t\tg(1);\n\t}\n\tint y = 2;\n}\n'
+        parser, unit = parse(source)
+        index = SpanIndex(unit, parser.spans)
+        f = unit.types[0].members[1]
+        self.assertIsInstance(index.node_at(3, 4), Literal)
+        self.assertIsInstance(index.node_at(3, 2).parent, FunctionCall)
+        self.assertIs(index.member_at(3, 2), f)
+        self.assertIs(index.member_at(1, 1), unit.types[0].members[0])
+        self.assertIsNone(index.node_at(7, 0))
+        self.assertEqual(index.nodes_in((3, 0), (4, 0)), [f.body.stmts[0], f.body.stmts[0].expr, f.body.stmts[0].expr.name, f.body.stmts[0].expr.args[0]])
+        new_parser, new_unit = parse('class Z {\n\tvoid f() {\n\t\tg(1);\n\n\t\tg(2);\n\t}\n}\n')
+        g = new_unit.types[0].members[0]
+        unit.types[0].members[1] = g
+        index.replace(f, g, new_parser.spans, line=1)
+        source = source.replace('\t\tg(1);\n', '\t\tg(1);\n\n\t\tg(2);\n')
+        parser, unit = parse(source)
+        expected = SpanIndex(unit, parser.spans)
+        self.assertIs(index.member_at(4, 3), g)
+        everything = ((0, 0), (len(source.splitlines()), 0))
+        self.assertEqual([index.span(node) for node in index.nodes_in(*everything)],
+                         [expected.span(node) for node in expected.nodes_in(*everything)])
+        self.assertEqual([type(index.node_at(4, column)) for column in range(8)],
+                         [type(expected.node_at(4, column)) for column in range(8)])
+        self.assertEqual(index.span(g), expected.span(unit.types[0].members[1]))
+        self.assertEqual(index.span(index.member_at(7, 1)), expected.span(unit.types[0].members[2]))
+        with self.assertRaises(KeyError):
+            index.span(f)
+
+    def test_weak_parents(self):
+        import gc
+        import pickle
+        import weakref
+        unit = parse_str('class A {\n\tvoid f() { g(1); }\n}', parser=JavaParser)
+        method = unit.types[0].members[0]
+        self.assertIs(method.parent, unit.types[0])
+        self.assertIs(unit.types[0].members.parent, unit.types[0])
+        copy = pickle.loads(pickle.dumps(unit))
+        self.assertEqual(copy, unit)
+        self.assertIs(copy.types[0].members[0].parent, copy.types[0])
+        self.assertIs(copy.types[0].members.parent, copy.types[0])
+        refs = [weakref.ref(unit), weakref.ref(method), weakref.ref(method.body.stmts[0])]
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            del unit, method, copy
+            self.assertEqual([ref() for ref in refs], [None, None, None])
+        finally:
+            if enabled:
+                gc.enable()
+        unit = parse_str('class A {\n\tvoid f() { g(1); }\n}', parser=JavaParser)
+        method = unit.types[0].members[0]
+        del unit
+        self.assertIsNone(method.parent)
+
+    def test_query(self):
+        from .tree import NodeIndex, Selector, FunctionCall, Member
+        unit = parse_str('class A {\n\tString s;\n\tint x;\n\tint f() {\n\t\tof(1);\n\t\tg(of(2));\n\t\treturn x;\n\t}\n\tclass B {\n\t\tvoid of() { return; }\n\t}\n}', parser=JavaParser)
+        index = NodeIndex(unit)
+        f = unit.types[0].members[2]
+        calls = index.of_type(FunctionCall)
+        self.assertEqual([str(call) for call in calls], ['of(1)', 'g(of(2))', 'of(2)'])
+        self.assertEqual(index.with_attribute(FunctionCall, 'name', 'of'), [calls[0], calls[2]])
+        self.assertEqual(index.select('FunctionCall[name=of]'), [calls[0], calls[2]])
+        self.assertEqual(index.select('FunctionCall > FunctionCall'), [calls[2]])
+        self.assertEqual(index.select('FunctionDeclaration[name=f] ReturnStatement'), [f.body.stmts[2]])
+        self.assertEqual(len(index.select('FunctionDeclaration > Block > ReturnStatement')), 2)
+        self.assertEqual([str(field) for field in index.select('FieldDeclaration[type=int]')], ['int x;'])
+        self.assertEqual(len(index.of_type(Member)), 6)
+        self.assertEqual(index.select("ClassDeclaration *[name='of']"), [calls[0], calls[2], unit.types[0].members[3].members[0]])
+        self.assertTrue(Selector('Block > ReturnStatement[value]').matches(f.body.stmts[2]))
+        self.assertFalse(Selector('ClassDeclaration[name=B] ReturnStatement').matches(f.body.stmts[2]))
+        self.assertIs(Selector.compile('Block'), Selector.compile('Block'))
+        for selector in ('', '> Block', 'Block >', 'Nonexistent', 'Block[name'):
+            with self.assertRaises(ValueError):
+                Selector(selector)
+
+    def test_columnar(self):
+        from .serialize import dumps
+        from .columnar import ColumnarTree
+        from .tree import FunctionCall, Expression
+        unit = parse_str('class A {\n\tvoid f() {\n\t\tg(1);\n\t\th(g(2));\n\t}\n}', parser=JavaParser)
+        columns = ColumnarTree.loads(dumps(unit))
+        counts = columns.count_kinds()
+        self.assertEqual((counts['FunctionCall'], counts['Literal'], counts['ClassDeclaration']), (3, 2, 1))
+        self.assertEqual(sum(counts.values()), len(columns))
+        calls = columns.calls_to('g')
+        self.assertEqual([str(columns.node(i)) for i in calls], ['g(1)', 'g(2)'])
+        self.assertEqual(columns.kinds[columns.kind[columns.parent[calls[1]]]], FunctionCall)
+        self.assertEqual(columns.strings[columns.field[calls[1]]], 'args')
+        self.assertEqual(columns.calls_to('nonexistent'), [])
+        self.assertEqual(columns.of_kind(FunctionCall), sorted(calls + columns.calls_to('h')))
+        self.assertEqual(len(columns.of_kind(Expression)), counts['FunctionCall'] + counts['Literal'])
+        self.assertEqual(sum(columns.depth_histogram()), len(columns))
+        self.assertEqual(columns.depth_histogram()[:2], [1, 1])
+        children = []
+        child = columns.first_child[0]
+        while child >= 0:
+            children.append(columns.kinds[columns.kind[child]].__name__)
+            child = columns.next_sibling[child]
+        self.assertEqual(children, ['ClassDeclaration'])
+        self.assertEqual(columns.tree(), unit)
+        self.assertIs(columns.node(calls[0]), columns.node(calls[0]))
+
+    def test_columnar_numpy(self):
+        import os.path
+        import javapy.columnar as columnar
+        from .tree import FunctionCall, Expression, Statement, MemberAccess
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        with open(os.path.join(os.path.dirname(__file__), 'test.java'), 'rb') as file:
+            columns = columnar.ColumnarTree.from_tree(parse_file(file, parser=JavaParser))
+        def queries():
+            return [columns.count_kinds(), columns.of_kind(FunctionCall), columns.of_kind(Expression),
+                    columns.of_kind(Statement), columns.of_kind('ExpressionStatement'), columns.calls_to('println'),
+                    columns.calls_to('nonexistent'), columns.with_field(MemberAccess, 'name', 'out'), columns.depth_histogram()]
+        self.assertIs(columnar.numpy, numpy)
+        with_numpy = queries()
+        try:
+            columnar.numpy = None
+            without_numpy = queries()
+        finally:
+            columnar.numpy = numpy
+        self.assertEqual(with_numpy, without_numpy)
+        self.assertTrue(all(with_numpy[i] for i in (3, 4, 5, 7)))
+
+    def test_snapshot(self):
+        from .tree import Name, ReturnStatement
+        unit = parse_str('class A {\n\tint x;\n\tvoid f() { g(); h(); }\n}', parser=JavaParser)
+        text = str(unit)
+        copy = unit.copy()
+        self.assertEqual(copy, unit)
+        self.assertIs(copy.types[0].parent, copy)
+        copy.types[0].name = Name('B')
+        self.assertEqual(str(unit), text)
+        method = unit.types[0].members[1]
+        stmts = method.body.stmts
+        original = unit.copy()
+        with unit.snapshot() as snapshot:
+            removed = stmts.pop(0)
+            removed.expr.name = Name('k')
+            stmts.append(removed)
+            stmts.insert(0, ReturnStatement())
+            method.name = Name('i')
+            with unit.snapshot() as inner:
+                del unit.types[0].members[0]
+                inner.restore()
+                self.assertIn('int x;', str(unit))
+            self.assertNotEqual(str(unit), text)
+            snapshot.restore()
+            self.assertEqual(str(unit), text)
+            self.assertIs(stmts[0], removed)
+            self.assertIs(removed.parent, method.body)
+            self.assertEqual(unit, original)
+        self.assertFalse(snapshot.active)
+        with self.assertRaises(ValueError):
+            snapshot.restore()
+
+        # Changes to other trees are not looked at, and a Snapshot which is dropped is released
+        import gc
+        import weakref
+        from .tree import _snapshots
+        snapshot = unit.snapshot()
+        copy.types[0].name = Name('C')
+        self.assertEqual(snapshot._saved, {})
+        unit.types[0].name = Name('D')
+        self.assertIn(id(unit.types[0]), snapshot._saved)
+        root = weakref.ref(unit)
+        del snapshot, inner, unit, original, method, stmts, removed
+        gc.collect()
+        self.assertIsNone(root())
+        self.assertEqual(_snapshots, {})
+
+    def test_build(self):
+        import tempfile
+        import contextlib
+        import io
+        from pathlib import Path
+        from .build import build, discover, Options
+        with tempfile.TemporaryDirectory() as directory:
+            src = Path(directory, 'src')
+            (src / 'pkg' / 'util').mkdir(parents=True)
+            (src / 'Main.javapy').write_text('class Main:\n    void f():\n        println("hi")\n')
+            (src / 'pkg' / 'util' / 'Util.javapy').write_text('class Util:\n    int x\n')
+            (src / 'pkg' / 'Broken.javapy').write_text('class Broken:\n    void f(:\n')
+            (src / 'pkg' / 'notes.txt').write_text('not javapy')
+            self.assertEqual(discover(src)[0], src / 'Main.javapy')
+
+            out = Path(directory, 'out')
+            result = build(src, out, jobs=2, max_files=1)
+            self.assertEqual(set(result.converted), {src / 'Main.javapy', src / 'pkg' / 'util' / 'Util.javapy'})
+            self.assertEqual(list(result.failed), [src / 'pkg' / 'Broken.javapy'])
+            self.assertEqual(result.workers, 3)
+            self.assertEqual(sorted(path.relative_to(out).as_posix() for path in out.rglob('*.java')), ['Main.java', 'pkg/util/Util.java'])
+            self.assertEqual((out / 'Main.java').read_text(), 'class Main {\n\tvoid f() {\n\t\tprintln("hi");\n\t}\n}')
+
+            mtime = (out / 'Main.java').stat().st_mtime_ns
+            result = build(src, out, jobs=1, force=True)
+            self.assertEqual((len(result.unchanged), result.written), (2, []))
+            self.assertEqual((out / 'Main.java').stat().st_mtime_ns, mtime)
+
+            (src / 'pkg' / 'Broken.javapy').unlink()
+            result = build(src, out, jobs=1)
+            self.assertEqual((result.converted, len(result.skipped)), ([], 2))
+            result = build(src, out, Options(width=80), jobs=1)
+            self.assertEqual((len(result.converted), result.skipped), (2, []))
+            (src / 'pkg' / 'util' / 'Util.javapy').unlink()
+            result = build(src, out, Options(width=80), jobs=1)
+            self.assertEqual(result.removed, [out / 'pkg' / 'util' / 'Util.java'])
+            self.assertFalse((out / 'pkg').exists())
+
+            (src / 'pkg' / 'Broken.javapy').write_text('class Broken:\n    void f(:\n')
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as errors:
+                self.assertEqual(main(['build', str(src), '--out', str(Path(directory, 'out1')), '-j', '1']), 1)
+            self.assertIn('Broken.javapy', errors.getvalue())
+
+            target = Path(directory, 'Main.java')
+            for expected in ('Converted', 'Unchanged'):
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    main([str(src / 'Main.javapy'), '--out', str(target), '--write-if-changed'])
+                self.assertTrue(output.getvalue().startswith(expected))
+
+    def test_cache(self):
+        import os
+        import io
+        import tempfile
+        from pathlib import Path
+        from .cache import Cache, tool_hash, _digest
+        from .build import build
+        with tempfile.TemporaryDirectory() as directory:
+            cache = Cache(Path(directory, 'cache'), max_size=100)
+            keys = [Cache.key('entry', str(i)) for i in range(4)]
+            for i, key in enumerate(keys[:3]):
+                cache.put(key, bytes(30))
+                os.utime(str(cache._path(key)), ns=(i * 10**9, i * 10**9))
+            self.assertEqual(cache.get(keys[0]), bytes(30))
+            cache.put(keys[3], bytes(30))
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertEqual([cache.get(key) is not None for key in keys], [True, False, True, True])
+            self.assertEqual(cache.take_stats(), (4, 2, 1))
+            self.assertEqual(cache.size(), 90)
+            # Overwriting an entry only counts the difference in size
+            for i in range(5):
+                cache.put(keys[0], bytes(30 + i))
+            self.assertEqual((cache._size, cache.size(), cache.take_stats()[2]), (94, 94, 0))
+
+            cache = Cache(Path(directory, 'cache'))
+            source = b'class A:\n    int f():\n        return 1\n'
+            unit = parse_file(io.BytesIO(source), cache=cache)
+            self.assertEqual(parse_file(io.BytesIO(source), cache=cache), unit)
+            self.assertEqual(cache.take_stats(), (1, 1, 0))
+            # A corrupt entry is parsed again and replaced
+            entry = cache._path(Cache.key('tree', f"{Parser.__module__}.{Parser.__qualname__}", tool_hash(), _digest(source)))
+            for garbage in (b'JPYT garbage', entry.read_bytes()[:-10]):
+                entry.write_bytes(garbage)
+                self.assertEqual(parse_file(io.BytesIO(source), cache=cache), unit)
+                self.assertEqual(cache.take_stats(), (0, 1, 0))
+                self.assertEqual(parse_file(io.BytesIO(source), cache=cache), unit)
+                self.assertEqual(cache.take_stats(), (1, 0, 0))
+
+            src = Path(directory, 'src')
+            src.mkdir()
+            (src / 'A.javapy').write_bytes(source)
+            results = [build(src, Path(directory, checkout), jobs=jobs, cache=cache) for checkout, jobs in (('one', 1), ('two', 2))]
+            self.assertEqual([(result.cache_hits, result.cache_misses) for result in results], [(0, 1), (1, 0)])
+            self.assertEqual(Path(directory, 'two', 'A.java').read_text(), str(unit))
+
+    def test_parse_cache(self):
+        from .parser import ParseCache
+        from .tree import Name
+        cache = ParseCache(max_entries=2)
+        source = 'class A:\n    int f():\n        return 1\n'
+        unit = parse_str(source, cache=cache)
+        again = parse_str(source, cache=cache)
+        self.assertEqual(again, unit)
+        self.assertIsNot(again, unit)
+        again.types[0].name = Name('B')
+        self.assertEqual(str(parse_str(source, cache=cache)), str(unit))
+        java_source = 'class A { int f() { return 1; } }'
+        self.assertEqual(parse_str(java_source, parser=JavaParser, cache=cache), unit)
+        with self.assertRaises(JavaSyntaxError):
+            parse_str(java_source, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        self.assertEqual((len(cache), cache.evictions), (2, 0))
+        parse_str('class C:\n    int x\n', cache=cache)
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+        parse_str(source, cache=cache)
+        self.assertEqual(cache.misses, 5)
+        self.assertEqual(cache.hit_rate, 2/7)
+
+        shared = ParseCache(copy=False)
+        unit = parse_str(source, cache=shared)
+        self.assertIs(parse_str(source, cache=shared), unit)
+        # A shared tree cannot be changed, neither directly nor by taking its Nodes, but copies can
+        function = unit.types[0].members[0]
+        with self.assertRaises(TypeError):
+            function.name = Name('g')
+        with self.assertRaises(TypeError):
+            function.body.stmts.clear()
+        with self.assertRaises(TypeError):
+            parse_str(source).types[0].members.append(function)
+        self.assertEqual(parse_str(source, cache=shared), parse_str(source))
+        copy = unit.copy()
+        copy.types[0].members[0].name = Name('g')
+        self.assertIn('g()', str(copy))
+
+    def test_reparse(self):
+        from .parser import reparse
+        import io
+        source = 'class A:\n    int f():\n        return 1\n    int g():\n        return 2\n    int h():\n        return 3\n'
+        parser = Parser(tokenize(io.BytesIO(source.encode('utf-8')).readline), '<string>', spans=True)
+        unit = parser.parse_compilation_unit()
+        f, g, h = unit.types[0].members
+        edited = source.replace('return 2', 'int y = 4\n        return y')
+        new_unit, new_parser = reparse(unit, parser, io.BytesIO(edited.encode('utf-8')))
+        self.assertIs(new_unit, unit)
+        self.assertEqual(new_unit, parse_str(edited))
+        self.assertEqual(str(new_unit), str(parse_str(edited)))
+        members = unit.types[0].members
+        self.assertIs(members[0], f)
+        self.assertIsNot(members[1], g)
+        self.assertIs(members[2], h)
+        fresh = Parser(tokenize(io.BytesIO(edited.encode('utf-8')).readline), '<string>', spans=True)
+        fresh_unit = fresh.parse_compilation_unit()
+        self.assertEqual(new_parser.spans.span(h), fresh.spans.span(fresh_unit.types[0].members[2]))
+        self.assertIs(members[2].parent, unit.types[0])
+
+        # A change outside of the type body parses the whole file again
+        imported = 'import java.util.List\n' + edited
+        newer_unit, newer_parser = reparse(unit, new_parser, io.BytesIO(imported.encode('utf-8')))
+        self.assertIsNot(newer_unit, unit)
+        self.assertEqual(newer_unit, parse_str(imported))
+
+    def test_watch(self):
+        import tempfile
+        import os
+        from pathlib import Path
+        from .build import build, translate, Options
+        from .watch import Watcher
+        with tempfile.TemporaryDirectory() as directory:
+            src = Path(directory, 'src')
+            out = Path(directory, 'out')
+            (src / 'pkg').mkdir(parents=True)
+            main_source = src / 'Main.javapy'
+            main_source.write_text('class Main:\n    void f():\n        println("hi")\n    void g():\n        return\n')
+            (src / 'pkg' / 'Util.javapy').write_text('class Util:\n    int x\n')
+            watcher = Watcher(src, out, debounce=0)
+            self.assertEqual(len(watcher.start().converted), 2)
+            self.assertEqual(watcher.poll(), [])
+
+            def touch(path, text):
+                # Makes sure the stat changes even on file systems with coarse timestamps
+                stat = path.stat() if path.exists() else None
+                path.write_text(text)
+                if stat is not None:
+                    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+            touch(main_source, 'class Main:\n    void f():\n        println("bye")\n    void g():\n        return\n')
+            changes = watcher.poll()
+            self.assertEqual([(change.source, change.action, change.reparsed) for change in changes], [(main_source, 'written', False)])
+            unit = watcher._trees[main_source][0]
+            g = unit.types[0].members[1]
+            touch(main_source, 'class Main:\n    void f():\n        println("hello")\n    void g():\n        return\n')
+            changes = watcher.poll()
+            self.assertEqual([(change.action, change.reparsed) for change in changes], [('written', True)])
+            self.assertIs(watcher._trees[main_source][0].types[0].members[1], g)
+            self.assertEqual((out / 'Main.java').read_text(), translate(main_source, Options()))
+
+            touch(main_source, 'class Main:\n    void f(:\n')
+            self.assertEqual([change.action for change in watcher.poll()], ['failed'])
+            self.assertEqual(watcher.poll(), [])
+            (src / 'pkg' / 'Util.javapy').unlink()
+            (src / 'pkg' / 'New.javapy').write_text('class New:\n    int y\n')
+            changes = watcher.poll()
+            self.assertEqual([(change.source.name, change.action) for change in changes], [('New.javapy', 'written'), ('Util.javapy', 'removed')])
+            self.assertFalse((out / 'pkg' / 'Util.java').exists())
+
+            result = build(src, out, jobs=1)
+            self.assertEqual((len(result.skipped), result.removed), (1, []))
+
+            # A file is not translated until its stat stays the same for debounce seconds
+            watcher.debounce = 60
+            touch(src / 'pkg' / 'New.javapy', 'class New:\n    int z\n')
+            self.assertEqual(watcher.poll(), [])
+
+    def test_serve(self):
+        import asyncio
+        import tempfile
+        import contextlib
+        import os
+        from .serve import Server, Client, Histogram
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.050, delta=0.050 * (Histogram.BASE - 1))
+        self.assertEqual(histogram.percentile(100), 0.1)
+
+        source = 'class A:\n    int f():\n        return 1\n'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'javapy.sock')
+            server = Server(path, jobs=1, max_pending=2)
+
+            def client():
+                with contextlib.ExitStack() as stack:
+                    # Connections which send nothing must not take the slots of the others
+                    for _ in range(server.max_pending + 1):
+                        stack.enter_context(Client(path, timeout=60))
+                    client = stack.enter_context(Client(path, timeout=60))
+                    results = [client.translate(source, 'A.javapy'), client.translate('class B:\n    void f() int\n', 'B.javapy')]
+                    # More requests than max_pending, sent without waiting for the responses
+                    ids = [client.send({'op': 'translate', 'source': source}) for _ in range(5)]
+                    results.append(sorted(client.receive()['id'] for _ in ids) == sorted(ids))
+                    results.append(client.request({'op': 'restart'}))
+                    results.append(client.translate(source))
+                    results.append(client.request({'op': 'unknown'}))
+                    results.append(client.stats())
+                    return results
+
+            async def run():
+                await server.start()
+                try:
+                    return await asyncio.get_event_loop().run_in_executor(None, client)
+                finally:
+                    await server.close()
+
+            loop = asyncio.new_event_loop()
+            try:
+                translated, failed, all_answered, restarted, after_restart, unknown, stats = loop.run_until_complete(run())
+            finally:
+                loop.close()
+            self.assertEqual(translated, {'id': 0, 'ok': True, 'java': str(parse_str(source))})
+            self.assertEqual((failed['ok'], failed['line']), (False, 2))
+            self.assertTrue(all_answered)
+            self.assertTrue(restarted['ok'])
+            self.assertEqual(after_restart['java'], translated['java'])
+            self.assertFalse(unknown['ok'])
+            self.assertEqual((stats['requests'], stats['errors'], stats['restarts']), (10, 2, 1))
+            self.assertEqual(stats['latency']['count'], 8)
+            self.assertEqual(stats['connections'], server.max_pending + 2)
+            self.assertLessEqual(stats['latency']['p50'], stats['latency']['p99'])
+            self.assertFalse(os.path.exists(path))
+
+    def test_fast_start(self):
+        import os
+        import sys
+        import types
+        import subprocess
+        import javapy._tokenize_tables as snapshot
+        from .util import set_validation, validation_enabled, check_type
+        tables = {name: value for name, value in vars(snapshot).items() if not name.startswith('_')}
+        self.assertEqual(sys.modules['javapy.tokenize']._build_tables(), tables, 'javapy/_tokenize_tables.py is out of date, run javapy.tokenize._write_tables()')
+
+        enabled = validation_enabled()
+        try:
+            set_validation(True)
+            with self.assertRaises(TypeError):
+                check_type('value', 'x', int)
+            # A typeguard without the version 2 API is reported, rather than checking nothing
+            typeguard = sys.modules.get('typeguard')
+            sys.modules['typeguard'] = types.ModuleType('typeguard')
+            try:
+                with self.assertRaises(ImportError):
+                    check_type('value', 'x', int)
+            finally:
+                sys.modules['typeguard'] = typeguard
+            set_validation(False)
+            check_type('value', 'x', int)
+        finally:
+            set_validation(enabled)
+
+        # Importing javapy without validation must not import typeguard. How long it takes is in bench.py startup.
+        code = 'import sys, javapy; print(" ".join(sys.modules))'
+        result = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, JAVAPY_VALIDATE='0'),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertFalse({'typeguard', 'inspect'} & set(result.stdout.split()))
+
+    def test_profile(self):
+        import io
+        import sys
+        import json
+        import tempfile
+        import contextlib
+        from pathlib import Path
+        from .tree import Node
+        from .profiling import Profile
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory, 'Main.javapy')
+            source.write_text('class Main:\n    void f():\n        println("hi")\n')
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as errors:
+                main([str(source), '--profile', 'json'])
+            profile = json.loads(errors.getvalue())
+            self.assertEqual(list(profile['phases']), ['read', 'tokenize', 'parse', 'render', 'write'])
+            self.assertEqual(list(profile['counters']), list(Profile.COUNTERS))
+            counters = profile['counters']
+            self.assertEqual(counters['tokens'], len(list(tokenize(io.BytesIO(source.read_bytes()).readline))))
+            self.assertGreater(counters['nodes'], 0)
+            self.assertGreaterEqual(counters['markers_pushed'], counters['markers_reset'])
+            self.assertGreater(counters['failed_branches'], 0)
+            self.assertGreaterEqual(counters['exceptions'], counters['failed_branches'])
+            self.assertEqual(Path(directory, 'Main.java').read_text(), 'class Main {\n\tvoid f() {\n\t\tprintln("hi");\n\t}\n}')
+            # Without --profile the output is emitted straight into the file
+            streamed = Path(directory, 'Streamed.java')
+            with contextlib.redirect_stdout(io.StringIO()):
+                main([str(source), '--out', str(streamed)])
+            self.assertEqual(streamed.read_text(), Path(directory, 'Main.java').read_text())
+            # Java sources are parsed as Java however the argument was built, and both ways of writing use UTF-8
+            java = Path(directory, 'Greeting.txt')
+            java.write_text('class Greeting { String s = "h\u00e9"; }', encoding='utf-8')
+            java_type = ''.join(['Ja', 'va'])
+            with contextlib.redirect_stdout(io.StringIO()):
+                main([str(java), '--type', java_type, '--out', str(streamed)])
+                main([str(java), '--type', java_type, '--out', str(Path(directory, 'Greeting.java')), '--write-if-changed'])
+            self.assertEqual(streamed.read_bytes(), 'class Greeting {\n\tString s = "h\u00e9";\n}'.encode('utf-8'))
+            self.assertEqual(Path(directory, 'Greeting.java').read_bytes(), streamed.read_bytes())
+
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as errors:
+                sys.modules['javapy.tokenize'].main([str(source), '--profile'])
+            table = errors.getvalue()
+            self.assertIn('tokenize', table)
+            self.assertNotIn('nodes', table)
+
+        # The counted methods are put back afterwards
+        init = Node.__init__
+        with Profile('<string>').counting():
+            self.assertIsNot(Node.__init__, init)
+            parse_str('class A:\n    int x\n')
+        self.assertIs(Node.__init__, init)
 
 def main(args=None):
+    import io
+    import sys
     import argparse
+    import contextlib
     from pathlib import Path
+    from .tree import Emitter, PrettyEmitter
+    from .profiling import Profile
+
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == 'build':
+        from .build import main as build_main
+        return build_main(args[1:])
+    if args and args[0] == 'watch':
+        from .watch import main as watch_main
+        return watch_main(args[1:])
+    if args and args[0] == 'serve':
+        from .serve import main as serve_main
+        return serve_main(args[1:])
 
-    parser = argparse.ArgumentParser(description='Parse a javapy file')
+    parser = argparse.ArgumentParser(description='Parse a javapy file', epilog='Use "build <src-dir> --out <dir>" to translate a whole directory, "watch <src-dir> --out <dir>" to translate its files whenever they change, or "serve --socket <path>" to run a translation server.')
     parser.add_argument('file', type=argparse.FileType('rb'),
                         help='The javapy file to parse')
     parser.add_argument('--type', choices=('Java', 'JavaPy'),
                         help='What syntax to use')
     parser.add_argument('--out', metavar='FILE', type=Path,
                         help='Where to save the output. Special name "STDOUT" can be used to output to the console.')
+    parser.add_argument('--width', type=int,
+                        help='Format the output to fit within this many columns')
+    parser.add_argument('--brace-style', choices=PrettyEmitter.BRACE_STYLES,
+                        help='Where to put opening braces. Implies formatting the output.')
+    parser.add_argument('--write-if-changed', action='store_true',
+                        help='Leave the output file untouched if it already contains the output, and otherwise replace it atomically')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='Skip the type checks of the parser and the tree, which makes short runs much faster. Setting JAVAPY_VALIDATE=0 does the same for every command.')
+    parser.add_argument('--profile', nargs='?', const='table', choices=('table', 'json'),
+                        help='Print the wall and CPU time of reading, tokenizing, parsing, rendering and writing the file, and counts of what the parser did, to stderr as a table or as JSON')
 
     args = parser.parse_args(args)
 
-    with args.file as file:
-        unit = parse_file(file, parser=JavaParser if args.type is 'Java' else Parser)
+    if args.no_validate:
+        from .util import set_validation
+        set_validation(False)
 
-    if hasattr(args, 'out'):
-        if str(args.out) == 'STDOUT':
-            filename = args.file.name
-            print(unit)
-        else:
-            with args.out.open('w') as file:
-                file.write(str(unit))
-                filename = file.name
+    def Output(file):
+        if args.width is None and args.brace_style is None:
+            return Emitter(file)
+        return PrettyEmitter(file, width=args.width or 100, brace_style=args.brace_style or 'same-line')
 
+    parser_class = JavaParser if args.type == 'Java' else Parser
+    to_stdout = args.out is not None and str(args.out) == 'STDOUT'
+    if to_stdout:
+        filename = args.file.name
+    elif args.out is not None:
+        filename = str(args.out)
     else:
         import os.path
+        filename = os.path.splitext(args.file.name)[0] + '.java'
+
+    if not args.profile and (to_stdout or not args.write_if_changed):
+        # Emitted straight into the output, without holding all of it in memory
+        with args.file as file:
+            unit = parse_file(file, parser=parser_class)
+        if to_stdout:
+            out = Output(sys.stdout)
+            out.emit(unit)
+            out.flush()
+            print()
+        else:
+            with open(filename, 'w', encoding='utf-8') as file:
+                out = Output(file)
+                out.emit(unit)
+                out.flush()
+        print("Converted", filename)
+        return
 
-        filename = os.path.join(os.path.dirname(args.file.name), os.path.splitext(args.file.name)[0] + '.java')
+    # --profile times each phase on its own and --write-if-changed compares the whole output,
+    # so the tokens and the output are collected first
+    profile = Profile(args.file.name)
+    with contextlib.ExitStack() as stack:
+        if args.profile:
+            stack.enter_context(profile.counting())
+        with profile.phase('read'), args.file as file:
+            data = file.read()
+        with profile.phase('tokenize'):
+            tokens = list(tokenize(io.BytesIO(data).readline))
+        profile.counters['tokens'] = len(tokens)
+        with profile.phase('parse'):
+            unit = parser_class(tokens, args.file.name).parse_compilation_unit()
+        with profile.phase('render'):
+            out = Output(None)
+            out.emit(unit)
+            out.flush()
+            output = out.getvalue()
 
-        with open(filename, 'w') as file:
-            file.write(str(unit))
+    with profile.phase('write'):
+        if to_stdout:
+            sys.stdout.write(output)
+            print()
+            written = True
+        elif args.write_if_changed:
+            from .build import write_if_changed
+            written = write_if_changed(Path(filename), output.encode('utf-8'))
+        else:
+            with open(filename, 'w', encoding='utf-8') as file:
+                file.write(output)
+            written = True
 
-    print("Converted", filename)
+    if args.profile:
+        profile.report(args.profile)
+    print("Converted" if written else "Unchanged", filename)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
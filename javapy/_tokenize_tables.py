@@ -0,0 +1,156 @@
+"""
+The patterns and string prefix tables of javapy.tokenize.
+Generated by javapy.tokenize._write_tables(), do not edit.
+"""
+Binnumber = '0[bB][01]+(?:_+[01]+)*([lL])?'
+Bracket = '[][(){}]'
+ClassCreatorNewline = '\\s*\\{(//[^\\r\\n]*|(?:/\\*(?:[^*]|\\*(?!/))*\\*/\\s*)+(?:/\\*(?:[^*]|\\*(?!/))*|//[^\\r\\n]*)?)?\\r?\\n'
+Comment = '(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)'
+ContStr = '((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))'
+Decnumber = '(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?'
+Double = '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"'
+Double3 = '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""'
+Expfloat = '[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*'
+Exponent = '[eE][-+]?[0-9]+(?:_+[0-9]+)*'
+ExponentSuffix = '[-+]?[0-9]+(?:_+[0-9]+)*'
+FDouble = '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")'
+FDouble3 = '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")'
+FSingle = "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')"
+FSingle3 = "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')"
+FStringDouble3Cont = '\\}[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")'
+FStringDouble3PseudoToken = '[ \\f\\t]*((\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))|((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|\\}[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))|(?:\\w|\\$)+)'
+FStringDoubleCont = '\\}[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|"|\\\\\\r?\\n)'
+FStringDoublePseudoToken = '[ \\f\\t]*((\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))|((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|\\}[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|"|\\\\\\r?\\n)|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))|(?:\\w|\\$)+)'
+FStringPrefix = '(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)'
+FStringSingle3Cont = "\\}[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')"
+FStringSingle3PseudoToken = '[ \\f\\t]*((\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))|((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|\\}[^\'\\\\%]*(?:(?:\\\\.|\'(?!\'\')|%(?:%|n(?![\\w$])))[^\'\\\\]*)*(?:%\\{?|\'\'\')|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))|(?:\\w|\\$)+)'
+FStringSingleCont = "\\}[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|'|\\\\\\r?\\n)"
+FStringSinglePseudoToken = '[ \\f\\t]*((\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))|((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|\\}[^\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\'\\\\]*)*(?:%\\{?|\'|\\\\\\r?\\n)|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))|(?:\\w|\\$)+)'
+FloatSuffix = '[fFdD]'
+Floatnumber = '(0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?'
+Funny = '((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){}]|(\\r?\\n|\\.\\.\\.|[:;.,@]))'
+FunnyNoBracket = '((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){]|(\\r?\\n|\\.\\.\\.|[:;.,@]))'
+HexExponent = '[pP][-+]?[0-9]+(?:_+[0-9]+)*'
+Hexfloat = '0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*'
+Hexnumber = '0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?'
+Ignore = '[ \\f\\t]*(\\\\\\r?\\n[ \\f\\t]*)*((//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*))?'
+IntSuffix = '[lL]'
+Intnumber = '(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?)'
+LambdaNewline = '\\s*(//[^\\r\\n]*|(?:/\\*(?:[^*]|\\*(?!/))*\\*/\\s*)+(?:/\\*(?:[^*]|\\*(?!/))*|//[^\\r\\n]*)?)?\\r?\\n'
+MultiLineComment = '/\\*(?:[^*]|\\*(?!/))*'
+MultiLineCommentEnd = '(?:[^*]|\\*(?!/))*(?:\\*/)'
+Name = '(?:\\w|\\$)+'
+NormalStringPrefix = '(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)'
+Number = '((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))'
+Octnumber = '0_*[0-7]+(?:_+[0-7]+)*([lL])?'
+Operator = '(>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)'
+PlainToken = '(((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){}]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*")|(?:\\w|\\$)+)'
+Pointfloat = '([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?'
+PseudoExtras = '(\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))'
+PseudoToken = '[ \\f\\t]*((\\\\\\r?\\n|\\Z|(//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*)|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"""))|((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){}]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)\'[^\\n\'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n\'\\\\%]*)*(%|\'|\\\\\\r?\\n)|(FR|Fr|RF|Rf|fR|fr|rF|rf|F|f)"[^\\n"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^\\n"\\\\%]*)*(%|"|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*(\'|\\\\\\r?\\n)|(|BR|Br|RB|Rb|bR|br|rB|rb|B|R|b|r)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*("|\\\\\\r?\\n))|(?:\\w|\\$)+)'
+Single = "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'"
+Single3 = "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''"
+SingleLineComment = '//[^\\r\\n]*'
+Special = '(\\r?\\n|\\.\\.\\.|[:;.,@])'
+String = '((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*")'
+StringPrefix = '(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)'
+Token = '[ \\f\\t]*(\\\\\\r?\\n[ \\f\\t]*)*((//[^\\r\\n]*|/\\*(?:[^*]|\\*(?!/))*))?(((0[xX]([0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?|\\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)[pP][-+]?[0-9]+(?:_+[0-9]+)*|([0-9]+(?:_+[0-9]+)*\\.(?:[0-9]+(?:_+[0-9]+)*)?|\\.[0-9]+(?:_+[0-9]+)*)([eE][-+]?[0-9]+(?:_+[0-9]+)*)?|[0-9](?:_?[0-9])*[eE][-+]?[0-9]+(?:_+[0-9]+)*)([fFdD])?|(0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*([lL])?|0[bB][01]+(?:_+[01]+)*([lL])?|0_*[0-7]+(?:_+[0-7]+)*([lL])?|(?:0|[1-9][0-9]*(?:_+[0-9]+)*)[fFdDlL]?))|((>>>?=|<<=?|->|::|&&|\\|\\||\\+\\+|--|[-+*/%&|^=<>!]=?|~|\\?)|[][(){}]|(\\r?\\n|\\.\\.\\.|[:;.,@]))|((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'[^\\n\'\\\\]*(?:\\\\.[^\\n\'\\\\]*)*\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)"[^\\n"\\\\]*(?:\\\\.[^\\n"\\\\]*)*")|(?:\\w|\\$)+)'
+Triple = '((BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)\'\'\'|(BR|Br|FR|Fr|RB|RF|Rb|Rf|bR|br|fR|fr|rB|rF|rb|rf|B|F|R|b|f|r|)""")'
+Whitespace = '[ \\f\\t]*'
+all_string_prefixes = {'', 'B', 'BR', 'Br', 'F', 'FR', 'Fr', 'R', 'RB', 'RF', 'Rb', 'Rf', 'b', 'bR', 'br', 'f', 'fR', 'fr', 'r', 'rB', 'rF', 'rb', 'rf'}
+endpats = {
+    '"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    '"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'B"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'B"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "B'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "B'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'BR"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'BR"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "BR'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "BR'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'Br"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'Br"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "Br'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "Br'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'F"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'F"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "F'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "F'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'FR"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'FR"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "FR'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "FR'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'Fr"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'Fr"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "Fr'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "Fr'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'R"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'R"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "R'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "R'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'RB"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'RB"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "RB'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "RB'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'RF"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'RF"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "RF'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "RF'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'Rb"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'Rb"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "Rb'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "Rb'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'Rf"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'Rf"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "Rf'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "Rf'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'b"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'b"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "b'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "b'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'bR"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'bR"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "bR'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "bR'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'br"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'br"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "br'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "br'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'f"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'f"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "f'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "f'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'fR"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'fR"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "fR'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "fR'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'fr"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'fr"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "fr'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "fr'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'r"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'r"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "r'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "r'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'rB"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'rB"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "rB'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "rB'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'rF"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'rF"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "rF'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "rF'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+    'rb"': '[^"\\\\]*(?:\\\\.[^"\\\\]*)*"',
+    'rb"""': '[^"\\\\]*(?:(?:\\\\.|"(?!""))[^"\\\\]*)*"""',
+    "rb'": "[^'\\\\]*(?:\\\\.[^'\\\\]*)*'",
+    "rb'''": "[^'\\\\]*(?:(?:\\\\.|'(?!''))[^'\\\\]*)*'''",
+    'rf"': '[^"\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|")',
+    'rf"""': '[^"\\\\%]*(?:(?:\\\\.|"(?!"")|%(?:%|n(?![\\w$])))[^"\\\\]*)*(?:%\\{?|""")',
+    "rf'": "[^'\\\\%]*(?:(?:\\\\.|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|')",
+    "rf'''": "[^'\\\\%]*(?:(?:\\\\.|'(?!'')|%(?:%|n(?![\\w$])))[^'\\\\]*)*(?:%\\{?|''')",
+}
+single_quoted = {'"', "'", 'B"', "B'", 'BR"', "BR'", 'Br"', "Br'", 'F"', "F'", 'FR"', "FR'", 'Fr"', "Fr'", 'R"', "R'", 'RB"', "RB'", 'RF"', "RF'", 'Rb"', "Rb'", 'Rf"', "Rf'", 'b"', "b'", 'bR"', "bR'", 'br"', "br'", 'f"', "f'", 'fR"', "fR'", 'fr"', "fr'", 'r"', "r'", 'rB"', "rB'", 'rF"', "rF'", 'rb"', "rb'", 'rf"', "rf'"}
+triple_quoted = {'"""', "'''", 'B"""', "B'''", 'BR"""', "BR'''", 'Br"""', "Br'''", 'F"""', "F'''", 'FR"""', "FR'''", 'Fr"""', "Fr'''", 'R"""', "R'''", 'RB"""', "RB'''", 'RF"""', "RF'''", 'Rb"""', "Rb'''", 'Rf"""', "Rf'''", 'b"""', "b'''", 'bR"""', "bR'''", 'br"""', "br'''", 'f"""', "f'''", 'fR"""', "fR'''", 'fr"""', "fr'''", 'r"""', "r'''", 'rB"""', "rB'''", 'rF"""', "rF'''", 'rb"""', "rb'''", 'rf"""', "rf'''"}
@@ -0,0 +1,521 @@
+"""
+Translating whole directories of javapy files.
+
+A build finds every .javapy file below a source directory and writes the translated .java
+file to the same relative path below an output directory. The files are translated by a
+pool of worker processes, largest first, so the interpreter is only started and javapy only
+imported once per worker instead of once per file. Workers are replaced after translating a
+given number of files or once they use too much memory, and a file which fails to translate
+is reported without stopping the rest of the build.
+
+Builds are incremental. A manifest in the output directory records, for each source file,
+the hash of its contents, of the javapy sources and of the options it was translated with,
+and the hash of the output. Files for which none of these have changed are not translated
+again, and the outputs of source files which have been deleted are removed. Each hash is
+kept with the size and modification time of its file, so files whose stat has not changed
+are not read at all.
+
+An output is only written if its contents have changed, so that its modification time does
+not make javac or Gradle recompile it, and it is replaced atomically when it is.
+
+Given a javapy.cache.Cache, translations are also looked up by the hash of their source and
+options there, which lets a fresh checkout reuse the translations made in any other.
+
+    python javapy.py build src --out build/java -j 8
+"""
+import os
+import io
+import sys
+import json
+import multiprocessing
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import List, Dict, Optional
+from .util import check_argument_types
+from .cache import Cache, tool_hash, _digest, _replace
+
+__all__ = ['Options', 'BuildResult', 'Manifest', 'discover', 'translate', 'write_if_changed', 'build']
+
+class Options:
+    """ How files are translated.
+
+    :ivar syntax: ``'JavaPy'`` to parse the files as javapy, ``'Java'`` to parse them as plain Java
+    :vartype syntax: str
+
+    :ivar width: Format the output to fit within this many columns, or None
+    :vartype width: int
+
+    :ivar brace_style: Where to put opening braces, one of PrettyEmitter.BRACE_STYLES, or None.
+        If either width or brace_style is given, the output is formatted.
+    :vartype brace_style: str
+    """
+    __slots__ = ('syntax', 'width', 'brace_style')
+
+    SYNTAXES = ('JavaPy', 'Java')
+
+    def __init__(self, syntax: str='JavaPy', width: Optional[int]=None, brace_style: Optional[str]=None):
+        assert check_argument_types()
+        if syntax not in Options.SYNTAXES:
+            raise ValueError(f"invalid syntax: {syntax!r}")
+        self.syntax = syntax
+        self.width = width
+        self.brace_style = brace_style
+
+    def __repr__(self):
+        return f"Options(syntax={self.syntax!r}, width={self.width!r}, brace_style={self.brace_style!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Options) and (self.syntax, self.width, self.brace_style) == (other.syntax, other.width, other.brace_style)
+
+    def __hash__(self):
+        return hash((self.syntax, self.width, self.brace_style))
+
+    def key(self) -> str:
+        """ Returns a string which is the same for two Options exactly when they are equal. """
+        return json.dumps([self.syntax, self.width, self.brace_style])
+
+    def parser(self):
+        from .parser import Parser, JavaParser
+        return JavaParser if self.syntax == 'Java' else Parser
+
+    def emitter(self, sink=None):
+        from .tree import Emitter, PrettyEmitter
+        if self.width is None and self.brace_style is None:
+            return Emitter(sink)
+        return PrettyEmitter(sink, width=self.width or 100, brace_style=self.brace_style or 'same-line')
+
+def translate(source: Path, options: Options) -> str:
+    """ Returns the Java source code of a javapy file. """
+    with source.open('rb') as file:
+        return _translate_bytes(file.read(), str(source), options)
+
+def _translate_bytes(data: bytes, filename: str, options: Options) -> str:
+    from .parser import parse_file
+    file = io.BytesIO(data)
+    file.name = filename
+    unit = parse_file(file, parser=options.parser())
+    out = options.emitter()
+    out.emit(unit)
+    out.flush()
+    return out.getvalue()
+
+def _stat(path: Path) -> list:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """ Writes data to path, replacing it atomically, unless it already holds exactly data.
+        The contents are only read if the size is the same. Returns whether path was written.
+    """
+    assert check_argument_types()
+    try:
+        if path.stat().st_size == len(data):
+            with path.open('rb') as file:
+                if file.read() == data:
+                    return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _replace(path, data)
+    return True
+
+class Manifest:
+    """ Records what an earlier build translated each source file from and to.
+
+    :ivar path: The file the manifest is saved in
+    :vartype path: Path
+
+    :ivar entries: For each source file, by its path relative to the source directory, a dict of
+        the hash and stat of the source (``'source'``, ``'source_stat'``), the tool_hash()
+        (``'tool'``), the Options.key() (``'options'``), and the hash and stat of the output
+        (``'output'``, ``'output_stat'``)
+    :vartype entries: Dict[str, dict]
+    """
+    VERSION = 1
+
+    FILENAME = '.javapy-manifest.json'
+
+    def __init__(self, path: Path, entries: Optional[dict]=None):
+        assert check_argument_types()
+        self.path = path
+        self.entries = {} if entries is None else entries
+
+    @classmethod
+    def load(cls, path: Path) -> 'Manifest':
+        """ Returns the manifest saved in the given file, or an empty one if there is none
+            or it cannot be read.
+        """
+        assert check_argument_types()
+        try:
+            with path.open('rb') as file:
+                data = json.loads(file.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return cls(path)
+        if not isinstance(data, dict) or data.get('version') != cls.VERSION or not isinstance(data.get('files'), dict):
+            return cls(path)
+        return cls(path, data['files'])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({'version': Manifest.VERSION, 'files': self.entries}, separators=(',', ':'), sort_keys=True)
+        _replace(self.path, data.encode('utf-8'))
+
+    def is_current(self, key: str, source: Path, target: Path, options: Options) -> bool:
+        """ Returns whether target holds the translation of source with the given options
+            by this version of javapy, according to the entry for key.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.get('tool') != tool_hash() or entry.get('options') != options.key():
+            return False
+        return self._unchanged(source, entry, 'source') and self._unchanged(target, entry, 'output')
+
+    def _unchanged(self, path: Path, entry: dict, field: str) -> bool:
+        """ Returns whether the file has the hash entry[field]. The file is only read if its
+            stat is not entry[field + '_stat'], which is updated if the contents are the same.
+        """
+        try:
+            stat = _stat(path)
+            if stat == entry.get(field + '_stat'):
+                return True
+            with path.open('rb') as file:
+                if _digest(file.read()) != entry.get(field):
+                    return False
+        except OSError:
+            return False
+        entry[field + '_stat'] = stat
+        return True
+
+def discover(src: Path) -> List[Path]:
+    """ Returns the .javapy files below the given directory, largest first. """
+    assert check_argument_types()
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.javapy'):
+                path = Path(dirpath, filename)
+                sources.append((path.stat().st_size, path))
+    sources.sort(key=lambda entry: entry[0], reverse=True)
+    return [path for size, path in sources]
+
+def target_path(src: Path, out: Path, source: Path) -> Path:
+    """ Returns where the translation of a source file below src is written below out. """
+    return out / source.relative_to(src).with_suffix('.java')
+
+class BuildResult:
+    """ What a build did.
+
+    :ivar converted: The source files which were translated
+    :vartype converted: List[Path]
+
+    :ivar written: The outputs which were written, because they were new or their contents changed
+    :vartype written: List[Path]
+
+    :ivar unchanged: The outputs which were left alone because they already held the translation
+    :vartype unchanged: List[Path]
+
+    :ivar failed: The error message for each source file which could not be translated
+    :vartype failed: Dict[Path, str]
+
+    :ivar skipped: The source files which were not translated because their outputs were up to date
+    :vartype skipped: List[Path]
+
+    :ivar removed: The outputs which were deleted because their source files were
+    :vartype removed: List[Path]
+
+    :ivar workers: How many worker processes were started over the build
+    :vartype workers: int
+
+    :ivar cache_hits: How many translations were found in the cache
+    :vartype cache_hits: int
+
+    :ivar cache_misses: How many translations were not found in the cache
+    :vartype cache_misses: int
+
+    :ivar cache_evictions: How many cache entries were deleted to keep the cache under its size limit
+    :vartype cache_evictions: int
+    """
+    def __init__(self):
+        self.converted: List[Path] = []
+        self.written: List[Path] = []
+        self.unchanged: List[Path] = []
+        self.failed: Dict[Path, str] = {}
+        self.skipped: List[Path] = []
+        self.removed: List[Path] = []
+        self.workers = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+
+    def _add_cache_stats(self, stats):
+        hits, misses, evictions = stats
+        self.cache_hits += hits
+        self.cache_misses += misses
+        self.cache_evictions += evictions
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+def _rss() -> int:
+    """ Returns how many bytes of memory this process is using, or 0 if that is unknown. """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss is the peak rather than the current size, which only makes workers recycle sooner
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+def _translate_to(source: Path, target: Path, options: Options, cache: Optional[Cache]=None):
+    """ Translates source, or finds its translation in cache, and writes the result to target,
+        encoded as UTF-8, if it changed. Returns the error message if it failed or else None,
+        the manifest entry, and whether target was written.
+    """
+    try:
+        # The stat is taken first, so a change made while translating is seen by the next build
+        source_stat = _stat(source)
+        with source.open('rb') as file:
+            data = file.read()
+        output = None
+        if cache is not None:
+            key = Cache.key('java', tool_hash(), options.key(), _digest(data))
+            output = cache.get(key)
+        if output is None:
+            output = _translate_bytes(data, str(source), options).encode('utf-8')
+            if cache is not None:
+                cache.put(key, output)
+        written = write_if_changed(target, output)
+        entry = {'source': _digest(data), 'source_stat': source_stat, 'tool': tool_hash(),
+                 'options': options.key(), 'output': _digest(output), 'output_stat': _stat(target)}
+    except Exception as e:
+        return f"{type(e).__name__}: {e}", None, False
+    return None, entry, written
+
+def _remove_output(target: Path, out: Path) -> bool:
+    """ Deletes target and then the directories below out it leaves empty.
+        Returns whether target existed.
+    """
+    try:
+        target.unlink()
+    except FileNotFoundError:
+        return False
+    directory = target.parent
+    while directory != out and out in directory.parents:
+        try:
+            directory.rmdir()
+        except OSError:
+            break
+        directory = directory.parent
+    return True
+
+def _worker(conn, options: Options, cache: Optional[Cache]):
+    """ Translates the files sent through conn until it receives None, answering each
+        with the result of _translate_to(), how much memory the worker is using, and
+        the cache hits, misses and evictions since the last answer.
+    """
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        source, target = task
+        error, entry, written = _translate_to(Path(source), Path(target), options, cache)
+        conn.send((error, entry, written, _rss(), cache.take_stats() if cache is not None else (0, 0, 0)))
+    conn.close()
+
+class _Worker:
+    def __init__(self, options: Options, cache: Optional[Cache]):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker, args=(child_conn, options, cache), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.files = 0
+
+    def send(self, task):
+        self.task = task
+        self.files += 1
+        try:
+            self.conn.send((str(task[0]), str(task[1])))
+        except OSError:
+            # The worker has exited, which is reported when its sentinel is waited on
+            pass
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+def build(src: Path, out: Path, options: Optional[Options]=None, *, jobs: Optional[int]=None,
+          max_files: Optional[int]=None, max_rss: Optional[int]=None,
+          manifest: Optional[Path]=None, force: bool=False, cache: Optional[Cache]=None) -> BuildResult:
+    """ Translates every .javapy file below src to a .java file at the same relative path below out,
+        unless the manifest shows it is up to date, and deletes the outputs of removed source files.
+
+        :param jobs: How many worker processes to use. Defaults to the number of CPUs. With 1,
+            the files are translated in this process.
+        :param max_files: Replace a worker after it has translated this many files
+        :param max_rss: Replace a worker once it uses more than this many bytes of memory
+        :param manifest: The manifest file. Defaults to Manifest.FILENAME in out.
+        :param force: Translate every file, even if it is up to date
+        :param cache: Where to look up and store translations
+    """
+    assert check_argument_types()
+    if options is None:
+        options = Options()
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs < 1:
+        raise ValueError('jobs must be at least 1')
+    result = BuildResult()
+    manifest = Manifest.load(out / Manifest.FILENAME if manifest is None else manifest)
+    entries = manifest.entries
+
+    tasks = []
+    keys = {}
+    for source in discover(src):
+        key = keys[source] = source.relative_to(src).as_posix()
+        target = target_path(src, out, source)
+        if not force and manifest.is_current(key, source, target, options):
+            result.skipped.append(source)
+        else:
+            tasks.append((source, target))
+
+    current = set(keys.values())
+    for key in [key for key in entries if key not in current]:
+        target = target_path(src, out, src / key)
+        if _remove_output(target, out):
+            result.removed.append(target)
+        del entries[key]
+
+    def finish(source, target, error, entry, written):
+        if error is None:
+            result.converted.append(source)
+            (result.written if written else result.unchanged).append(target)
+            entries[keys[source]] = entry
+        else:
+            result.failed[source] = error
+            entries.pop(keys[source], None)
+
+    try:
+        if jobs == 1:
+            for source, target in tasks:
+                finish(source, target, *_translate_to(source, target, options, cache))
+            if cache is not None:
+                result._add_cache_stats(cache.take_stats())
+        else:
+            _run_pool(tasks, options, cache, jobs, max_files, max_rss, result, finish)
+    finally:
+        manifest.save()
+    return result
+
+def _run_pool(tasks: list, options: Options, cache: Optional[Cache], jobs: int, max_files, max_rss, result: BuildResult, finish):
+    """ Translates the (source, target) tasks in worker processes, largest first,
+        calling finish(source, target, error, entry, written) with the result of each one.
+    """
+    tasks = tasks[::-1]
+    workers = []
+    def start():
+        result.workers += 1
+        workers.append(_Worker(options, cache))
+        return workers[-1]
+
+    def give_task(worker):
+        if tasks:
+            worker.send(tasks.pop())
+        else:
+            worker.task = None
+
+    try:
+        for _ in range(min(jobs, len(tasks))):
+            give_task(start())
+
+        while any(worker.task is not None for worker in workers):
+            busy = {}
+            for worker in workers:
+                if worker.task is not None:
+                    busy[worker.conn] = worker
+                    busy[worker.process.sentinel] = worker
+            for ready in wait(list(busy)):
+                worker = busy[ready]
+                if worker.task is None:
+                    continue
+                try:
+                    error, entry, written, rss, stats = worker.conn.recv()
+                    result._add_cache_stats(stats)
+                except (EOFError, OSError):
+                    worker.process.join()
+                    error, entry, written, rss = f"worker exited with code {worker.process.exitcode}", None, False, None
+                finish(*worker.task, error, entry, written)
+                worker.task = None
+
+                if rss is None or max_files is not None and worker.files >= max_files or max_rss is not None and rss > max_rss:
+                    workers.remove(worker)
+                    if rss is None:
+                        worker.conn.close()
+                    else:
+                        worker.stop()
+                    if tasks:
+                        worker = start()
+                    else:
+                        continue
+                give_task(worker)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+def main(args=None):
+    import argparse
+    from .tree import PrettyEmitter
+
+    parser = argparse.ArgumentParser(prog='javapy build', description='Translate every javapy file in a directory')
+    parser.add_argument('src', type=Path,
+                        help='The directory containing the javapy files')
+    parser.add_argument('--out', metavar='DIR', type=Path, required=True,
+                        help='The directory to write the Java files to, in the same layout as the source directory')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='How many files to translate at once. Defaults to the number of CPUs.')
+    parser.add_argument('--max-files-per-worker', metavar='N', type=int, default=1000,
+                        help='Restart a worker process after it has translated this many files')
+    parser.add_argument('--max-worker-rss', metavar='MB', type=int,
+                        help='Restart a worker process once it uses more than this much memory')
+    parser.add_argument('--manifest', metavar='FILE', type=Path,
+                        help=f'Where to keep the record of what has been built. Defaults to {Manifest.FILENAME} in the output directory.')
+    parser.add_argument('--force', action='store_true',
+                        help='Translate every file, even those which are up to date')
+    parser.add_argument('--cache', metavar='DIR', type=Path, default=os.environ.get(Cache.ENV_VAR),
+                        help=f'A directory of cached translations to use, which can be shared between checkouts. Defaults to ${Cache.ENV_VAR}.')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=1024,
+                        help='How big the cache may grow before the least recently used translations are deleted')
+    parser.add_argument('--type', choices=Options.SYNTAXES, default='JavaPy',
+                        help='What syntax to use')
+    parser.add_argument('--width', type=int,
+                        help='Format the output to fit within this many columns')
+    parser.add_argument('--brace-style', choices=PrettyEmitter.BRACE_STYLES,
+                        help='Where to put opening braces. Implies formatting the output.')
+
+    args = parser.parse_args(args)
+
+    if not args.src.is_dir():
+        parser.error(f"{args.src} is not a directory")
+
+    result = build(args.src, args.out, Options(args.type, args.width, args.brace_style), jobs=args.jobs,
+                   max_files=args.max_files_per_worker, max_rss=args.max_worker_rss and args.max_worker_rss * 2**20,
+                   manifest=args.manifest, force=args.force,
+                   cache=Cache(args.cache, args.cache_size * 2**20) if args.cache else None)
+
+    for source, error in result.failed.items():
+        print(f"Failed to convert {source}: {error}", file=sys.stderr)
+    print(f"Converted {len(result.converted)} files, {len(result.skipped)} up to date, {len(result.failed)} failed")
+    print(f"Outputs: {len(result.written)} written, {len(result.unchanged)} unchanged, {len(result.removed)} deleted")
+    if args.cache:
+        print(f"Cache: {result.cache_hits} hits, {result.cache_misses} misses, {result.cache_evictions} evictions")
+    return 0 if result.ok else 1
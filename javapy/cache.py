@@ -0,0 +1,230 @@
+"""
+A content-addressed cache of translations, which can be shared between checkouts and machines.
+
+Entries are keyed by the hash of the source, of the javapy sources and of anything else the
+result depends on, such as the emitter options, so an entry can never be stale. They are
+files in a directory, inserted by writing a temporary file and renaming it into place, so any
+number of processes can use the same directory at once, including over NFS. The directory is
+kept under a size limit by deleting the entries which were used least recently.
+
+    cache = Cache('/var/cache/javapy')
+    unit = parse_file(file, cache=cache)
+
+The build CLI uses the directory given by --cache or by the JAVAPY_CACHE_DIR environment variable.
+"""
+import os
+import io
+import uuid
+import hashlib
+import functools
+from pathlib import Path
+from typing import Optional, Union, Tuple
+from .util import check_argument_types
+
+__all__ = ['Cache', 'tool_hash']
+
+@functools.lru_cache(maxsize=None)
+def tool_hash() -> str:
+    """ Returns the hash of the javapy sources which determine the output, so that
+        translations made by a different version of javapy are not reused.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in ('util.py', 'tokenize.py', '_tokenize_tables.py', 'parser.py', 'tree.py', 'serialize.py'):
+        with open(os.path.join(directory, name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _replace(path: Path, data: bytes):
+    """ Writes data to a temporary file next to path and renames it over path, so that
+        path always holds either its old contents or all of data.
+    """
+    temp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with temp.open('wb') as file:
+            file.write(data)
+        os.replace(str(temp), str(path))
+    except BaseException:
+        try:
+            temp.unlink()
+        except OSError:
+            pass
+        raise
+
+class Cache:
+    """ A directory of cached translations.
+
+    :ivar directory: The directory the entries are kept in
+    :vartype directory: Path
+
+    :ivar max_size: How many bytes the entries may take up in total
+    :vartype max_size: int
+
+    :ivar hits: How many times get() found an entry in this process
+    :vartype hits: int
+
+    :ivar misses: How many times get() did not find an entry in this process
+    :vartype misses: int
+
+    :ivar evictions: How many entries this process deleted to stay under max_size
+    :vartype evictions: int
+    """
+    ENV_VAR = 'JAVAPY_CACHE_DIR'
+
+    # Eviction stops once the entries take up this fraction of max_size
+    LOW_WATER = 0.9
+
+    def __init__(self, directory: Union[str, Path], max_size: int=2**30):
+        assert check_argument_types()
+        if max_size <= 0:
+            raise ValueError('max_size must be positive')
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The total size of the entries, as far as this process knows, or None before it has looked
+        self._size = None
+
+    def __repr__(self):
+        return f"Cache({str(self.directory)!r}, max_size={self.max_size})"
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_size'])
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """ Returns the key of the entry for the given parts, such as the hashes of a source and its options. """
+        return _digest('\0'.join(parts).encode('utf-8', 'surrogatepass'))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key[2:]
+
+    def get(self, key: str) -> Optional[bytes]:
+        """ Returns the data stored under key, or None if there is none. """
+        path = self._path(key)
+        try:
+            with path.open('rb') as file:
+                data = file.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # The modification time is when the entry was last used, which eviction goes by
+            os.utime(str(path))
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        """ Stores data under key, deleting the least recently used entries if the cache gets too big. """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # An entry which is overwritten only grows the cache by the difference
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+        _replace(path, data)
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(data) - old_size
+        if self._size > self.max_size:
+            self.evict()
+
+    def remove(self, key: str):
+        """ Deletes the entry stored under key, if there is one. """
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def _entries(self):
+        """ Returns (mtime, size, path) for each entry. """
+        entries = []
+        try:
+            subdirectories = list(os.scandir(str(self.directory)))
+        except OSError:
+            return entries
+        for subdirectory in subdirectories:
+            if len(subdirectory.name) != 2 or not subdirectory.is_dir():
+                continue
+            try:
+                for entry in os.scandir(subdirectory.path):
+                    if not entry.name.startswith('.'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            except OSError:
+                # Deleted by another process in the meantime
+                pass
+        return entries
+
+    def size(self) -> int:
+        """ Returns how many bytes the entries take up. """
+        return sum(size for mtime, size, path in self._entries())
+
+    def evict(self, max_size: Optional[int]=None):
+        """ Deletes the least recently used entries until the rest take up at most LOW_WATER
+            of max_size, or of the given size.
+        """
+        entries = self._entries()
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        limit = (self.max_size if max_size is None else max_size) * Cache.LOW_WATER
+        for mtime, entry_size, path in entries:
+            if size <= limit:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def take_stats(self) -> Tuple[int, int, int]:
+        """ Returns the hits, misses and evictions so far and sets them back to 0. """
+        stats = (self.hits, self.misses, self.evictions)
+        self.hits = self.misses = self.evictions = 0
+        return stats
+
+    def clear(self):
+        """ Deletes every entry. """
+        self.evict(0)
+
+    def parse(self, file, parser=None):
+        """ Returns the CompilationUnit parsed from a binary file by the given Parser class,
+            which is stored in the cache in the format of javapy.serialize.
+        """
+        from .parser import Parser, parse_file
+        import javapy.serialize as serialize
+        if parser is None:
+            parser = Parser
+        data = file.read()
+        key = Cache.key('tree', f"{parser.__module__}.{parser.__qualname__}", tool_hash(), _digest(data))
+        cached = self.get(key)
+        if cached is not None:
+            try:
+                return serialize.loads(cached)
+            except Exception:
+                # A truncated or corrupt entry counts as a miss and is parsed again
+                self.hits -= 1
+                self.misses += 1
+                self.remove(key)
+        buffer = io.BytesIO(data)
+        buffer.name = getattr(file, 'name', '<unknown source>')
+        unit = parse_file(buffer, parser=parser)
+        self.put(key, serialize.dumps(unit))
+        return unit
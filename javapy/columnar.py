@@ -0,0 +1,232 @@
+"""
+A columnar representation of javapy trees, for analysing many files at once.
+
+A ColumnarTree keeps one entry per Node in parallel arrays of 4-byte integers instead of one
+Python object per Node. It is built from the binary serialization of javapy.serialize without
+creating any Nodes, so a corpus of serialized files can be queried as flat arrays. Queries run
+over the arrays, vectorised with NumPy when it is installed, and Nodes are only created for the
+subtrees which are asked for.
+
+    columns = ColumnarTree.loads(data)
+    columns.count_kinds()
+    calls = columns.calls_to('println')
+    node = columns.node(calls[0])
+"""
+import javapy.tree as tree
+import javapy.serialize as serialize
+from collections import Counter
+from typing import List, Dict, Optional, Union
+from javapy.util import check_argument_types
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['ColumnarTree']
+
+def _preorder(root: tree.Node):
+    """ Yields the Nodes of a tree in the order javapy.serialize writes them. """
+    stack = [root]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, tree.Node):
+            yield value
+            fields = value.__dict__
+            stack.extend(fields[key] for key in reversed(list(fields)) if key != 'children')
+        elif isinstance(value, list):
+            items = list(value)
+            items.reverse()
+            stack.extend(items)
+
+class ColumnarTree:
+    """ A tree stored as columns, which hold one entry per Node, in pre-order.
+        A Node's descendants directly follow it, so the root is Node 0.
+
+        :ivar kind: The index in kinds of the class of each Node
+        :ivar parent: The index of the parent of each Node, or -1
+        :ivar first_child: The index of the first child of each Node, or -1
+        :ivar next_sibling: The index of the next child of the parent of each Node, or -1
+        :ivar field: The index in strings of the name of the field of the parent holding each Node, or -1
+        :ivar depth: The number of ancestors of each Node
+        :ivar payload: The index in strings of the first string field of each Node, such as the
+                       value of a Name or the source of a Literal, or -1
+        :ivar span_start: The index of the first token each Node was parsed from, or -1
+        :ivar span_end: The index of the last token each Node was parsed from, or -1
+        :ivar kinds: The Node classes in the tree
+        :vartype kinds: List[type]
+        :ivar strings: The strings in the tree
+        :vartype strings: List[str]
+    """
+    def __init__(self, ints, strings: List[str], shapes: list):
+        """ Builds the columns from the sections of a binary serialization. Use loads() or from_tree(). """
+        self._reader = serialize._Reader(ints, strings, shapes)
+        self._offset = offsets = serialize._int_array()
+        self._views = {}
+        self.strings = strings
+        self.kinds = kinds = []
+
+        kind_indices = {}
+        string_indices = {string: i for i, string in enumerate(strings)}
+        shape_kinds = []
+        shape_fields = []
+        for cls, keys in shapes:
+            if cls not in kind_indices:
+                kind_indices[cls] = len(kinds)
+                kinds.append(cls)
+            shape_kinds.append(kind_indices[cls])
+            shape_fields.append([string_indices[key] for key in keys])
+
+        columns = [serialize._int_array() for _ in range(9)]
+        self.kind, self.parent, self.first_child, self.next_sibling, self.field, self.depth, self.payload, self.span_start, self.span_end = columns
+        kind, parent, first_child, next_sibling, field, depth, payload = columns[:7]
+        last_child = []
+
+        pos = 0
+        # Each frame is [count, index, owner, fields, field]. fields holds the field names of
+        # the Node being read, or is None for a list, whose elements are all in field.
+        stack = [[1, 0, -1, None, -1]]
+        while stack:
+            frame = stack[-1]
+            count, index, owner, fields, list_field = frame
+            if index == count:
+                stack.pop()
+                continue
+            frame[1] = index + 1
+
+            tag = ints[pos]
+            start = pos
+            pos += 1
+            if tag == serialize._NODE:
+                shape = ints[pos]
+                pos += 1
+                i = len(kind)
+                kind.append(shape_kinds[shape])
+                parent.append(owner)
+                field.append(list_field if fields is None else fields[index])
+                depth.append(depth[owner] + 1 if owner >= 0 else 0)
+                payload.append(-1)
+                offsets.append(start)
+                first_child.append(-1)
+                next_sibling.append(-1)
+                last_child.append(-1)
+                if owner >= 0:
+                    if last_child[owner] < 0:
+                        first_child[owner] = i
+                    else:
+                        next_sibling[last_child[owner]] = i
+                    last_child[owner] = i
+                if shape_fields[shape]:
+                    stack.append([len(shape_fields[shape]), 0, i, shape_fields[shape], -1])
+            elif tag == serialize._NODELIST or tag == serialize._LIST:
+                length = ints[pos]
+                pos += 1
+                if length:
+                    stack.append([length, 0, owner, None, list_field if fields is None else fields[index]])
+            elif tag == serialize._STR:
+                if fields is not None and payload[owner] < 0:
+                    payload[owner] = ints[pos]
+                pos += 1
+            elif tag == serialize._INT or tag == serialize._BIGINT or tag == serialize._FLOAT:
+                pos += 1
+            elif tag not in (serialize._NONE, serialize._TRUE, serialize._FALSE):
+                raise ValueError(f"corrupt serialized javapy tree: unknown tag {tag}")
+
+        for column in (self.span_start, self.span_end):
+            column.extend(-1 for _ in range(len(kind)))
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'ColumnarTree':
+        """ Returns the ColumnarTree of a tree serialized by javapy.serialize. """
+        assert check_argument_types()
+        return cls(*serialize._sections(data))
+
+    @classmethod
+    def from_tree(cls, node: tree.Node, spans=None) -> 'ColumnarTree':
+        """ Returns the ColumnarTree of the given tree. If a SpanTable of the Parser which
+            parsed the tree is given, the span columns are filled in from it.
+        """
+        assert check_argument_types()
+        result = cls.loads(serialize.dumps(node))
+        if spans is not None:
+            span_start, span_end = result.span_start, result.span_end
+            for i, descendant in enumerate(_preorder(node)):
+                if descendant in spans:
+                    span_start[i], span_end[i] = spans.tokens(descendant)
+        return result
+
+    def __len__(self):
+        return len(self.kind)
+
+    def node(self, index: int) -> tree.Node:
+        """ Returns the subtree rooted at the Node with the given index as javapy.tree Nodes.
+            They are created the first time they are asked for; the subtrees of different
+            indices are separate copies.
+        """
+        view = self._views.get(index)
+        if view is None:
+            if not 0 <= index < len(self.kind):
+                raise IndexError('node index out of range')
+            view = self._views[index] = self._reader.read(self._offset[index])
+        return view
+
+    def tree(self) -> tree.Node:
+        """ Returns the whole tree as javapy.tree Nodes. """
+        return self.node(0)
+
+    def _kind_indices(self, kind: Union[type, str]) -> List[int]:
+        if isinstance(kind, str):
+            return [i for i, cls in enumerate(self.kinds) if cls.__name__ == kind]
+        return [i for i, cls in enumerate(self.kinds) if issubclass(cls, kind)]
+
+    def _array(self, column):
+        return numpy.frombuffer(column, dtype=numpy.int32)
+
+    def count_kinds(self) -> Dict[str, int]:
+        """ Returns how many Nodes of each class the tree contains, by class name. """
+        if numpy is not None:
+            counts = numpy.bincount(self._array(self.kind), minlength=len(self.kinds)).tolist()
+        else:
+            counter = Counter(self.kind)
+            counts = [counter[i] for i in range(len(self.kinds))]
+        return {cls.__name__: count for cls, count in zip(self.kinds, counts) if count}
+
+    def of_kind(self, kind: Union[type, str]) -> List[int]:
+        """ Returns the indices of the Nodes of the given class, given by class or by name.
+            A class also matches its subclasses.
+        """
+        kinds = self._kind_indices(kind)
+        if numpy is not None:
+            return numpy.flatnonzero(numpy.isin(self._array(self.kind), kinds)).tolist()
+        kinds = set(kinds)
+        return [i for i, k in enumerate(self.kind) if k in kinds]
+
+    def with_field(self, kind: Union[type, str], field: str, value: str) -> List[int]:
+        """ Returns the indices of the Nodes of the given class whose field holds a Node
+            whose payload is value, such as the FunctionCalls whose name is a given Name.
+        """
+        try:
+            field_index = self.strings.index(field)
+            value_index = self.strings.index(value)
+        except ValueError:
+            return []
+        kinds = self._kind_indices(kind)
+        if numpy is not None:
+            matches = (self._array(self.payload) == value_index) & (self._array(self.field) == field_index)
+            parents = self._array(self.parent)[matches]
+            return parents[numpy.isin(self._array(self.kind)[parents], kinds)].tolist()
+        kinds = set(kinds)
+        kind, parent, payload, fields = self.kind, self.parent, self.payload, self.field
+        return [parent[i] for i in range(len(kind))
+                if payload[i] == value_index and fields[i] == field_index and kind[parent[i]] in kinds]
+
+    def calls_to(self, name: str) -> List[int]:
+        """ Returns the indices of the FunctionCalls of methods with the given name. """
+        return self.with_field(tree.FunctionCall, 'name', name)
+
+    def depth_histogram(self) -> List[int]:
+        """ Returns how many Nodes there are at each depth, starting with the root at depth 0. """
+        if numpy is not None:
+            return numpy.bincount(self._array(self.depth)).tolist()
+        counter = Counter(self.depth)
+        return [counter[depth] for depth in range(max(counter) + 1)]
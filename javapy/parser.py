@@ -1,13 +1,349 @@
 import javapy.tree as tree
+import io
+import weakref
 from javapy.util import *
 from javapy.tokenize import *
-from typeguard import check_type, check_argument_types
 from typing import Union, List, Optional, Type, Tuple
+from functools import wraps
+from types import MethodType
+from collections import OrderedDict
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Tokens which are not part of the Node which was parsed just before them
+_TRAILING_TOKENS = frozenset((COMMENT, NL, NEWLINE, INDENT, DEDENT, ENDMARKER))
+
+class _NodeRef(weakref.ref):
+    __slots__ = ('key',)
+
+class SpanTable:
+    """ The spans of source code the Nodes created by a Parser were parsed from.
+        Each span is stored as the indices of its first and last tokens. Their lines and
+        columns are kept in arrays, one entry per token, and are only turned into
+        Positions when asked for.
+
+        :ivar filename: The name of the parsed file
+        :vartype filename: str
+    """
+    def __init__(self, tokens: list, filename: str='<unknown source>'):
+        # tokens is a list of TokenInfo. Not annotated as such, since checking every token costs more than the table.
+        assert check_argument_types()
+        self.filename = filename
+        self._starts = array('l')
+        self._ends = array('l')
+        self._slots = {}
+        # Weak references to the Nodes, which remove their slots when the Nodes are freed,
+        # so Nodes from speculative branches which failed are not kept alive, and their ids
+        # are forgotten before they can be reused
+        self._nodes = []
+        slots = self._slots
+        def forget(ref):
+            slots.pop(ref.key, None)
+        self._forget = forget
+        self._lines = []
+        self._token_rows = rows = array('l')
+        self._token_columns = columns = array('l')
+        self._token_end_rows = end_rows = array('l')
+        self._token_end_columns = end_columns = array('l')
+        lines = self._lines
+        for token in tokens:
+            (row, column), (end_row, end_column) = token.start, token.end
+            rows.append(row)
+            columns.append(column)
+            end_rows.append(end_row)
+            end_columns.append(end_column)
+            if end_row > len(lines) and token.line:
+                # The line of a token spanning several lines holds all of them
+                physical = token.line.splitlines(keepends=True)
+                first = end_row - len(physical)
+                while len(lines) < first:
+                    lines.append(None)
+                for i in range(len(lines) - first, len(physical)):
+                    lines.append(physical[i])
+
+    def record(self, node: tree.Node, first: int, last: int):
+        """ Records that the given Node was parsed from the tokens first to last, inclusive,
+            widened to include the spans of its children, which may have been parsed before it.
+            If the Node already has a span, it is widened to include them instead.
+        """
+        slots = self._slots
+        starts, ends = self._starts, self._ends
+        slot = slots.get(id(node))
+        if slot is not None:
+            if last >= first:
+                if first < starts[slot]:
+                    starts[slot] = first
+                if last > ends[slot]:
+                    ends[slot] = last
+            return
+        for child in tree.iter_child_nodes(node):
+            slot = slots.get(id(child))
+            if slot is not None:
+                if last < first:
+                    first, last = starts[slot], ends[slot]
+                else:
+                    first = min(first, starts[slot])
+                    last = max(last, ends[slot])
+        if last >= first:
+            self._add(node, first, last)
+
+    def _add(self, node: tree.Node, first: int, last: int):
+        ref = _NodeRef(node, self._forget)
+        ref.key = id(node)
+        self._slots[ref.key] = len(self._nodes)
+        self._nodes.append(ref)
+        self._starts.append(first)
+        self._ends.append(last)
+
+    def __contains__(self, node):
+        return id(node) in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _slot(self, node):
+        try:
+            return self._slots[id(node)]
+        except KeyError:
+            raise KeyError(f"no span was recorded for {typename(node)} object") from None
+
+    def tokens(self, node: tree.Node) -> Tuple[int, int]:
+        """ Returns the indices of the first and last tokens the given Node was parsed from. """
+        slot = self._slot(node)
+        return self._starts[slot], self._ends[slot]
+
+    def _position(self, row: int, column: int) -> tree.Position:
+        line = self._lines[row-1] if row <= len(self._lines) else None
+        return tree.Position(row - 1, column, line or '')
+
+    def start(self, node: tree.Node) -> tree.Position:
+        """ Returns the Position of the first character the given Node was parsed from. """
+        first = self._starts[self._slot(node)]
+        return self._position(self._token_rows[first], self._token_columns[first])
+
+    def end(self, node: tree.Node) -> tree.Position:
+        """ Returns the Position just after the last character the given Node was parsed from. """
+        last = self._ends[self._slot(node)]
+        return self._position(self._token_end_rows[last], self._token_end_columns[last])
+
+    def span(self, node: tree.Node) -> Tuple[tree.Position, tree.Position]:
+        """ Returns the start and end Positions of the given Node. """
+        return self.start(node), self.end(node)
+
+def _key(line: int, column: int) -> int:
+    return line << 32 | column
+
+def _line_column(key: int) -> Tuple[int, int]:
+    return key >> 32, key & 0xFFFFFFFF
+
+def _spanned_nodes(root: tree.Node, spans: SpanTable, line: int=0, column: int=0) -> list:
+    """ Returns (start, end, depth, node) for every Node under root which has a span, with its
+        start and end keys moved by the given position.
+    """
+    slots = spans._slots
+    starts, ends = spans._starts, spans._ends
+    rows, columns = spans._token_rows, spans._token_columns
+    end_rows, end_columns = spans._token_end_rows, spans._token_end_columns
+    def key(row, col):
+        row -= 1
+        return _key(line + row, col + column if row == 0 else col)
+    entries = []
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        slot = slots.get(id(node))
+        if slot is not None:
+            first, last = starts[slot], ends[slot]
+            entries.append((key(rows[first], columns[first]), key(end_rows[last], end_columns[last]), depth, node))
+        stack.extend((child, depth + 1) for child in tree.iter_child_nodes(node))
+    # Enclosing spans first, and of two equal spans, the one of the ancestor
+    entries.sort(key=lambda entry: (entry[0], -entry[1], entry[2]))
+    return entries
+
+class _Intervals:
+    """ Nested intervals sorted by where they start, with the index of the innermost interval
+        enclosing each one.
+    """
+    def __init__(self, entries):
+        self.starts = [entry[0] for entry in entries]
+        self.ends = [entry[1] for entry in entries]
+        self.nodes = [entry[3] for entry in entries]
+        self.parents = self._parents(self.ends, 0, -1)
+        # The index of each Node, by id. The Nodes are kept alive by self.nodes.
+        self.slots = {id(node): i for i, node in enumerate(self.nodes)}
+
+    @staticmethod
+    def _parents(ends, offset, outer):
+        parents = []
+        stack = []
+        for i, end in enumerate(ends):
+            while stack and ends[stack[-1]] < end:
+                stack.pop()
+            parents.append(stack[-1] + offset if stack else outer)
+            stack.append(i)
+        return parents
+
+    def innermost(self, key: int) -> int:
+        i = bisect_right(self.starts, key) - 1
+        ends, parents = self.ends, self.parents
+        while i >= 0 and ends[i] <= key:
+            i = parents[i]
+        return i
+
+    def within(self, start: int, end: int) -> list:
+        starts, ends, nodes = self.starts, self.ends, self.nodes
+        result = []
+        for i in range(bisect_left(starts, start), bisect_left(starts, end)):
+            if ends[i] <= end:
+                result.append(nodes[i])
+        return result
+
+    def find(self, node: tree.Node) -> int:
+        return self.slots.get(id(node), -1)
+
+    def replace(self, old: tree.Node, old_start: int, old_end: int, entries: list, new_end: int):
+        """ Replaces the intervals of old and the ones inside it with the given entries, and
+            moves the intervals after old_end by the difference between it and new_end.
+        """
+        starts, ends, parents, nodes, slots = self.starts, self.ends, self.parents, self.nodes, self.slots
+        i = self.find(old)
+        if i < 0:
+            i = bisect_left(starts, old_start)
+            # Enclosing intervals which start at the same place are kept
+            while i < len(starts) and starts[i] == old_start and ends[i] > old_end:
+                i += 1
+        j = bisect_left(starts, old_end, lo=i)
+        outer = i - 1
+        while outer >= 0 and ends[outer] < old_end:
+            outer = parents[outer]
+
+        old_line, old_column = _line_column(old_end)
+        new_line, new_column = _line_column(new_end)
+        def shift(key):
+            if key < old_end:
+                return key
+            line, column = _line_column(key)
+            if line == old_line:
+                return _key(new_line, column - old_column + new_column)
+            return _key(line + new_line - old_line, column)
+
+        for node in nodes[i:j]:
+            del slots[id(node)]
+        new_ends = [entry[1] for entry in entries]
+        starts[i:j] = [entry[0] for entry in entries]
+        ends[i:j] = new_ends
+        nodes[i:j] = [entry[3] for entry in entries]
+        parents[i:j] = self._parents(new_ends, i, outer)
+        after = i + len(entries)
+        for k in range(i, after):
+            slots[id(nodes[k])] = k
+        if old_end != new_end:
+            # Of the intervals before, only the ones enclosing old end after it
+            k = outer
+            while k >= 0:
+                ends[k] = shift(ends[k])
+                k = parents[k]
+            for k in range(after, len(starts)):
+                starts[k] = shift(starts[k])
+                ends[k] = shift(ends[k])
+        delta = len(entries) - (j - i)
+        if delta:
+            for k in range(after, len(parents)):
+                if parents[k] >= j:
+                    parents[k] += delta
+                slots[id(nodes[k])] = k
+
+class SpanIndex:
+    """ An index of the spans of the Nodes of a parsed tree, which finds the Nodes at or
+        around a position in logarithmic time.
+        Positions are (line, column) tuples, 0-based like those of Position. A Node covers
+        the positions from its start up to, but not including, its end.
+    """
+    def __init__(self, root: tree.Node, spans: SpanTable):
+        assert check_argument_types()
+        entries = _spanned_nodes(root, spans)
+        self._all = _Intervals(entries)
+        self._members = _Intervals([entry for entry in entries if isinstance(entry[3], tree.Member)])
+
+    def __len__(self):
+        return len(self._all.nodes)
+
+    def node_at(self, line: int, column: int) -> Optional[tree.Node]:
+        """ Returns the innermost Node covering the given position, or None. """
+        i = self._all.innermost(_key(line, column))
+        return self._all.nodes[i] if i >= 0 else None
+
+    def member_at(self, line: int, column: int) -> Optional[tree.Member]:
+        """ Returns the innermost Member covering the given position, or None. """
+        i = self._members.innermost(_key(line, column))
+        return self._members.nodes[i] if i >= 0 else None
+
+    def nodes_in(self, start: Tuple[int, int], end: Tuple[int, int]) -> List[tree.Node]:
+        """ Returns the Nodes which lie entirely between the given positions, in source order. """
+        return self._all.within(_key(*start), _key(*end))
+
+    def span(self, node: tree.Node) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """ Returns the start and end positions of the given indexed Node. """
+        i = self._all.find(node)
+        if i < 0:
+            raise KeyError(f"{typename(node)} object is not indexed")
+        return _line_column(self._all.starts[i]), _line_column(self._all.ends[i])
+
+    def replace(self, old: tree.Node, new: tree.Node, spans: SpanTable, line: int=0, column: int=0):
+        """ Updates the index after the subtree old was replaced by the subtree new.
+            The spans of new are taken from the given SpanTable, whose positions are relative
+            to the given line and column. The positions of the Nodes after old move by the
+            difference between where old ended and where new ends.
+        """
+        assert check_argument_types()
+        start, end = self.span(old)
+        old_start, old_end = _key(*start), _key(*end)
+        entries = _spanned_nodes(new, spans, line, column)
+        if not entries or entries[0][3] is not new:
+            raise KeyError(f"no span was recorded for {typename(new)} object")
+        new_end = entries[0][1]
+        self._all.replace(old, old_start, old_end, entries, new_end)
+        self._members.replace(old, old_start, old_end, [entry for entry in entries if isinstance(entry[3], tree.Member)], new_end)
+
+def _records_span(method):
+    """ Wraps a parse method so that it records the span of the Node it returns. """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        tokens = self.tokens
+        first = tokens.marker
+        result = method(self, *args, **kwargs)
+        if isinstance(result, tree.Node):
+            last = tokens.marker - 1
+            token_list = tokens.list
+            while last >= first and token_list[last].type in _TRAILING_TOKENS:
+                last -= 1
+            self.spans.record(result, first, last)
+        return result
+    return wrapper
+
+# The parse methods of each Parser class, wrapped to record spans, made once per class
+_span_recording_methods = {}
+
+def _span_recording(cls) -> dict:
+    methods = _span_recording_methods.get(cls)
+    if methods is None:
+        names = {name for klass in cls.__mro__ for name in vars(klass) if name.startswith('parse_')}
+        methods = _span_recording_methods[cls] = {name: _records_span(getattr(cls, name)) for name in names if callable(getattr(cls, name))}
+    return methods
 
 class Parser:
-    def __init__(self, tokens, filename='<unknown source>'):
+    def __init__(self, tokens, filename='<unknown source>', spans=False):
+        """ If spans is true, the span of every Node the parse methods return is recorded in
+            the SpanTable self.spans, for SpanIndex and reparse(). Otherwise self.spans is None,
+            and parsing pays nothing for it.
+        """
         check_type('filename', filename, str)
         self.tokens = LookAheadListIterator(filter(lambda token: token.type != NL, tokens))
+        self.spans = None
+        if spans:
+            self.spans = SpanTable(self.tokens.list, filename)
+            for name, method in _span_recording(type(self)).items():
+                setattr(self, name, MethodType(method, self))
         self._scope = [False]
         self.filename = filename
         assert self.token.type == ENCODING
@@ -1959,18 +2295,262 @@ class Parser:
 
     #endregion Expressions
 
-def parse_file(file, parser: Type[Parser]=Parser) -> tree.CompilationUnit:
+class ParseCache:
+    """ A size-bounded, least recently used cache of parsed trees in memory, for passing to
+        parse_file() or parse_str(). Trees are looked up by the source itself and the Parser
+        class, so finding one costs a hash of the source and a dict lookup.
+
+        :ivar max_entries: How many trees are kept
+        :vartype max_entries: int
+
+        :ivar copy: Whether each parse returns a copy of the cached tree. Otherwise every parse of
+            the same source returns the same tree, which is frozen (see javapy.tree.freeze), so
+            that changing it raises a TypeError instead of changing what later parses return.
+        :vartype copy: bool
+
+        :ivar hits: How many parses were answered from the cache
+        :vartype hits: int
+
+        :ivar misses: How many parses were not answered from the cache
+        :vartype misses: int
+
+        :ivar evictions: How many trees were dropped to stay within max_entries
+        :vartype evictions: int
+    """
+    def __init__(self, max_entries: int=128, copy: bool=True):
+        assert check_argument_types()
+        if max_entries < 1:
+            raise ValueError('max_entries must be at least 1')
+        self.max_entries = max_entries
+        self.copy = copy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """ The fraction of parses which were answered from the cache """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def parse(self, file, parser: Type[Parser]=Parser) -> tree.CompilationUnit:
+        """ Returns the CompilationUnit parsed from a binary file by the given Parser class. """
+        data = file.read()
+        key = (parser, data)
+        entries = self._entries
+        unit = entries.get(key)
+        if unit is None:
+            self.misses += 1
+            buffer = io.BytesIO(data)
+            buffer.name = getattr(file, 'name', '<unknown source>')
+            unit = entries[key] = parse_file(buffer, parser)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+        if self.copy:
+            return unit.copy()
+        tree.freeze(unit)
+        return unit
+
+    def clear(self):
+        self._entries.clear()
+
+def parse_file(file, parser: Type[Parser]=Parser, cache=None) -> tree.CompilationUnit:
+    """ Parses a binary file. If a ParseCache or a javapy.cache.Cache is given, a file
+        which has been parsed before is taken from it instead.
+    """
     assert check_argument_types()
+    if cache is not None:
+        return cache.parse(file, parser)
     return parser(tokenize(file.readline), getattr(file, 'name', '<unknown source>')).parse_compilation_unit()
 
-def parse_str(s: str, encoding='utf-8', parser: Type[Parser]=Parser) -> tree.CompilationUnit:
+def parse_str(s: str, encoding='utf-8', parser: Type[Parser]=Parser, cache=None) -> tree.CompilationUnit:
+    assert check_argument_types()
+    file = io.BytesIO(bytes(s, encoding))
+    file.name = '<string>'
+    return parse_file(file, parser, cache)
+
+# The type declarations whose members reparse() can parse again one by one,
+# with the name of the Parser method which parses a member of each
+_MEMBER_PARSERS = {
+    tree.ClassDeclaration: 'parse_class_member',
+    tree.InterfaceDeclaration: 'parse_interface_member',
+    tree.AnnotationDeclaration: 'parse_annotation_member',
+}
+
+def _same_token(a: TokenInfo, b: TokenInfo) -> bool:
+    return a.type == b.type and a.string == b.string
+
+def _body_bounds(tokens: List[TokenInfo], first: int) -> Optional[Tuple[int, int]]:
+    """ Returns the indices of the tokens which open and close the body of the type
+        declaration whose tokens start at first, or None if they cannot be found.
+        The body is delimited by INDENT and DEDENT tokens, or by braces for Java.
+    """
+    end = len(tokens)
+    depth = 0
+    i = first
+    while i < end:
+        token = tokens[i]
+        if token.string in ('(', '['):
+            depth += 1
+        elif token.string in (')', ']'):
+            depth -= 1
+        elif depth == 0 and (token.type == INDENT or token.string == '{'):
+            break
+        elif token.type == ENDMARKER:
+            return None
+        i += 1
+    else:
+        return None
+    if tokens[i].type == INDENT:
+        opens = lambda token: token.type == INDENT
+        closes = lambda token: token.type == DEDENT
+    else:
+        opens = lambda token: token.string == '{' and token.type == OP
+        closes = lambda token: token.string == '}' and token.type == OP
+    start = i
+    depth = 0
+    while i < end:
+        token = tokens[i]
+        if opens(token):
+            depth += 1
+        elif closes(token):
+            depth -= 1
+            if depth == 0:
+                return start, i
+        i += 1
+    return None
+
+def _doc_start(tokens: List[TokenInfo], first: int) -> int:
+    """ Returns the index of the earliest token Parser.doc may look at for a member starting at first. """
+    i = first - 1
+    while i > 0 and tokens[i].type == NEWLINE:
+        i -= 1
+    return i
+
+def reparse(unit: tree.CompilationUnit, parser: Parser, file) -> Tuple[tree.CompilationUnit, Parser]:
+    """ Parses the new contents of a binary file, which the given Parser parsed into unit before,
+        parsing again only the members whose tokens changed.
+
+        The tokens of the old and new contents are compared to find the changed range. The type
+        declaration whose body contains it is found, descending into nested classes, and only
+        its members whose tokens overlap the range are parsed again and replace the old ones in
+        unit. The other members are kept as they are. If the change is not inside the body of
+        a type declaration, or the members do not parse cleanly on their own, the whole file is
+        parsed again instead. Several separate edits are treated as one range covering them all.
+
+        The given Parser must have been created with spans=True. Returns the CompilationUnit,
+        which is unit itself unless the whole file was parsed again, and a new Parser whose
+        tokens and spans are those of the new contents, to pass to the next call.
+    """
     assert check_argument_types()
-    import io
-    return parser(tokenize(io.BytesIO(bytes(s, encoding)).readline), '<string>').parse_compilation_unit()
+    spans = parser.spans
+    if spans is None:
+        raise ValueError('reparse() needs a Parser created with spans=True')
+    new_parser = type(parser)(tokenize(file.readline), getattr(file, 'name', parser.filename), spans=True)
+    old, new = parser.tokens.list, new_parser.tokens.list
+
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and _same_token(old[prefix], new[prefix]):
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and _same_token(old[-1-suffix], new[-1-suffix]):
+        suffix += 1
+    # The changed tokens are old[start:end] and new[start:end+delta]
+    start, end = prefix, len(old) - suffix
+    delta = len(new) - len(old)
+
+    def parse_whole():
+        fresh = type(parser)(new, new_parser.filename, spans=True)
+        return fresh.parse_compilation_unit(), fresh
+
+    if start == len(old) and delta == 0:
+        _adopt_spans(new_parser.spans, spans, start, delta, start, start)
+        return unit, new_parser
+
+    if not isinstance(unit, tree.CompilationUnit) or isinstance(unit, tree.ModuleCompilationUnit) or unit not in spans:
+        return parse_whole()
+
+    # Find the innermost container whose members the change lies among
+    container, members, method = unit, unit.types, 'parse_type_declaration'
+    body_start, body_end = None, len(old) - 1
+    while True:
+        if not members or any(member not in spans for member in members):
+            return parse_whole()
+        starts = [spans.tokens(member)[0] for member in members]
+        if body_start is not None:
+            starts[0] = body_start
+        starts.append(body_end)
+        if not starts[0] <= start or end > body_end:
+            return parse_whole()
+        first = 0
+        while first < len(members) and starts[first+1] + 1 < start:
+            first += 1
+        last = first + 1
+        while last < len(members) and (starts[last] < end or _doc_start(old, starts[last]) < end):
+            last += 1
+
+        member = members[first]
+        if last - first == 1 and type(member) in _MEMBER_PARSERS and member.members:
+            bounds = _body_bounds(old, spans.tokens(member)[0])
+            if bounds is not None and bounds[0] < start and end <= bounds[1]:
+                container, members, method = member, member.members, _MEMBER_PARSERS[type(member)]
+                body_start, body_end = bounds[0] + 1, bounds[1]
+                continue
+        break
+
+    if container is unit and first == 0:
+        # The first type declaration is parsed together with the package and imports
+        return parse_whole()
+
+    # Parse the changed members again, from where the first one starts to where the next unchanged one does
+    stop = starts[last] + delta
+    tokens = new_parser.tokens
+    tokens.marker = starts[first]
+    parse_member = getattr(new_parser, method)
+    new_members = []
+    try:
+        while tokens.marker < stop:
+            if new_parser.accept(';'):
+                new_parser.accept(NEWLINE)
+            else:
+                new_members.append(parse_member())
+    except JavaSyntaxError:
+        return parse_whole()
+    if tokens.marker != stop:
+        return parse_whole()
+
+    _adopt_spans(new_parser.spans, spans, start, delta, starts[first], starts[last])
+    members[first:last] = new_members
+    tokens.marker = len(new) - 1
+    return unit, new_parser
+
+def _adopt_spans(spans: SpanTable, old_spans: SpanTable, start: int, delta: int, removed_start: int, removed_end: int):
+    """ Adds the spans of old_spans to spans, moving the token indices at or after start by delta,
+        except the spans which lie within the removed tokens, from removed_start up to removed_end.
+    """
+    slots = spans._slots
+    old_starts, old_ends = old_spans._starts, old_spans._ends
+    for slot, ref in enumerate(old_spans._nodes):
+        node = ref()
+        if node is None:
+            continue
+        first, last = old_starts[slot], old_ends[slot]
+        if removed_start <= first and last < removed_end or id(node) in slots:
+            continue
+        spans._add(node, first if first < start else first + delta, last if last < start else last + delta)
 
 class JavaParser(Parser):
-    def __init__(self, tokens, filename='<unknown source>'):
-        super().__init__(filter(lambda token: token.type not in (NEWLINE, INDENT, DEDENT), tokens), filename)
+    def __init__(self, tokens, filename='<unknown source>', spans=False):
+        super().__init__(filter(lambda token: token.type not in (NEWLINE, INDENT, DEDENT), tokens), filename, spans)
 
     def next(self):
         next(self.tokens)
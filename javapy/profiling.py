@@ -0,0 +1,151 @@
+"""
+Timing the phases of translating a file and counting what the parser did, for the --profile
+option of the javapy and javapy.tokenize CLIs.
+
+    profile = Profile('A.javapy')
+    with profile.counting():
+        with profile.phase('read'):
+            data = file.read()
+        with profile.phase('tokenize'):
+            tokens = list(tokenize(io.BytesIO(data).readline))
+        ...
+    print(profile.format_table())
+
+Each phase records both wall and CPU time, so time spent waiting on the disk shows up as the
+difference between them. The counters come from wrapping a few methods of Node, JavaSyntaxError
+and LookAheadListIterator for as long as counting() is active, so a run without --profile pays
+nothing for them. Since the methods are wrapped for the whole process, only one Profile should
+be counting at a time.
+"""
+import sys
+import time
+import json
+import contextlib
+from functools import wraps
+from typing import Dict, List, Tuple
+from .util import check_argument_types
+
+__all__ = ['Profile']
+
+class Profile:
+    """ The time spent in each phase of translating a file and what the parser did meanwhile.
+
+    :ivar filename: The name of the profiled file
+    :vartype filename: str
+
+    :ivar phases: The wall and CPU seconds spent in each phase, in the order the phases were first entered
+    :vartype phases: Dict[str, List[float]]
+
+    :ivar counters: How many tokens were read and how many Nodes, markers, failed speculative
+        branches and syntax errors the parser created, pushed, reset, backtracked from and raised.
+        A profile of something which does not parse can be given fewer counters, but counting()
+        needs all of COUNTERS.
+    :vartype counters: Dict[str, int]
+    """
+    COUNTERS = ('tokens', 'nodes', 'markers_pushed', 'markers_reset', 'failed_branches', 'exceptions')
+
+    def __init__(self, filename: str, counters: Tuple[str, ...]=COUNTERS):
+        assert check_argument_types()
+        self.filename = filename
+        self.phases: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = dict.fromkeys(counters, 0)
+
+    def __repr__(self):
+        return f"Profile({self.filename!r})"
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """ Adds the wall and CPU time spent in the with block to the given phase. """
+        assert check_argument_types()
+        times = self.phases.setdefault(name, [0.0, 0.0])
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            times[0] += time.perf_counter() - wall
+            times[1] += time.process_time() - cpu
+
+    @contextlib.contextmanager
+    def counting(self):
+        """ Counts the Nodes created, the markers pushed and reset, the speculative branches
+            which failed and the syntax errors raised in the with block. A speculative branch
+            is a ``with parser.tokens:`` block, which resets the tokens if it raises.
+        """
+        from .util import LookAheadListIterator, JavaSyntaxError
+        from .tree import Node
+        counters = self.counters
+        patched = []
+
+        def patch(cls, name, wrapper):
+            original = cls.__dict__[name]
+            patched.append((cls, name, original))
+            setattr(cls, name, wraps(original)(wrapper(original)))
+
+        def count(counter):
+            def wrapper(method):
+                def counted(*args, **kwargs):
+                    counters[counter] += 1
+                    return method(*args, **kwargs)
+                return counted
+            return wrapper
+
+        def count_resets(method):
+            def pop_marker(self, reset):
+                if reset:
+                    counters['markers_reset'] += 1
+                return method(self, reset)
+            return pop_marker
+
+        def count_failures(method):
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                if exc_type is not None:
+                    counters['failed_branches'] += 1
+                return method(self, exc_type, exc_val, exc_tb)
+            return __exit__
+
+        try:
+            patch(Node, '__init__', count('nodes'))
+            patch(JavaSyntaxError, '__init__', count('exceptions'))
+            patch(LookAheadListIterator, 'push_marker', count('markers_pushed'))
+            patch(LookAheadListIterator, 'pop_marker', count_resets)
+            patch(LookAheadListIterator, '__exit__', count_failures)
+            yield self
+        finally:
+            for cls, name, original in reversed(patched):
+                setattr(cls, name, original)
+
+    def total(self) -> List[float]:
+        """ Returns the wall and CPU seconds spent in all phases together. """
+        return [sum(times[0] for times in self.phases.values()), sum(times[1] for times in self.phases.values())]
+
+    def to_dict(self) -> dict:
+        """ Returns the filename, the wall and CPU time of each phase and in total in milliseconds, and the counters. """
+        def ms(times):
+            return {'wall': times[0] * 1e3, 'cpu': times[1] * 1e3}
+        return {'file': self.filename,
+                'phases': {name: ms(times) for name, times in self.phases.items()},
+                'total': ms(self.total()),
+                'counters': dict(self.counters)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def format_table(self) -> str:
+        """ Returns the phases and the counters as a table for reading. """
+        width = max(len(name) for name in (*self.phases, *self.counters, 'total'))
+        lines = [self.filename,
+                 f"  {'phase':<{width}}  {'wall ms':>10}  {'cpu ms':>10}"]
+        for name, (wall, cpu) in self.phases.items():
+            lines.append(f"  {name:<{width}}  {wall*1e3:>10.2f}  {cpu*1e3:>10.2f}")
+        wall, cpu = self.total()
+        lines.append(f"  {'total':<{width}}  {wall*1e3:>10.2f}  {cpu*1e3:>10.2f}")
+        lines.append('')
+        for name, value in self.counters.items():
+            lines.append(f"  {name:<{width}}  {value:>10}")
+        return '\n'.join(lines)
+
+    def report(self, format: str='table', file=None):
+        """ Prints the profile to file, which defaults to stderr, as a table or as JSON. """
+        if format not in ('table', 'json'):
+            raise ValueError(f"invalid format: {format!r}")
+        print(self.format_table() if format == 'table' else self.to_json(), file=sys.stderr if file is None else file)
@@ -0,0 +1,284 @@
+"""
+A compact binary format for javapy trees.
+
+A tree is flattened in pre-order into one array of integers, in which every value is
+tagged with its kind, and a table of the strings the tree uses. Each distinct class and
+set of field names is stored once as a shape, so a Node only costs its shape number plus
+its field values. Loading rebuilds the Nodes directly, without running their constructors
+or their validation, and links every Node to its parent.
+
+    data = dumps(unit)
+    assert loads(data) == unit
+"""
+import javapy.tree as tree
+import sys
+import struct
+from array import array
+from itertools import accumulate
+from javapy.util import check_argument_types
+
+__all__ = ['dumps', 'loads', 'dump', 'load']
+
+MAGIC = b'JPYT'
+VERSION = 1
+
+_NONE, _FALSE, _TRUE, _INT, _BIGINT, _FLOAT, _STR, _NODE, _NODELIST, _LIST = range(10)
+
+_INT_MIN, _INT_MAX = -2**31, 2**31 - 1
+
+_HEADER = struct.Struct('<4sBIII')
+
+def _int_array():
+    for typecode in ('i', 'l'):
+        if array(typecode).itemsize == 4:
+            return array(typecode)
+    raise RuntimeError('no 4-byte array typecode available')
+
+class _Writer:
+    def __init__(self):
+        self.ints = _int_array()
+        self.strings = []
+        self._string_indices = {}
+        self.shapes = []
+        self._shape_indices = {}
+
+    def string(self, value: str) -> int:
+        index = self._string_indices.get(value)
+        if index is None:
+            index = self._string_indices[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def shape(self, node: tree.Node, keys: tuple) -> int:
+        cls = type(node)
+        index = self._shape_indices.get((cls, keys))
+        if index is None:
+            if cls.__module__ != tree.__name__:
+                raise ValueError(f"cannot serialize {cls.__module__}.{cls.__qualname__}, only the Node classes of {tree.__name__}")
+            index = self._shape_indices[(cls, keys)] = len(self.shapes)
+            self.shapes.append((self.string(f"{cls.__module__}:{cls.__qualname__}"), [self.string(key) for key in keys]))
+        return index
+
+    def write(self, root):
+        ints = self.ints
+        append = ints.append
+        # Values still to be written, last one first
+        stack = [root]
+        pop = stack.pop
+        while stack:
+            value = pop()
+            if value is None:
+                append(_NONE)
+            elif value is True:
+                append(_TRUE)
+            elif value is False:
+                append(_FALSE)
+            elif isinstance(value, str):
+                append(_STR)
+                append(self.string(value))
+            elif isinstance(value, tree.Node):
+                fields = value.__dict__
+                keys = tuple(key for key in fields if key != 'parent' and key != 'children')
+                append(_NODE)
+                append(self.shape(value, keys))
+                stack.extend(fields[key] for key in reversed(keys))
+            elif isinstance(value, list):
+                append(_NODELIST if isinstance(value, tree.NodeList) else _LIST)
+                items = list(value)
+                append(len(items))
+                items.reverse()
+                stack.extend(items)
+            elif isinstance(value, int):
+                if _INT_MIN <= value <= _INT_MAX:
+                    append(_INT)
+                    append(value)
+                else:
+                    append(_BIGINT)
+                    append(self.string(str(value)))
+            elif isinstance(value, float):
+                append(_FLOAT)
+                append(self.string(repr(value)))
+            else:
+                raise TypeError(f"cannot serialize {tree.typename(value)} object")
+
+    def getvalue(self) -> bytes:
+        shapes = _int_array()
+        for name, keys in self.shapes:
+            shapes.append(name)
+            shapes.append(len(keys))
+            shapes.extend(keys)
+        lengths = _int_array()
+        lengths.extend(len(string) for string in self.strings)
+        ints = self.ints
+        if sys.byteorder == 'big':
+            for arr in (shapes, lengths, ints):
+                arr.byteswap()
+        text = ''.join(self.strings).encode('utf-8', 'surrogatepass')
+        return b''.join((_HEADER.pack(MAGIC, VERSION, len(lengths), len(shapes), len(ints)),
+                         lengths.tobytes(), shapes.tobytes(), ints.tobytes(), text))
+
+def dumps(node: tree.Node) -> bytes:
+    """ Returns the binary serialization of the given tree. """
+    assert check_argument_types()
+    writer = _Writer()
+    writer.write(node)
+    return writer.getvalue()
+
+def dump(node: tree.Node, file):
+    """ Writes the binary serialization of the given tree to a binary file. """
+    file.write(dumps(node))
+
+_class_cache = {}
+
+def _resolve_class(name: str) -> type:
+    cls = _class_cache.get(name)
+    if cls is None:
+        # The data may come from a shared cache, so it must not be able to import anything
+        module, _, qualname = name.partition(':')
+        if module != tree.__name__:
+            raise ValueError(f"{name} is not a Node class")
+        cls = tree
+        for part in qualname.split('.'):
+            cls = getattr(cls, part, None)
+        if not (isinstance(cls, type) and issubclass(cls, tree.Node)):
+            raise ValueError(f"{name} is not a Node class")
+        _class_cache[name] = cls
+    return cls
+
+def _new_nodelist(parent):
+    nodelist = tree.NodeList.__new__(tree.NodeList)
+    object.__setattr__(nodelist, '_list', [])
+    object.__setattr__(nodelist, '_parent', tree._ref(parent))
+    return nodelist
+
+def _sections(data: bytes):
+    """ Returns the ints, strings and shapes of a binary serialization. """
+    try:
+        magic, version, nstrings, nshapes, nints = _HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError('data is not a serialized javapy tree') from None
+    if magic != MAGIC:
+        raise ValueError('data is not a serialized javapy tree')
+    if version != VERSION:
+        raise ValueError(f"unsupported serialization version {version}")
+
+    offset = _HEADER.size
+    sections = []
+    for count in (nstrings, nshapes, nints):
+        if len(data) < offset + 4*count:
+            raise ValueError('corrupt serialized javapy tree: truncated')
+        arr = _int_array()
+        arr.frombytes(data[offset:offset + 4*count])
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        sections.append(arr)
+        offset += 4*count
+    lengths, shape_ints, ints = sections
+
+    try:
+        text = data[offset:].decode('utf-8', 'surrogatepass')
+    except UnicodeDecodeError:
+        raise ValueError('corrupt serialized javapy tree: invalid string table') from None
+    ends = list(accumulate(lengths))
+    if (ends[-1] if ends else 0) != len(text):
+        raise ValueError('corrupt serialized javapy tree: truncated')
+    strings = [text[end - length:end] for end, length in zip(ends, lengths)]
+
+    shapes = []
+    i = 0
+    while i < len(shape_ints):
+        cls = _resolve_class(strings[shape_ints[i]])
+        nkeys = shape_ints[i+1]
+        shapes.append((cls, [strings[index] for index in shape_ints[i+2:i+2+nkeys]]))
+        i += 2 + nkeys
+
+    return ints, strings, shapes
+
+def loads(data: bytes) -> tree.Node:
+    """ Rebuilds a tree from its binary serialization. """
+    assert check_argument_types()
+    return _Reader(*_sections(data)).read()
+
+def load(file) -> tree.Node:
+    """ Rebuilds a tree from its binary serialization, read from a binary file. """
+    return loads(file.read())
+
+class _Reader:
+    def __init__(self, ints, strings, shapes):
+        self.ints = ints
+        self.strings = strings
+        self.shapes = shapes
+
+    def read(self, pos: int=0):
+        """ Returns the value written at the given position, with the values it contains. """
+        ints = self.ints
+        strings = self.strings
+        shapes = self.shapes
+        Node = tree.Node
+        new_object = object.__new__
+        set_slot = object.__setattr__
+
+        # Each frame is [container, owner, keys, index, count]. The container is the dict of a
+        # Node being filled in, or the list being filled in. owner is the Node the values belong to.
+        root = []
+        stack = [[root, None, None, 0, 1]]
+        while stack:
+            frame = stack[-1]
+            container, owner, keys, index, count = frame
+            if index == count:
+                stack.pop()
+                if keys is not None:
+                    container['children']._list.extend(container[key] for key in keys if isinstance(container[key], Node))
+                continue
+            frame[3] = index + 1
+
+            tag = ints[pos]
+            pos += 1
+            new_frame = None
+            if tag == _NONE:
+                value = None
+            elif tag == _STR:
+                value = strings[ints[pos]]
+                pos += 1
+            elif tag == _NODE:
+                cls, node_keys = shapes[ints[pos]]
+                pos += 1
+                value = new_object(cls)
+                set_slot(value, '_rendered', None)
+                set_slot(value, '_hash', None)
+                set_slot(value, '_parent', tree._ref(owner))
+                fields = value.__dict__
+                fields['children'] = _new_nodelist(value)
+                new_frame = [fields, value, node_keys, 0, len(node_keys)]
+            elif tag == _NODELIST:
+                value = _new_nodelist(owner)
+                new_frame = [value._list, owner, None, 0, ints[pos]]
+                pos += 1
+            elif tag == _LIST:
+                value = []
+                new_frame = [value, owner, None, 0, ints[pos]]
+                pos += 1
+            elif tag == _TRUE:
+                value = True
+            elif tag == _FALSE:
+                value = False
+            elif tag == _INT:
+                value = ints[pos]
+                pos += 1
+            elif tag == _BIGINT:
+                value = int(strings[ints[pos]])
+                pos += 1
+            elif tag == _FLOAT:
+                value = float(strings[ints[pos]])
+                pos += 1
+            else:
+                raise ValueError(f"corrupt serialized javapy tree: unknown tag {tag}")
+
+            if keys is None:
+                container.append(value)
+            else:
+                container[keys[index]] = value
+            if new_frame is not None:
+                stack.append(new_frame)
+
+        return root[0]
@@ -0,0 +1,418 @@
+"""
+A long-running translation server, which build tools talk to over a local socket instead of
+starting an interpreter for every file.
+
+Requests and responses are frames: a 4-byte big-endian length followed by that many bytes of
+a UTF-8 JSON object. A request has an ``"op"`` and may have an ``"id"``, which is copied into
+its response, since a connection's responses are sent as soon as they are ready rather than in
+the order of their requests.
+
+    {"op": "translate", "id": 1, "source": "class A: ...", "filename": "A.javapy",
+     "syntax": "JavaPy", "width": null, "brace_style": null}
+    -> {"id": 1, "ok": true, "java": "class A { ... }"}
+    -> {"id": 1, "ok": false, "error": "expected ...", "line": 3, "column": 7, "text": "..."}
+
+    {"op": "stats"}     -> {"ok": true, "requests": ..., "latency": {"p50": ..., "p99": ...}, ...}
+    {"op": "restart"}   -> {"ok": true}
+
+The server runs on asyncio and parses in a pool of worker processes. At most max_pending
+translations are in progress at once; until one finishes, the server stops reading requests,
+so clients are slowed down by their socket buffers filling up instead of the server queueing
+without bound. A restart, requested by SIGHUP or the restart op, replaces the workers with
+fresh ones, which import javapy again, while the old ones finish what they were given.
+SIGTERM and SIGINT stop the server once the translations in progress have been answered.
+
+    python javapy.py serve --socket /tmp/javapy.sock -j 4
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import struct
+import signal
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from .util import check_argument_types
+from .build import Options, _translate_bytes
+from .tokenize import TokenError
+
+__all__ = ['Histogram', 'Server', 'Client']
+
+_LENGTH = struct.Struct('>I')
+
+# Frames longer than this close the connection
+MAX_FRAME = 64 * 2**20
+
+class Histogram:
+    """ Counts durations in buckets which grow by a factor of BASE, from 1 microsecond up,
+        so that percentiles are known to within that factor in constant memory.
+
+    :ivar count: How many durations were added
+    :vartype count: int
+
+    :ivar total: The sum of the durations, in seconds
+    :vartype total: float
+
+    :ivar max: The longest duration, in seconds
+    :vartype max: float
+    """
+    BASE = 2 ** 0.125
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        index = max(0, math.ceil(math.log(max(seconds, 1e-6) * 1e6, Histogram.BASE)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """ Returns the duration in seconds which p percent of the durations are at most,
+            rounded up to the end of its bucket, or 0 if there are none.
+        """
+        if not 0 <= p <= 100:
+            raise ValueError('p must be between 0 and 100')
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(Histogram.BASE ** index / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """ Returns the count and the mean, p50, p90, p99 and max in milliseconds. """
+        return {'count': self.count,
+                'mean': self.total / self.count * 1e3 if self.count else 0.0,
+                'p50': self.percentile(50) * 1e3,
+                'p90': self.percentile(90) * 1e3,
+                'p99': self.percentile(99) * 1e3,
+                'max': self.max * 1e3}
+
+def _translate(source: bytes, filename: str, options: Options):
+    """ Runs in a worker. Returns the response fields for translating source. """
+    started = time.perf_counter()
+    try:
+        java = _translate_bytes(source, filename, options)
+    except SyntaxError as e:
+        response = {'ok': False, 'error': e.msg, 'line': e.lineno, 'column': e.offset, 'text': e.text}
+    except TokenError as e:
+        message, (line, column) = e.args
+        response = {'ok': False, 'error': message, 'line': line, 'column': column}
+    except Exception as e:
+        response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    else:
+        response = {'ok': True, 'java': java}
+    return response, time.perf_counter() - started
+
+async def _read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """ Returns the next request, or None at the end of the stream. """
+    try:
+        header = await reader.readexactly(_LENGTH.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ValueError('connection closed in the middle of a frame')
+        return None
+    length, = _LENGTH.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes is too long")
+    request = json.loads((await reader.readexactly(length)).decode('utf-8'))
+    if not isinstance(request, dict):
+        raise ValueError('request is not an object')
+    return request
+
+def _frame(message: dict) -> bytes:
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+class Server:
+    """ Translates javapy sources sent over a Unix socket.
+
+    :ivar path: The path of the socket
+    :vartype path: str
+
+    :ivar jobs: How many worker processes translate at once
+    :vartype jobs: int
+
+    :ivar max_pending: How many translations may be in progress or waiting for a worker
+    :vartype max_pending: int
+    """
+    def __init__(self, path: str, jobs: Optional[int]=None, max_pending: Optional[int]=None):
+        assert check_argument_types()
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs < 1:
+            raise ValueError('jobs must be at least 1')
+        if max_pending is None:
+            max_pending = 4 * jobs
+        if max_pending < 1:
+            raise ValueError('max_pending must be at least 1')
+        self.path = path
+        self.jobs = jobs
+        self.max_pending = max_pending
+        self.latency = Histogram()
+        self.translate_time = Histogram()
+        self.requests = 0
+        self.errors = 0
+        self.restarts = 0
+        self.started = time.time()
+        self._executor = None
+        self._slots = None
+        self._server = None
+        self._stopping = None
+        self._tasks = set()
+        self._connections = {}
+        # The shutdowns of the executors replaced by restart()
+        self._retired = []
+
+    def stats(self) -> dict:
+        """ Returns what the stats op answers with. Latencies are in milliseconds. """
+        return {'ok': True, 'requests': self.requests, 'errors': self.errors, 'restarts': self.restarts,
+                'pending': len(self._tasks), 'max_pending': self.max_pending, 'jobs': self.jobs,
+                'connections': len(self._connections), 'uptime': time.time() - self.started,
+                'latency': self.latency.to_dict(), 'translate': self.translate_time.to_dict()}
+
+    def restart(self):
+        """ Replaces the worker processes. The old ones exit once they have finished their translations. """
+        old, self._executor = self._executor, ProcessPoolExecutor(self.jobs)
+        self.restarts += 1
+        if old is not None:
+            # Before Python 3.9, shutdown(wait=False) can leave the workers running forever,
+            # so the old executor is waited for in a thread instead
+            self._retired.append(asyncio.get_event_loop().run_in_executor(None, old.shutdown))
+
+    async def start(self):
+        """ Starts listening on the socket. """
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._stopping = asyncio.Event()
+        self._executor = ProcessPoolExecutor(self.jobs)
+        if os.path.exists(self.path) and not os.path.isdir(self.path):
+            # Left behind by a server which did not stop cleanly, or in use by one which is running
+            with socket.socket(socket.AF_UNIX) as probe:
+                try:
+                    probe.connect(self.path)
+                except OSError:
+                    os.unlink(self.path)
+                else:
+                    raise OSError(f"a server is already listening on {self.path}")
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    def stop(self):
+        """ Makes serve_forever() return once the translations in progress have been answered. """
+        self._stopping.set()
+
+    async def serve_forever(self):
+        """ Serves until stop() is called or the process gets SIGTERM or SIGINT. SIGHUP restarts the workers. """
+        loop = asyncio.get_event_loop()
+        handled = []
+        if sys.platform != 'win32':
+            for signum, handler in ((signal.SIGTERM, self.stop), (signal.SIGINT, self.stop), (signal.SIGHUP, self.restart)):
+                loop.add_signal_handler(signum, handler)
+                handled.append(signum)
+        try:
+            await self._stopping.wait()
+        finally:
+            for signum in handled:
+                loop.remove_signal_handler(signum)
+            await self.close()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+        for writer in list(self._connections.values()):
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections))
+        self._executor.shutdown(wait=True)
+        if self._retired:
+            await asyncio.wait(self._retired)
+            self._retired.clear()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = asyncio.current_task()
+        self._connections[connection] = writer
+        # The requests of this connection which have not been answered yet
+        tasks = set()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    request = await _read_frame(reader)
+                except (ValueError, UnicodeDecodeError) as e:
+                    writer.write(_frame({'ok': False, 'error': f"bad request: {e}"}))
+                    break
+                except ConnectionError:
+                    break
+                if request is None:
+                    break
+                # A connection only takes a slot once it has a request, so idle connections
+                # take none. Not reading the next request until there is a free slot is what
+                # pushes back on the clients.
+                await self._slots.acquire()
+                task = asyncio.ensure_future(self._handle(request, writer))
+                for pending in (self._tasks, tasks):
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if tasks:
+                await asyncio.wait(list(tasks))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[connection]
+            writer.close()
+
+    async def _handle(self, request: dict, writer: asyncio.StreamWriter):
+        started = time.perf_counter()
+        try:
+            op = request.get('op')
+            if op == 'translate':
+                response = await self._translate(request)
+            elif op == 'stats':
+                response = self.stats()
+            elif op == 'restart':
+                self.restart()
+                response = {'ok': True}
+            else:
+                response = {'ok': False, 'error': f"unknown op: {op!r}"}
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        finally:
+            self._slots.release()
+        if 'id' in request:
+            response['id'] = request['id']
+        self.requests += 1
+        if not response['ok']:
+            self.errors += 1
+        if not writer.is_closing():
+            writer.write(_frame(response))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        if op == 'translate':
+            self.latency.add(time.perf_counter() - started)
+
+    async def _translate(self, request: dict) -> dict:
+        source = request.get('source')
+        if not isinstance(source, str):
+            return {'ok': False, 'error': 'source must be a string'}
+        try:
+            options = Options(request.get('syntax', 'JavaPy'), request.get('width'), request.get('brace_style'))
+        except (ValueError, TypeError) as e:
+            return {'ok': False, 'error': f"bad options: {e}"}
+        filename = str(request.get('filename', '<unknown source>'))
+        loop = asyncio.get_event_loop()
+        executor = self._executor
+        try:
+            response, seconds = await loop.run_in_executor(executor, _translate, source.encode('utf-8'), filename, options)
+        except BrokenProcessPool:
+            # A worker died, which breaks the whole pool
+            if self._executor is executor:
+                self.restart()
+            return {'ok': False, 'error': 'worker process exited'}
+        self.translate_time.add(seconds)
+        return response
+
+class Client:
+    """ A blocking connection to a Server, for tools and tests.
+
+        with Client('/tmp/javapy.sock') as client:
+            java = client.translate(source)['java']
+    """
+    def __init__(self, path: str, timeout: Optional[float]=None):
+        assert check_argument_types()
+        self._socket = socket.socket(socket.AF_UNIX)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._file = self._socket.makefile('rb')
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def send(self, request: dict) -> int:
+        """ Sends a request without waiting for its response, giving it the next id unless it has one. Returns its id. """
+        if 'id' not in request:
+            request = dict(request, id=self._next_id)
+            self._next_id += 1
+        self._socket.sendall(_frame(request))
+        return request['id']
+
+    def receive(self) -> dict:
+        """ Returns the next response. """
+        header = self._file.read(_LENGTH.size)
+        if len(header) < _LENGTH.size:
+            raise ConnectionError('server closed the connection')
+        length, = _LENGTH.unpack(header)
+        data = self._file.read(length)
+        if len(data) < length:
+            raise ConnectionError('server closed the connection')
+        return json.loads(data.decode('utf-8'))
+
+    def request(self, request: dict) -> dict:
+        """ Sends a request and returns its response. There must be no other requests waiting for a response. """
+        self.send(request)
+        return self.receive()
+
+    def translate(self, source: str, filename: str='<unknown source>', options: Optional[Options]=None) -> dict:
+        if options is None:
+            options = Options()
+        return self.request({'op': 'translate', 'source': source, 'filename': filename,
+                             'syntax': options.syntax, 'width': options.width, 'brace_style': options.brace_style})
+
+    def stats(self) -> dict:
+        return self.request({'op': 'stats'})
+
+def main(args=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='javapy serve', description='Translate javapy sources sent over a Unix socket')
+    parser.add_argument('--socket', metavar='PATH', required=True,
+                        help='Where to create the socket')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='How many files to translate at once. Defaults to the number of CPUs.')
+    parser.add_argument('--max-pending', metavar='N', type=int,
+                        help='How many translations may be waiting before the server stops reading requests. Defaults to 4 per job.')
+
+    args = parser.parse_args(args)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('Unix sockets are not supported on this platform')
+
+    server = Server(args.socket, args.jobs, args.max_pending)
+
+    async def run():
+        await server.start()
+        print(f"Listening on {server.path} with {server.jobs} workers")
+        sys.stdout.flush()
+        await server.serve_forever()
+
+    asyncio.get_event_loop().run_until_complete(run())
+    stats = server.stats()
+    print(f"Served {stats['requests']} requests, {stats['errors']} errors, "
+          f"p50 {stats['latency']['p50']:.1f} ms, p99 {stats['latency']['p99']:.1f} ms")
+    return 0
@@ -139,34 +139,6 @@ def print_tokens(tokens, exact=True):
 
 
 #region regexes
-# Note: we use unicode matching for names ("\w") but ascii matching for
-# number literals.
-Whitespace = r'[ \f\t]*'
-SingleLineComment = r'//[^\r\n]*'
-MultiLineComment = r'/\*(?:[^*]|\*(?!/))*'
-Comment = group(SingleLineComment, MultiLineComment)
-Ignore = Whitespace + any(r'\\\r?\n' + Whitespace) + maybe(Comment)
-Name = r'(?:\w|\$)+'
-
-FloatSuffix = r'[fFdD]'
-IntSuffix = r'[lL]'
-
-Hexnumber = r'0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*' + maybe(IntSuffix)
-Binnumber = r'0[bB][01]+(?:_+[01]+)*' + maybe(IntSuffix)
-Octnumber = r'0_*[0-7]+(?:_+[0-7]+)*' + maybe(IntSuffix)
-Decnumber = r'(?:0|[1-9][0-9]*(?:_+[0-9]+)*)' + r'[fFdDlL]?'
-Intnumber = group(Hexnumber, Binnumber, Octnumber, Decnumber)
-ExponentSuffix = r'[-+]?[0-9]+(?:_+[0-9]+)*'
-Exponent = r'[eE]' + ExponentSuffix
-Pointfloat = group(r'[0-9]+(?:_+[0-9]+)*\.(?:[0-9]+(?:_+[0-9]+)*)?',
-                   r'\.[0-9]+(?:_+[0-9]+)*') + maybe(Exponent)
-Expfloat = r'[0-9](?:_?[0-9])*' + Exponent
-HexExponent = r'[pP]' + ExponentSuffix
-Hexfloat = r'0[xX]' + group(r'[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?',
-                            r'\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*') + HexExponent
-Floatnumber = group(Hexfloat, Pointfloat, Expfloat) + maybe(FloatSuffix)
-Number = group(Floatnumber, Intnumber)
-
 # Return the empty string, plus all of the valid string prefixes.
 def combinations(*options: str) -> set:
     def combine(options: set) -> set:
@@ -195,107 +167,173 @@ def combinations(*options: str) -> set:
         options_set.add(elem)
     return combine(options_set)
 
-all_string_prefixes = combinations('r', 'f') + combinations('r', 'b') + {""}
-
-# Note that since _all_string_prefixes includes the empty string,
-#  StringPrefix can be the empty string (making it optional).
-StringPrefix = group(*all_string_prefixes)
-
-# Tail end of ' string.
-Single = r"[^'\\]*(?:\\.[^'\\]*)*'"
-# Tail end of " string.
-Double = r'[^"\\]*(?:\\.[^"\\]*)*"'
-# Tail end of ''' string.
-Single3 = r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''"
-# Tail end of """ string.
-Double3 = r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""'
-# Tail end of f' string.
-FSingle = r"[^'\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^'\\]*)*(?:%\{?|')"
-# Tail end of f" string.
-FDouble = r'[^"\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^"\\]*)*(?:%\{?|")'
-# Tail end of f''' string.
-FSingle3 = r"[^'\\%]*(?:(?:\\.|'(?!'')|%(?:%|n(?![\w$])))[^'\\]*)*(?:%\{?|''')"
-# Tail end of f""" string.
-FDouble3 = r'[^"\\%]*(?:(?:\\.|"(?!"")|%(?:%|n(?![\w$])))[^"\\]*)*(?:%\{?|""")'
-
-Triple = group(StringPrefix + "'''", StringPrefix + '"""')
-# Single-line ' or " string.
-String = group(StringPrefix + r"'[^\n'\\]*(?:\\.[^\n'\\]*)*'",
-               StringPrefix + r'"[^\n"\\]*(?:\\.[^\n"\\]*)*"')
-MultiLineCommentEnd = r'(?:[^*]|\*(?!/))*(?:\*/)'
-LambdaNewline = r'\s*' + group(
-                    SingleLineComment,
-                    r'(?:/\*(?:[^*]|\*(?!/))*\*/\s*)+(?:/\*(?:[^*]|\*(?!/))*|' + SingleLineComment + r')?'
-                ) + r'?\r?\n'
-ClassCreatorNewline = r'\s*\{' + group(
-                    SingleLineComment,
-                    r'(?:/\*(?:[^*]|\*(?!/))*\*/\s*)+(?:/\*(?:[^*]|\*(?!/))*|' + SingleLineComment + r')?'
-                ) + r'?\r?\n'
-
-# Because of leftmost-then-longest match semantics, be sure to put the
-# longest operators first (e.g., if = came before ==, == would get
-# recognized as two instances of =).
-Operator = group(r">>>?=", r"<<=?",
-                 r"->", r"::", r"&&", r"\|\|",
-                 r"\+\+", r"--",
-                 r"[-+*/%&|^=<>!]=?",
-                 r"~", r"\?")
-
-Bracket = r'[][(){}]'
-Special = group(r'\r?\n', r'\.\.\.', r'[:;.,@]')
-Funny = group(Operator, Bracket, Special)
-
-PlainToken = group(Number, Funny, String, Name)
-Token = Ignore + PlainToken
-
-# First (or only) line of ' or " string.
-NormalStringPrefix = group("", *combinations('r', 'b'))
-FStringPrefix = group(*combinations('r', 'f') - {'r', 'R'})
-ContStr = group(FStringPrefix + r"'[^\n'\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^\n'\\%]*)*" +
-                group("%", "'", r'\\\r?\n'),
-                FStringPrefix + r'"[^\n"\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^\n"\\%]*)*' +
-                group("%", '"', r'\\\r?\n'),
-                NormalStringPrefix + r"'[^\n'\\]*(?:\\.[^\n'\\]*)*" +
-                group("'", r'\\\r?\n'),
-                NormalStringPrefix + r'"[^\n"\\]*(?:\\.[^\n"\\]*)*' +
-                group('"', r'\\\r?\n'))
-PseudoExtras = group(r'\\\r?\n|\Z', Comment, Triple)
-PseudoToken = Whitespace + group(PseudoExtras, Number, Funny, ContStr, Name)
-FunnyNoBracket = group(Operator, r'[][(){]', Special)
-FStringSingleCont = r"\}" + FSingle[:-1] + r"|\\\r?\n)"
-FStringSinglePseudoToken = Whitespace + group(PseudoExtras, Number, FStringSingleCont, FunnyNoBracket, ContStr, Name)
-FStringDoubleCont = r'\}' + FDouble[:-1] + r"|\\\r?\n)"
-FStringDoublePseudoToken = Whitespace + group(PseudoExtras, Number, FStringDoubleCont, FunnyNoBracket, ContStr, Name)
-FStringSingle3Cont = r"\}" + FSingle3
-FStringSingle3PseudoToken = Whitespace + group(PseudoExtras, Number, FStringSingle3Cont, FunnyNoBracket, ContStr, Name)
-FStringDouble3Cont = r'\}' + FDouble3
-FStringDouble3PseudoToken = Whitespace + group(PseudoExtras, Number, FStringDouble3Cont, FunnyNoBracket, ContStr, Name)
-
-# For a given string prefix plus quotes, endpats maps it to a regex
-#  to match the remainder of that string. _prefix can be empty, for
-#  a normal single or triple quoted string (with no prefix).
-endpats = {}
-for _prefix in all_string_prefixes:
-    if 'f' in _prefix or 'F' in _prefix:
-        endpats[_prefix + "'"] = FSingle
-        endpats[_prefix + '"'] = FDouble
-        endpats[_prefix + "'''"] = FSingle3
-        endpats[_prefix + '"""'] = FDouble3
-    else:
-        endpats[_prefix + "'"] = Single
-        endpats[_prefix + '"'] = Double
-        endpats[_prefix + "'''"] = Single3
-        endpats[_prefix + '"""'] = Double3
-
-# A set of all of the single and triple quoted string prefixes,
-#  including the opening quotes.
-single_quoted = set()
-triple_quoted = set()
-for t in all_string_prefixes:
-    for u in (t + '"', t + "'"):
-        single_quoted.add(u)
-    for u in (t + '"""', t + "'''"):
-        triple_quoted.add(u)
+def _ordered(prefixes: set) -> list:
+    # The string prefixes in a fixed order, so that the patterns built from them are the same every time
+    return sorted(prefixes, key=lambda prefix: (-len(prefix), prefix))
+
+def _build_tables() -> dict:
+    """ Returns the patterns and string prefix tables of the tokenizer by name.
+        They are imported from javapy._tokenize_tables, a snapshot made by _write_tables(),
+        instead of being built each time this module is imported, so call _write_tables()
+        after changing them.
+    """
+    # Note: we use unicode matching for names ("\w") but ascii matching for
+    # number literals.
+    Whitespace = r'[ \f\t]*'
+    SingleLineComment = r'//[^\r\n]*'
+    MultiLineComment = r'/\*(?:[^*]|\*(?!/))*'
+    Comment = group(SingleLineComment, MultiLineComment)
+    Ignore = Whitespace + any(r'\\\r?\n' + Whitespace) + maybe(Comment)
+    Name = r'(?:\w|\$)+'
+
+    FloatSuffix = r'[fFdD]'
+    IntSuffix = r'[lL]'
+
+    Hexnumber = r'0[xX][0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*' + maybe(IntSuffix)
+    Binnumber = r'0[bB][01]+(?:_+[01]+)*' + maybe(IntSuffix)
+    Octnumber = r'0_*[0-7]+(?:_+[0-7]+)*' + maybe(IntSuffix)
+    Decnumber = r'(?:0|[1-9][0-9]*(?:_+[0-9]+)*)' + r'[fFdDlL]?'
+    Intnumber = group(Hexnumber, Binnumber, Octnumber, Decnumber)
+    ExponentSuffix = r'[-+]?[0-9]+(?:_+[0-9]+)*'
+    Exponent = r'[eE]' + ExponentSuffix
+    Pointfloat = group(r'[0-9]+(?:_+[0-9]+)*\.(?:[0-9]+(?:_+[0-9]+)*)?',
+                       r'\.[0-9]+(?:_+[0-9]+)*') + maybe(Exponent)
+    Expfloat = r'[0-9](?:_?[0-9])*' + Exponent
+    HexExponent = r'[pP]' + ExponentSuffix
+    Hexfloat = r'0[xX]' + group(r'[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*\.(?:[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*)?',
+                                r'\.[0-9a-fA-F]+(?:_+[0-9a-fA-F]+)*') + HexExponent
+    Floatnumber = group(Hexfloat, Pointfloat, Expfloat) + maybe(FloatSuffix)
+    Number = group(Floatnumber, Intnumber)
+
+    all_string_prefixes = combinations('r', 'f') | combinations('r', 'b') | {""}
+
+    # Note that since _all_string_prefixes includes the empty string,
+    #  StringPrefix can be the empty string (making it optional).
+    StringPrefix = group(*_ordered(all_string_prefixes))
+
+    # Tail end of ' string.
+    Single = r"[^'\\]*(?:\\.[^'\\]*)*'"
+    # Tail end of " string.
+    Double = r'[^"\\]*(?:\\.[^"\\]*)*"'
+    # Tail end of ''' string.
+    Single3 = r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''"
+    # Tail end of """ string.
+    Double3 = r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""'
+    # Tail end of f' string.
+    FSingle = r"[^'\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^'\\]*)*(?:%\{?|')"
+    # Tail end of f" string.
+    FDouble = r'[^"\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^"\\]*)*(?:%\{?|")'
+    # Tail end of f''' string.
+    FSingle3 = r"[^'\\%]*(?:(?:\\.|'(?!'')|%(?:%|n(?![\w$])))[^'\\]*)*(?:%\{?|''')"
+    # Tail end of f""" string.
+    FDouble3 = r'[^"\\%]*(?:(?:\\.|"(?!"")|%(?:%|n(?![\w$])))[^"\\]*)*(?:%\{?|""")'
+
+    Triple = group(StringPrefix + "'''", StringPrefix + '"""')
+    # Single-line ' or " string.
+    String = group(StringPrefix + r"'[^\n'\\]*(?:\\.[^\n'\\]*)*'",
+                   StringPrefix + r'"[^\n"\\]*(?:\\.[^\n"\\]*)*"')
+    MultiLineCommentEnd = r'(?:[^*]|\*(?!/))*(?:\*/)'
+    LambdaNewline = r'\s*' + group(
+                        SingleLineComment,
+                        r'(?:/\*(?:[^*]|\*(?!/))*\*/\s*)+(?:/\*(?:[^*]|\*(?!/))*|' + SingleLineComment + r')?'
+                    ) + r'?\r?\n'
+    ClassCreatorNewline = r'\s*\{' + group(
+                        SingleLineComment,
+                        r'(?:/\*(?:[^*]|\*(?!/))*\*/\s*)+(?:/\*(?:[^*]|\*(?!/))*|' + SingleLineComment + r')?'
+                    ) + r'?\r?\n'
+
+    # Because of leftmost-then-longest match semantics, be sure to put the
+    # longest operators first (e.g., if = came before ==, == would get
+    # recognized as two instances of =).
+    Operator = group(r">>>?=", r"<<=?",
+                     r"->", r"::", r"&&", r"\|\|",
+                     r"\+\+", r"--",
+                     r"[-+*/%&|^=<>!]=?",
+                     r"~", r"\?")
+
+    Bracket = r'[][(){}]'
+    Special = group(r'\r?\n', r'\.\.\.', r'[:;.,@]')
+    Funny = group(Operator, Bracket, Special)
+
+    PlainToken = group(Number, Funny, String, Name)
+    Token = Ignore + PlainToken
+
+    # First (or only) line of ' or " string.
+    NormalStringPrefix = group("", *_ordered(combinations('r', 'b')))
+    FStringPrefix = group(*_ordered(combinations('r', 'f') - {'r', 'R'}))
+    ContStr = group(FStringPrefix + r"'[^\n'\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^\n'\\%]*)*" +
+                    group("%", "'", r'\\\r?\n'),
+                    FStringPrefix + r'"[^\n"\\%]*(?:(?:\\.|%(?:%|n(?![\w$])))[^\n"\\%]*)*' +
+                    group("%", '"', r'\\\r?\n'),
+                    NormalStringPrefix + r"'[^\n'\\]*(?:\\.[^\n'\\]*)*" +
+                    group("'", r'\\\r?\n'),
+                    NormalStringPrefix + r'"[^\n"\\]*(?:\\.[^\n"\\]*)*' +
+                    group('"', r'\\\r?\n'))
+    PseudoExtras = group(r'\\\r?\n|\Z', Comment, Triple)
+    PseudoToken = Whitespace + group(PseudoExtras, Number, Funny, ContStr, Name)
+    FunnyNoBracket = group(Operator, r'[][(){]', Special)
+    FStringSingleCont = r"\}" + FSingle[:-1] + r"|\\\r?\n)"
+    FStringSinglePseudoToken = Whitespace + group(PseudoExtras, Number, FStringSingleCont, FunnyNoBracket, ContStr, Name)
+    FStringDoubleCont = r'\}' + FDouble[:-1] + r"|\\\r?\n)"
+    FStringDoublePseudoToken = Whitespace + group(PseudoExtras, Number, FStringDoubleCont, FunnyNoBracket, ContStr, Name)
+    FStringSingle3Cont = r"\}" + FSingle3
+    FStringSingle3PseudoToken = Whitespace + group(PseudoExtras, Number, FStringSingle3Cont, FunnyNoBracket, ContStr, Name)
+    FStringDouble3Cont = r'\}' + FDouble3
+    FStringDouble3PseudoToken = Whitespace + group(PseudoExtras, Number, FStringDouble3Cont, FunnyNoBracket, ContStr, Name)
+
+    # For a given string prefix plus quotes, endpats maps it to a regex
+    #  to match the remainder of that string. _prefix can be empty, for
+    #  a normal single or triple quoted string (with no prefix).
+    endpats = {}
+    for _prefix in all_string_prefixes:
+        if 'f' in _prefix or 'F' in _prefix:
+            endpats[_prefix + "'"] = FSingle
+            endpats[_prefix + '"'] = FDouble
+            endpats[_prefix + "'''"] = FSingle3
+            endpats[_prefix + '"""'] = FDouble3
+        else:
+            endpats[_prefix + "'"] = Single
+            endpats[_prefix + '"'] = Double
+            endpats[_prefix + "'''"] = Single3
+            endpats[_prefix + '"""'] = Double3
+
+    # A set of all of the single and triple quoted string prefixes,
+    #  including the opening quotes.
+    single_quoted = set()
+    triple_quoted = set()
+    for t in all_string_prefixes:
+        for u in (t + '"', t + "'"):
+            single_quoted.add(u)
+        for u in (t + '"""', t + "'''"):
+            triple_quoted.add(u)
+
+    del _prefix, t, u
+    return locals()
+
+def _write_tables(path: str=None):
+    """ Writes the result of _build_tables() to javapy/_tokenize_tables.py, or to path. """
+    import os.path
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_tokenize_tables.py')
+    lines = ['"""',
+             'The patterns and string prefix tables of javapy.tokenize.',
+             'Generated by javapy.tokenize._write_tables(), do not edit.',
+             '"""']
+    for name, value in sorted(_build_tables().items()):
+        if isinstance(value, set):
+            value = '{' + ', '.join(repr(elem) for elem in sorted(value)) + '}'
+        elif isinstance(value, dict):
+            value = '{\n' + ''.join(f"    {key!r}: {elem!r},\n" for key, elem in sorted(value.items())) + '}'
+        else:
+            value = repr(value)
+        lines.append(f"{name} = {value}")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+
+try:
+    from javapy._tokenize_tables import *
+except ImportError:
+    globals().update(_build_tables())
 
 #endregion regexes
 
@@ -703,7 +741,7 @@ def _tokenize(readline, encoding):
         raise TokenError(f"scope error: {scope}", (lnum, 0))
 
 def main(args=None):
-    import sys, argparse
+    import io, sys, argparse
 
     # Helper error handling routines
     def perror(message):
@@ -730,23 +768,44 @@ def main(args=None):
                         help='Only print tokens starting on or after this line')
     parser.add_argument('-el', '--end-line', dest='end_line', type=int, default=-1,
                         help='Only print tokens ending on or before this line')
+    parser.add_argument('--profile', nargs='?', const='table', choices=('table', 'json'),
+                        help='print the wall and CPU time of reading, tokenizing and printing the input, and the number of tokens, to stderr as a table or as JSON')
     args = parser.parse_args(args)
 
+    from javapy.profiling import Profile
+    profile = Profile(args.filename or "<stdin>", counters=('tokens',))
+
     try:
         # Tokenize the input
         if args.filename:
             filename = args.filename
-            with open(filename, 'rb') as f:
-                tokens = list(tokenize(f.readline))
+            with profile.phase('read'), open(filename, 'rb') as f:
+                data = f.read()
+            with profile.phase('tokenize'):
+                tokens = list(tokenize(io.BytesIO(data).readline))
+        elif args.profile:
+            # Read all of stdin first so that waiting for it is not counted as tokenizing
+            filename = "<stdin>"
+            with profile.phase('read'):
+                text = sys.stdin.read()
+            with profile.phase('tokenize'):
+                tokens = list(_tokenize(io.StringIO(text).readline, None))
         else:
             filename = "<stdin>"
             tokens = _tokenize(sys.stdin.readline, None)
 
+        if args.profile:
+            profile.counters['tokens'] = len(tokens)
+
         if args.start_line != 0 or args.end_line != -1:
                 tokens = filter(lambda token: token.start[0] >= args.start_line and token.end[0] <= args.end_line, tokens)
 
         # Output the tokenization
-        print_tokens(tokens, args.exact)
+        with profile.phase('write'):
+            print_tokens(tokens, args.exact)
+
+        if args.profile:
+            profile.report(args.profile)
     except IndentationError as err:
         line, column = err.args[1][1:3]
         error(err.args[0], filename, (line, column))
@@ -1,13 +1,16 @@
-from typing import List, Set, Tuple, Iterable, Union, Optional
+from typing import List, Set, Tuple, Iterable, Union, Optional, FrozenSet, Any, TypeVar, get_type_hints
 from abc import ABC, abstractmethod
 try:
     from javapy.util import *
 except ImportError:
     from util import *
-from textwrap import indent, dedent
-from typeguard import check_type, check_argument_types
+from contextlib import contextmanager
 import re
+import os.path
+import bisect
 import functools
+import weakref
+import threading
 
 INDENT_WITH = '\t'
 
@@ -88,6 +91,324 @@ class Position:
 
 Position.NOPOS = Position(0, 0, '')
 
+class Emitter:
+    """ Writes the source code of Nodes to a text sink in a single pass.
+
+    Instead of every nested Node re-indenting the fully rendered text of its
+    children, the Emitter keeps the current indentation as state and adds it
+    to each line as the line is written. The output is identical to that of
+    ``textwrap.indent``: lines containing only whitespace are not indented.
+
+    When the sink is a list, the text written for each Node is remembered
+    by the Node, along with the indentation it was written at. Emitting the
+    Node again at the same indentation reuses that text instead of visiting
+    its children, until the Node or one of its descendants is changed.
+
+    :ivar sink: Where the text is written to. Either an object with a ``write``
+        method (such as a file or ``io.StringIO``) or a list, which gets
+        the written fragments appended to it.
+    """
+    LINEBREAK_REGEX = re.compile(r"[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+    def __init__(self, sink=None):
+        if sink is None:
+            sink = []
+        self.sink = sink
+        self._write = sink.append if isinstance(sink, list) else sink.write
+        self._memoize = isinstance(sink, list)
+        self._prefix = ''
+        self._bol = True
+        self._pending = ''
+
+    @property
+    def depth(self) -> int:
+        return len(self._prefix) // len(INDENT_WITH)
+
+    def write(self, text: str):
+        """ Writes text at the current indentation level. """
+        if not text:
+            return
+        if not self._bol and not Emitter.LINEBREAK_REGEX.search(text):
+            self._write(text)
+            return
+        for line in text.splitlines(True):
+            if self._bol:
+                if not line.strip():
+                    if Emitter.LINEBREAK_REGEX.match(line, len(line)-1):
+                        self._write(self._pending + line)
+                        self._pending = ''
+                    else:
+                        self._pending += line
+                    continue
+                self._write(self._prefix + self._pending + line)
+                self._pending = ''
+            else:
+                self._write(line)
+            self._bol = bool(Emitter.LINEBREAK_REGEX.match(line, len(line)-1))
+
+    def emit(self, node):
+        """ Writes the source code of the given Node. """
+        if not isinstance(node, Node):
+            self.write(str(node))
+        elif not self._memoize:
+            node.emit(self)
+        else:
+            state = (self._prefix, self._bol, self._pending)
+            rendered = node._rendered
+            if rendered is not None and rendered[0] == state:
+                self._write(rendered[1])
+                self._bol, self._pending = rendered[2]
+                return
+            sink = self.sink
+            start = len(sink)
+            node.emit(self)
+            text = ''.join(sink[start:])
+            del sink[start:]
+            sink.append(text)
+            object.__setattr__(node, '_rendered', (state, text, (self._bol, self._pending)))
+
+    def emit_all(self, nodes, separator: str):
+        """ Writes the source code of each of the given Nodes, separated by separator. """
+        first = True
+        for node in nodes:
+            if first:
+                first = False
+            else:
+                self.write(separator)
+            self.emit(node)
+
+    @contextmanager
+    def indented(self):
+        """ Indents everything written inside the with block by one more level. """
+        prefix = self._prefix
+        self._prefix = prefix + INDENT_WITH
+        try:
+            yield self
+        finally:
+            self._prefix = prefix
+
+    @contextmanager
+    def group(self):
+        """ Groups the soft line breaks written inside the with block, so that
+            either all or none of them are broken. The plain Emitter never
+            breaks them.
+        """
+        yield self
+
+    def softline(self, flat: str=' '):
+        """ Marks a place where the line may be broken. If it isn't, flat is written instead. """
+        self.write(flat)
+
+    def open_brace(self, leading: str=' '):
+        """ Writes the opening brace of a body, preceded by leading. """
+        self.write(leading + '{')
+
+    def brace_gap(self):
+        """ Writes the space between a closing brace and a following keyword, such as 'else'. """
+        self.write(' ')
+
+    def flush(self):
+        """ Writes out any whitespace still held back at the start of the current line. """
+        if self._pending:
+            self._write(self._pending)
+            self._pending = ''
+
+    def getvalue(self) -> str:
+        """ Returns everything written so far, if the sink is a list or has a getvalue() method. """
+        self.flush()
+        if isinstance(self.sink, list):
+            return ''.join(self.sink)
+        else:
+            return self.sink.getvalue()
+
+class PrettyEmitter(Emitter):
+    """ An Emitter which formats the source code to fit within a maximum line width,
+    so the output does not need to be run through a separate formatter.
+
+    Everything emitted is recorded as a stream of text, soft line breaks and groups,
+    which is laid out when the Emitter is flushed. A group is written on one line if
+    it fits in the remaining width, otherwise all of its soft line breaks are broken
+    and continuation lines are indented by ``continuation_indent`` extra levels.
+    The layout takes two linear passes over the stream, so formatting time grows
+    linearly with the size of the output.
+
+    :ivar width: The maximum line width
+    :vartype width: int
+
+    :ivar brace_style: ``'same-line'`` to put opening braces at the end of the line,
+        ``'next-line'`` to put them on a line of their own
+    :vartype brace_style: str
+
+    :ivar tab_width: How many columns a tab counts as when measuring lines
+    :vartype tab_width: int
+
+    :ivar continuation_indent: How many indentation levels are added to broken lines
+    :vartype continuation_indent: int
+    """
+    BRACE_STYLES = ('same-line', 'next-line')
+
+    _TEXT, _LINE, _BEGIN, _END, _INDENT, _DEDENT = range(6)
+
+    def __init__(self, sink=None, *, width: int=100, brace_style: str='same-line', tab_width: int=4, continuation_indent: int=2):
+        assert check_argument_types()
+        if brace_style not in PrettyEmitter.BRACE_STYLES:
+            raise ValueError(f"invalid brace style: {brace_style!r}")
+        if width <= 0:
+            raise ValueError("width must be positive")
+
+        super().__init__(sink)
+
+        self._memoize = False
+        self.width = width
+        self.brace_style = brace_style
+        self.tab_width = tab_width
+        self.continuation_indent = continuation_indent
+        self._tokens = []
+
+    def write(self, text: str):
+        if text:
+            self._tokens.append((PrettyEmitter._TEXT, text))
+
+    def softline(self, flat: str=' '):
+        self._tokens.append((PrettyEmitter._LINE, flat))
+
+    @contextmanager
+    def group(self):
+        self._tokens.append((PrettyEmitter._BEGIN, None))
+        try:
+            yield self
+        finally:
+            self._tokens.append((PrettyEmitter._END, None))
+
+    @contextmanager
+    def indented(self):
+        self._tokens.append((PrettyEmitter._INDENT, None))
+        try:
+            yield self
+        finally:
+            self._tokens.append((PrettyEmitter._DEDENT, None))
+
+    def open_brace(self, leading: str=' '):
+        if self.brace_style == 'next-line':
+            tokens = self._tokens
+            while tokens and tokens[-1][0] == PrettyEmitter._TEXT and tokens[-1][1][-1] == ' ':
+                text = tokens.pop()[1].rstrip(' ')
+                if text:
+                    tokens.append((PrettyEmitter._TEXT, text))
+                    break
+            self.write('\n{')
+        else:
+            self.write(leading + '{')
+
+    def brace_gap(self):
+        self.write('\n' if self.brace_style == 'next-line' else ' ')
+
+    def _visual_width(self, text: str) -> int:
+        return len(text) + text.count('\t')*(self.tab_width - 1)
+
+    def flush(self):
+        self._layout()
+        super().flush()
+
+    def _layout(self):
+        TEXT, LINE, BEGIN, END, INDENT, DEDENT = range(6)
+        tokens = self._tokens
+        self._tokens = []
+        if not tokens:
+            return
+
+        # First pass, right to left: the width of the text which follows each token
+        # up to the next point where the line can be broken, such as closing
+        # parentheses, semicolons and throws clauses. Like Wadler's fits, it ends at
+        # the next soft or hard line break, since a group only fits if that text
+        # fits on the same line.
+        trailing = [0]*len(tokens)
+        distance = 0
+        for i in reversed(range(len(tokens))):
+            kind, value = tokens[i]
+            if kind == TEXT:
+                newline = value.find('\n')
+                if newline >= 0:
+                    distance = self._visual_width(value[:newline])
+                else:
+                    distance += self._visual_width(value)
+            elif kind == LINE:
+                distance = 0
+            trailing[i] = distance
+
+        # Second pass: the width each group needs to be written on one line.
+        # A group containing a hard line break only needs its first line to fit.
+        needed = {}
+        open_groups = []
+        position = 0
+        for i, (kind, value) in enumerate(tokens):
+            if kind == TEXT:
+                newline = value.find('\n')
+                if newline >= 0:
+                    at = position + self._visual_width(value[:newline])
+                    for j in reversed(range(len(open_groups))):
+                        group = open_groups[j]
+                        if group[2] is not None:
+                            break
+                        group[2] = at - group[1]
+                position += self._visual_width(value)
+            elif kind == LINE:
+                position += len(value)
+            elif kind == BEGIN:
+                open_groups.append([i, position, None])
+            elif kind == END:
+                start, start_position, first_line = open_groups.pop()
+                if first_line is None:
+                    needed[start] = position - start_position + trailing[i]
+                else:
+                    needed[start] = first_line
+
+        # Third pass: write everything out, deciding for each group whether it fits.
+        continuation = INDENT_WITH*self.continuation_indent
+        column = None
+        flat_depth = 0
+        broken = []
+        write = super().write
+        for i, (kind, value) in enumerate(tokens):
+            if kind == TEXT or kind == LINE and (flat_depth or not broken):
+                write(value)
+                newline = value.rfind('\n')
+                if newline >= 0:
+                    tail = value[newline+1:]
+                    column = self._visual_width(self._prefix + tail) if tail else None
+                elif column is None:
+                    column = self._visual_width(self._prefix + value)
+                else:
+                    column += self._visual_width(value)
+            elif kind == LINE:
+                write('\n')
+                column = None
+            elif kind == BEGIN:
+                if flat_depth:
+                    flat_depth += 1
+                else:
+                    at = self._visual_width(self._prefix) if column is None else column
+                    if at + needed[i] <= self.width:
+                        flat_depth = 1
+                    else:
+                        broken.append(self._prefix)
+                        self._prefix += continuation
+            elif kind == END:
+                if flat_depth:
+                    flat_depth -= 1
+                else:
+                    self._prefix = broken.pop()
+            elif kind == INDENT:
+                self._prefix += INDENT_WITH
+            elif kind == DEDENT:
+                self._prefix = self._prefix[:-len(INDENT_WITH)]
+
+def pretty_str(node, *, width: int=100, brace_style: str='same-line', tab_width: int=4, continuation_indent: int=2) -> str:
+    """ Returns the source code of the given Node, formatted by a PrettyEmitter. """
+    out = PrettyEmitter(width=width, brace_style=brace_style, tab_width=tab_width, continuation_indent=continuation_indent)
+    out.emit(node)
+    return out.getvalue()
+
 def copy(node, parent=None):
     if node is None:
         return None
@@ -98,21 +419,172 @@ def copy(node, parent=None):
     else:
         return node
 
+def _clone(root: 'Node', parent: Optional['Node']) -> 'Node':
+    new_object = object.__new__
+    set_slot = object.__setattr__
+    # Copies whose fields still refer to the original Node's children
+    pending = []
+
+    def clone_node(node, parent):
+        new = new_object(type(node))
+        # How a Node is rendered can depend on its parent, as with an else if, so only the
+        # rendered text of Nodes whose parent is a copy of the original parent is kept
+        set_slot(new, '_rendered', None if node is root else node._rendered)
+        set_slot(new, '_hash', node._hash)
+        set_slot(new, '_parent', _ref(parent))
+        new.__dict__.update(node.__dict__)
+        pending.append((node, new))
+        return new
+
+    def clone_value(value, parent):
+        if isinstance(value, Node):
+            return clone_node(value, parent)
+        elif isinstance(value, NodeList):
+            nodelist = NodeList.__new__(NodeList)
+            set_slot(nodelist, '_list', [clone_value(elem, parent) for elem in value._list])
+            set_slot(nodelist, '_parent', _ref(parent))
+            return nodelist
+        elif isinstance(value, list):
+            return [clone_value(elem, parent) for elem in value]
+        else:
+            return value
+
+    result = clone_node(root, parent)
+    while pending:
+        node, new = pending.pop()
+        fields = new.__dict__
+        copies = {}
+        for key, value in fields.items():
+            if key != 'parent' and key != 'children':
+                fields[key] = clone_value(value, new)
+                if isinstance(value, Node):
+                    copies[id(value)] = fields[key]
+        children = NodeList.__new__(NodeList)
+        set_slot(children, '_list', [copies[id(child)] for child in node.children if id(child) in copies])
+        set_slot(children, '_parent', _ref(new))
+        fields['children'] = children
+    return result
+
+def _field_hash(value) -> int:
+    if isinstance(value, Node):
+        return value.structural_hash()
+    elif isinstance(value, list):
+        return hash(tuple(_field_hash(elem) for elem in value))
+    try:
+        return hash(value)
+    except TypeError:
+        return hash(repr(value))
+
+def _ref(node: Optional['Node']):
+    return None if node is None else weakref.ref(node)
+
 class Node(ABC):
+    __slots__ = ('_rendered', '_hash', '_parent')
+
     def __init__(self, parent: Optional['Node']=None):
         assert check_argument_types()
         # check_type('parent', parent, Optional[Node])
 
+        object.__setattr__(self, '_rendered', None)
+        object.__setattr__(self, '_hash', None)
+        object.__setattr__(self, '_parent', None)
+
         self.parent: Node = parent
         
-        self.children = NodeList()
+        self.children = NodeList([], self)
+
+    @property
+    def parent(self) -> Optional['Node']:
+        """ The Node this Node is a child of. It is only weakly referenced, so that a tree has
+            no reference cycles and is freed as soon as nothing refers to its root.
+        """
+        ref = self._parent
+        return None if ref is None else ref()
+
+    @parent.setter
+    def parent(self, value: Optional['Node']):
+        object.__setattr__(self, '_parent', _ref(value))
+
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_rendered', None)
+        object.__setattr__(self, '_hash', None)
+        object.__setattr__(self, '_parent', None)
+        self.__dict__.update(state)
+        # Weak references cannot be pickled, so the children are given their parent again
+        ref = weakref.ref(self)
+        stack = list(state.values())
+        while stack:
+            value = stack.pop()
+            if isinstance(value, Node):
+                object.__setattr__(value, '_parent', ref)
+            elif isinstance(value, NodeList):
+                object.__setattr__(value, '_parent', ref)
+                stack.extend(value._list)
+            elif isinstance(value, list):
+                stack.extend(value)
 
     def copy(self, parent=None):
-        elems = {'parent': parent}
-        for key, value in self.__dict__.items():
-            if key not in ('parent', 'children') and key[0] != '_':
-                elems[key] = copy(value)
-        return type(self)(**elems) 
+        """ Returns a deep copy of this Node whose parent is the given Node.
+            The copy is built directly from the fields of this Node and its descendants,
+            without running their constructors, and keeps their rendered source code and
+            structural hashes.
+        """
+        return _clone(self, parent)
+
+    def snapshot(self) -> 'Snapshot':
+        """ Returns a Snapshot of the tree rooted at this Node, which it can later be restored to. """
+        return Snapshot(self)
+
+    def emit(self, out: Emitter):
+        """ Writes this Node's source code to the given Emitter.
+            Nodes whose source code contains indented lines override this instead of __str__.
+        """
+        out.write(str(self))
+
+    def render(self) -> str:
+        """ Returns this Node's source code, rendered by an Emitter. """
+        out = Emitter()
+        out.emit(self)
+        return out.getvalue()
+
+    def invalidate(self):
+        """ Discards the source code and structural hash remembered by this Node and all
+            of its ancestors. Called whenever this Node is changed.
+        """
+        node = self
+        while node is not None:
+            object.__setattr__(node, '_rendered', None)
+            object.__setattr__(node, '_hash', None)
+            node = node.parent
+
+    def structural_hash(self) -> int:
+        """ Returns a hash of this Node's type and fields, built from the structural hashes
+            of its children. It is remembered until this Node or one of its descendants changes,
+            so Nodes which compare equal always have the same structural hash.
+        """
+        if self._hash is not None:
+            return self._hash
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if node._hash is not None:
+                continue
+            if ready:
+                object.__setattr__(node, '_hash', node._compute_hash())
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in iter_child_nodes(node) if child._hash is None)
+        return self._hash
+
+    def _compute_hash(self) -> int:
+        """ Returns the structural hash of this Node, given that its children's are already known. """
+        return hash((type(self), tuple((key, _field_hash(value)) for key, value in self.__dict__.items() if key != 'parent' and key != 'children')))
+
+    def __hash__(self):
+        return self.structural_hash()
 
     @abstractmethod
     def __str__(self):
@@ -122,6 +594,8 @@ class Node(ABC):
         if self is other:
             return True
         if type(self) == type(other):
+            if self.structural_hash() != other.structural_hash():
+                return False
             keys = self.__dict__.keys()
             if keys != other.__dict__.keys():
                 return False
@@ -147,6 +621,8 @@ class Node(ABC):
     def __delattr__(self, name):
         if name == 'parent' or name == 'children':
             raise AttributeError(f"attribute {name!r} in {typename(self)} object cannot be deleted")
+        if _snapshots:
+            _record(self)
         if hasattr(self, name):
             oldval = getattr(self, name)
             if isinstance(oldval, Node):
@@ -170,8 +646,11 @@ class Node(ABC):
                 remove(oldval)
 
         super().__delattr__(name)
+        self.invalidate()
 
     def __setattr__(self, name, value):
+        if _snapshots and name not in Node.__slots__:
+            _record(self)
         if name != 'parent' and name != 'children':
             if isinstance(value, Node):
                 if hasattr(self, name):
@@ -195,6 +674,8 @@ class Node(ABC):
                         raise                
                 
         super().__setattr__(name, value)
+        if name != 'children' and name not in Node.__slots__:
+            self.invalidate()
 
 class NodeList(list):
     def __init__(self, value: List[Optional[Union[Node, list]]]=[], parent: Optional[Node]=None):
@@ -205,7 +686,9 @@ class NodeList(list):
         for i, value in enumerate(self._list):
             if isinstance(value, list):
                 self._list[i] = NodeList(value, parent)
-        self._parent = parent
+            elif value is not None and parent is not None:
+                value.parent = parent
+        self._parent = _ref(parent)
 
     def copy(self, parent=None):
         return [copy(elem, parent) for elem in self]
@@ -219,6 +702,11 @@ class NodeList(list):
     def __bool__(self):
         return bool(self._list)
 
+    def __reduce__(self):
+        # The elements live in _list, not in the list itself, so they are restored as state.
+        # The parent is restored by the Node which owns this NodeList.
+        return NodeList, (), {'_list': self._list}
+
     def __setattr__(self, name, value):
         if name == '_list':
             if hasattr(self, name) and getattr(self, name) is not None:
@@ -229,16 +717,24 @@ class NodeList(list):
         
     @property
     def parent(self):
-        return self._parent
+        ref = self._parent
+        return None if ref is None else ref()
+
+    def _invalidate(self):
+        parent = self.parent
+        if parent is not None:
+            parent.invalidate()
 
     @parent.setter
     def parent(self, value):
         if not isinstance(value, (Node, NoneType)):
             raise AttributeError(f'cannot change parent attribute of NodeList object to {typename(value)!r} instance')
+        if _snapshots:
+            _record(self)
         for elem in self._list:
             if elem is not None:
                 elem.parent = value
-        self._parent = value
+        self._parent = _ref(value)
 
     def __iter__(self):
         return iter(self._list)
@@ -256,6 +752,8 @@ class NodeList(list):
         return f"NodeList({self._list!r})"
 
     def __setitem__(self, index, value):
+        if _snapshots:
+            _record(self)
         if isinstance(index, slice):
             for elem in self._list[index]:
                 elem.parent = None
@@ -273,6 +771,7 @@ class NodeList(list):
             self._list[index] = value
             if value is not None:
                 value.parent = self.parent
+        self._invalidate()
 
     def __delattr__(self, name):
         if name == '_list' or name == '_parent':
@@ -280,6 +779,8 @@ class NodeList(list):
         super().__delattr__(name)
 
     def __delitem__(self, index):
+        if _snapshots:
+            _record(self)
         if isinstance(index, slice):
             for elem in self._list[index]:
                 elem.parent = None
@@ -290,6 +791,7 @@ class NodeList(list):
         else:
             self._list[index].parent = None
             del self._list[index]
+        self._invalidate()
 
     def __eq__(self, other):
         if other is self:
@@ -299,6 +801,9 @@ class NodeList(list):
         else:
             return self._list == other
 
+    def __ne__(self, other):
+        return not self == other
+
     def __contains__(self, other):
         for item in self:
             if item == other:
@@ -307,12 +812,17 @@ class NodeList(list):
 
     def append(self, element):
         """ Append object to the end of the list. """
+        if _snapshots:
+            _record(self)
         self._list.append(element)
         if element is not None:
             element.parent = self.parent
+        self._invalidate()
 
     def extend(self, iterable):
         """ Extend list by appending elements from the iterable. """
+        if _snapshots:
+            _record(self)
         oldlen = len(self._list)
         self._list.extend(iterable)
         newlen = len(self._list)
@@ -321,14 +831,18 @@ class NodeList(list):
             if elem is not None:
                 check_type(f"iterable[{i}]", elem, Node)
                 elem.parent = self.parent
+        self._invalidate()
 
     def clear(self):
         """ Remove all items from list. """
+        if _snapshots:
+            _record(self)
         for elem in self._list:
             if elem is not None:
                 elem.parent = None
 
         self._list.clear()
+        self._invalidate()
 
     def remove(self, value, all=True, by_instance=True):
         """ Remove occurrences of value.
@@ -337,6 +851,8 @@ class NodeList(list):
         """
         import operator
         equal = operator.is_ if by_instance else operator.eq
+        if _snapshots:
+            _record(self)
 
         for i in reversed(range(len(self._list))):
             elem = self[i]
@@ -344,6 +860,7 @@ class NodeList(list):
                 if isinstance(elem, Node):
                     elem.parent = None
                 del self._list[i]
+                self._invalidate()
                 if not all:
                     return
         else:
@@ -352,16 +869,22 @@ class NodeList(list):
         raise ValueError
 
     def pop(self, index=-1):
+        if _snapshots:
+            _record(self)
         removed = self._list.pop(index)
         if removed is not None:
             removed.parent = None
+        self._invalidate()
         return removed
 
     def insert(self, index, item):
         """ Insert item before index. """
+        if _snapshots:
+            _record(self)
         if item is not None:
             item.parent = self.parent
         self._list.insert(index, item)
+        self._invalidate()
 
     def index(self, x, start=None, end=None):
         if start is None:
@@ -377,16 +900,22 @@ class NodeList(list):
         return self._list.count(x)
 
     def sort(self, key=None, reverse=False):
-        self._list.sort(key, reverse)
+        if _snapshots:
+            _record(self)
+        self._list.sort(key=key, reverse=reverse)
+        self._invalidate()
 
     def reverse(self):
+        if _snapshots:
+            _record(self)
         self._list.reverse()
+        self._invalidate()
 
 
 class Name(Node):
     REGEX = re.compile(r"^[a-zA-Z_$][a-zA-Z_0-9$]*(?:\.[a-zA-Z_$][a-zA-Z_0-9$]*)*$")
 
-    def __init__(self, value, parent=None):
+    def __init__(self, value: Union[str, 'Name'], parent=None):
         if isinstance(value, Name):
             value = str(value)
         else:
@@ -398,9 +927,6 @@ class Name(Node):
 
         self.__strval: str = value
 
-    def copy(self, parent=None):
-        return Name(self.__strval, parent=parent)
-
     def accept(self, visitor, value):
         return visitor.visit_name(self, value)
 
@@ -483,6 +1009,9 @@ class Name(Node):
     def __hash__(self):
         return hash(self.__strval)
 
+    def _compute_hash(self):
+        return hash(self.__strval)
+
     def __eq__(self, other):
         return isinstance(other, Name) and str(self) == str(other) or str(self) == other
 
@@ -538,6 +1067,45 @@ class Name(Node):
             pass
         return result
 
+def emit_members(out: Emitter, members):
+    out.open_brace()
+    if members:
+        out.write('\n')
+        with out.indented():
+            out.emit_all(members, '\n')
+        out.write('\n}')
+    else:
+        out.write('}')
+
+def emit_list(out: Emitter, elements, open: str='(', close: str=')'):
+    """ Writes a comma-separated list of elements between open and close, breaking
+        the line after open and after each comma if the list does not fit.
+    """
+    out.write(open)
+    if elements:
+        with out.group():
+            out.softline('')
+            first = True
+            for element in elements:
+                if first:
+                    first = False
+                else:
+                    out.write(',')
+                    out.softline(' ')
+                out.emit(element)
+    out.write(close)
+
+def emit_type_list(out: Emitter, elements, close: str='>'):
+    """ Writes a list of type arguments or type parameters between angle brackets, like
+        emit_list, except that a list of one element is kept on the line of its brackets.
+    """
+    if len(elements) == 1:
+        out.write('<')
+        out.emit(elements[0])
+        out.write(close)
+    else:
+        emit_list(out, elements, '<', close)
+
 class CompilationUnit(Node):
     def __init__(self, *, package: Optional['Package']=None, imports: List['Import']=[], types: List['TypeDeclaration']=[], parent=None):
         assert check_argument_types()
@@ -559,22 +1127,25 @@ class CompilationUnit(Node):
     def accept(self, visitor, value):
         return visitor.visit_compilation_unit(self, value)
 
-    def __str__(self):
-        result = ""
+    def emit(self, out):
+        separate = False
         if self.package:
-            result = str(self.package)
+            out.emit(self.package)
+            separate = True
 
         if self.imports:
-            if result:
-                result += '\n\n'
-            result += '\n'.join(str(import_) for import_ in self.imports)
+            if separate:
+                out.write('\n\n')
+            out.emit_all(self.imports, '\n')
+            separate = True
 
         if self.types:
-            if result:
-                result += '\n\n'
-            result += '\n\n'.join(str(type_) for type_ in self.types)
+            if separate:
+                out.write('\n\n')
+            out.emit_all(self.types, '\n\n')
 
-        return result
+    def __str__(self):
+        return self.render()
 
 class Documented(ABC):
     DOCSTR_REGEX = re.compile(r"^/\*\*?((?:[^*]|\*(?!/))*)\*/$")
@@ -711,19 +1282,18 @@ class ModuleCompilationUnit(Named, Documented, Annotated, Node):
     def accept(self, visitor, value):
         return visitor.visit_module_compilation_unit(self, value)
         
-    def __str__(self):
-        result = '\n'.join(str(import_) for import_ in self.imports)
-        if result:
-            result += '\n\n'
-        result += self.doc_str() + self.anno_str()
+    def emit(self, out):
+        if self.imports:
+            out.emit_all(self.imports, '\n')
+            out.write('\n\n')
+        out.write(self.doc_str() + self.anno_str())
         if self.open:
-            result += "open "
-        result += f"module {self.name}"
-        if self.members:
-            result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-        else:
-            result += r' {}'
-        return result
+            out.write("open ")
+        out.write(f"module {self.name}")
+        emit_members(out, self.members)
+
+    def __str__(self):
+        return self.render()
 
 class Declaration(Annotated):
     @abstractmethod
@@ -940,6 +1510,10 @@ class GenericDeclaration(Declaration):
         else:
             return ""
 
+    def emit_typeparams(self, out: Emitter, close: str='>'):
+        if self.typeparams:
+            emit_type_list(out, self.typeparams, close)
+
 class Statement(Node): pass
 
 class ClassDeclaration(TypeDeclaration, GenericDeclaration, Statement):
@@ -957,17 +1531,19 @@ class ClassDeclaration(TypeDeclaration, GenericDeclaration, Statement):
     def accept(self, visitor, value):
         return visitor.visit_class_declaration(self, value)
 
-    def __str__(self):
-        result = f"{self.doc_str()}{self.anno_str()}{self.mod_str()}class {self.name}{self.typeparams_str()}"
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}class {self.name}")
+        self.emit_typeparams(out)
         if self.superclass:
-            result += f" extends {self.superclass}"
+            out.write(" extends ")
+            out.emit(self.superclass)
         if self.interfaces:
-            result += ' implements ' + ', '.join(str(interface) for interface in self.interfaces)
-        if self.members:
-            result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-        else:
-            result += r' {}'
-        return result
+            out.write(' implements ')
+            out.emit_all(self.interfaces, ', ')
+        emit_members(out, self.members)
+
+    def __str__(self):
+        return self.render()
 
 class InterfaceDeclaration(TypeDeclaration, GenericDeclaration):
     def __init__(self, *, name, typeparams=[], interfaces: List['GenericType']=[], members=[], doc=None, annotations=[], modifiers=[], parent=None):
@@ -982,27 +1558,27 @@ class InterfaceDeclaration(TypeDeclaration, GenericDeclaration):
     def accept(self, visitor, value):
         return visitor.visit_interface_declaration(self, value)
 
-    def __str__(self):
-        result = f"{self.doc_str()}{self.anno_str()}{self.mod_str()}interface {self.name}{self.typeparams_str()}"
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}interface {self.name}")
+        self.emit_typeparams(out)
         if self.interfaces:
-            result += ' extends ' + ', '.join(str(interface) for interface in self.interfaces)
-        if self.members:
-            result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-        else:
-            result += r' {}'
-        return result
+            out.write(' extends ')
+            out.emit_all(self.interfaces, ', ')
+        emit_members(out, self.members)
+
+    def __str__(self):
+        return self.render()
 
 class AnnotationDeclaration(TypeDeclaration):
     def accept(self, visitor, value):
         return visitor.visit_annotation_declaration(self, value)
 
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}@interface {self.name}")
+        emit_members(out, self.members)
+
     def __str__(self):
-        result = f"{self.doc_str()}{self.anno_str()}{self.mod_str()}@interface {self.name}"
-        if self.members:
-            result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-        else:
-            result += r' {}'
-        return result
+        return self.render()
 
 class EnumDeclaration(TypeDeclaration):
     def __init__(self, *, name, interfaces: List['GenericType']=[], fields: List['EnumField']=[], members=[], doc=None, annotations=[], modifiers=[], parent=None):
@@ -1018,20 +1594,27 @@ class EnumDeclaration(TypeDeclaration):
     def accept(self, visitor, value):
         return visitor.visit_enum_declaration(self, value)
 
-    def __str__(self):
-        result = f"{self.doc_str()}{self.anno_str()}{self.mod_str()}enum {self.name}"
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}enum {self.name}")
         if self.interfaces:
-            result += ' implements ' + ', '.join(str(interface) for interface in self.interfaces)
-        body = ""
-        if self.fields:
-            body += ',\n'.join(indent(str(field), INDENT_WITH) for field in self.fields)
-        if self.members:
-            body += ';\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members)
-        if body:
-            result += ' {\n' + body + '\n}'
+            out.write(' implements ')
+            out.emit_all(self.interfaces, ', ')
+        out.open_brace()
+        if self.fields or self.members:
+            out.write('\n')
+            if self.fields:
+                with out.indented():
+                    out.emit_all(self.fields, ',\n')
+            if self.members:
+                out.write(';\n')
+                with out.indented():
+                    out.emit_all(self.members, '\n')
+            out.write('\n}')
         else:
-            result += r' {}'
-        return result
+            out.write('}')
+
+    def __str__(self):
+        return self.render()
 
 class Modifier(Node):
     VALUES = {'public', 'private', 'protected', 'static', 'native', 'final', 'abstract', 'synchronized', 'strictfp', 'transient', 'volatile', 'default'}
@@ -1049,15 +1632,15 @@ class Modifier(Node):
     def accept(self, visitor, value):
         return visitor.visit_modifier(self, value)
 
-    def copy(self, parent=None):
-        return Modifier(self.__value, parent)
-
     def __str__(self):
         return self.__value
 
     def __hash__(self):
         return hash(self.__value)
 
+    def _compute_hash(self):
+        return hash(self.__value)
+
     def __eq__(self, other):
         return isinstance(other, Modifier) and str(self) == str(other) or str(self) == other
 
@@ -1078,16 +1661,15 @@ class EnumField(Node, Named, Member, Annotated):
     def accept(self, visitor, value):
         return visitor.visit_enum_field(self, value)
 
-    def __str__(self):
-        result = f"{self.doc_str()}{self.anno_str()}{self.name}"
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.name}")
         if self.args is not None:
-            result += '(' + ', '.join(str(arg) for arg in self.args) + ')'
+            emit_list(out, self.args)
         if self.members is not None:
-            if self.members:
-                result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-            else:
-                result += r' {}'
-        return result
+            emit_members(out, self.members)
+
+    def __str__(self):
+        return self.render()
 
 class VariableDeclaration(Statement, Documented, Declaration):
     def __init__(self, *, type: 'Type', declarators: List['VariableDeclarator'], doc=None, annotations=[], modifiers=[], parent=None):
@@ -1107,11 +1689,29 @@ class VariableDeclaration(Statement, Documented, Declaration):
     def accept(self, visitor, value):
         return visitor.visit_variable_declaration(self, value)
     
-    def __str__(self, newlines=True):
+    def emit(self, out, newlines=True, semicolon=True):
         if len(self.declarators) > 1 and isinstance(self.type, GenericType) and self.type.issimple and self.type.name == 'var':
-            prefix = f"{self.doc_str(newlines)}{self.anno_str(newlines)}{self.mod_str()}{self.type}"
-            return '; '.join(f"{prefix} {decl}" for decl in self.declarators) + ';'
-        return f"{self.doc_str(newlines)}{self.anno_str(newlines)}{self.mod_str()}{self.type} {', '.join(str(decl) for decl in self.declarators)};"
+            prefix = f"{self.doc_str(newlines)}{self.anno_str(newlines)}{self.mod_str()}{self.type} "
+            first = True
+            for decl in self.declarators:
+                if first:
+                    first = False
+                else:
+                    out.write('; ')
+                out.write(prefix)
+                out.emit(decl)
+        else:
+            out.write(f"{self.doc_str(newlines)}{self.anno_str(newlines)}{self.mod_str()}")
+            out.emit(self.type)
+            out.write(' ')
+            out.emit_all(self.declarators, ', ')
+        if semicolon:
+            out.write(';')
+
+    def __str__(self, newlines=True):
+        out = Emitter()
+        self.emit(out, newlines)
+        return out.getvalue()
 
 class VariableDeclarator(Node, Named, Dimension):
     def __init__(self, *, name, dimensions=[], init: Optional['Initializer']=None, parent=None):
@@ -1127,14 +1727,17 @@ class VariableDeclarator(Node, Named, Dimension):
     def accept(self, visitor, value):
         return visitor.visit_variable_declarator(self, value)
 
-    def __str__(self):
-        result = str(self.name) + self.dim_str()
+    def emit(self, out):
+        out.write(str(self.name) + self.dim_str())
         if self.init:
-            result += f" = {self.init}"
-        return result
+            out.write(" = ")
+            out.emit(self.init)
+
+    def __str__(self):
+        return self.render()
 
 class FunctionDeclaration(Named, Member, GenericDeclaration, Node):
-    def __init__(self, *, name, return_type: 'Type', params: list, typeparams=[], throws: List['GenericType']=[], body: Optional['Block']=None, doc=None, modifiers=[], annotations=[], parent=None):
+    def __init__(self, *, name, return_type: 'Type', params: List[Union['FormalParameter', 'ThisParameter']], typeparams=[], throws: List['GenericType']=[], body: Optional['Block']=None, doc=None, modifiers=[], annotations=[], parent=None):
         assert check_argument_types()
         # check_type('return_type', return_type, Type)
         # check_type('params', params, list)
@@ -1165,18 +1768,26 @@ class FunctionDeclaration(Named, Member, GenericDeclaration, Node):
         return f"{self.doc_str()}{self.anno_str()}{self.mod_str()}{self.typeparams_str()}{self.return_type} {self.name}" \
                  f"({', '.join(str(param) for param in self.params)})"
 
-    def __str__(self):
-        result = self.header
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}")
+        self.emit_typeparams(out)
+        out.emit(self.return_type)
+        out.write(f" {self.name}")
+        emit_list(out, self.params)
         if self.throws:
-            result += " throws " + ', '.join(str(exception) for exception in self.throws)
+            out.write(" throws ")
+            out.emit_all(self.throws, ', ')
         if self.body:
-            result += f' {self.body}'
+            out.write(' ')
+            out.emit(self.body)
         else:
-            result += ';'
-        return result
+            out.write(';')
+
+    def __str__(self):
+        return self.render()
 
 class ConstructorDeclaration(Named, Member, GenericDeclaration, Node):
-    def __init__(self, *, name, params: list, typeparams=[], throws: List['GenericType']=[], body: Optional['Block']=None, doc=None, modifiers=[], annotations=[], parent=None):
+    def __init__(self, *, name, params: List[Union['FormalParameter', 'ThisParameter']], typeparams=[], throws: List['GenericType']=[], body: Optional['Block']=None, doc=None, modifiers=[], annotations=[], parent=None):
         assert check_argument_types()
         # check_type('params', params, list)
         if len(params) > 0 and isinstance(params[0], ThisParameter):
@@ -1205,15 +1816,22 @@ class ConstructorDeclaration(Named, Member, GenericDeclaration, Node):
         return f"{self.doc_str()}{self.anno_str()}{self.mod_str()}{self.typeparams_str()}{self.name}" \
                  f"({', '.join(str(param) for param in self.params)})"
 
-    def __str__(self):
-        result = self.header
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}")
+        self.emit_typeparams(out)
+        out.write(str(self.name))
+        emit_list(out, self.params)
         if self.throws:
-            result += " throws " + ', '.join(str(exception) for exception in self.throws)
+            out.write(" throws ")
+            out.emit_all(self.throws, ', ')
         if self.body:
-            result += f' {self.body}'
+            out.write(' ')
+            out.emit(self.body)
         else:
-            result += ';'
-        return result
+            out.write(';')
+
+    def __str__(self):
+        return self.render()
 
 class AnnotationProperty(Named, Declaration, Member, Dimension, Node):
     def __init__(self, *, type: 'Type', name, default: Optional['AnnotationValue']=None, dimensions=[], doc=None, annotations=[], modifiers=[], parent=None):
@@ -1257,8 +1875,13 @@ class FormalParameter(Named, Declaration, Dimension, Node):
     def accept(self, visitor, value):
         return visitor.visit_formal_parameter(self, value)
 
+    def emit(self, out):
+        out.write(f"{self.anno_str(newlines=False)}{self.mod_str()}")
+        out.emit(self.type)
+        out.write(f"{'...' if self.variadic else ''} {self.name}{self.dim_str()}")
+
     def __str__(self):
-        return f"{self.anno_str(newlines=False)}{self.mod_str()}{self.type}{'...' if self.variadic else ''} {self.name}{self.dim_str()}"
+        return self.render()
 
 class ThisParameter(Annotated, Node):
     def __init__(self, *, type: 'Type', qualifier: Optional[Name]=None, annotations=[], parent=None):
@@ -1275,12 +1898,13 @@ class ThisParameter(Annotated, Node):
     def accept(self, visitor, value):
         return visitor.visit_this_parameter(self, value)
 
+    def emit(self, out):
+        out.write(self.anno_str(newlines=False))
+        out.emit(self.type)
+        out.write(f" {self.qualifier}.this" if self.qualifier else " this")
+
     def __str__(self):
-        result = f"{self.anno_str(newlines=False)}{self.type} "
-        if self.qualifier:
-            result += f"{self.qualifier}."
-        result += "this"
-        return result
+        return self.render()
 
 class InitializerBlock(Member, Node):
     def __init__(self, *, body: 'Block', static: bool, doc=None, parent=None):
@@ -1297,11 +1921,15 @@ class InitializerBlock(Member, Node):
     def accept(self, visitor, value):
         return visitor.visit_initializer_block(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.static:
-            return f"{self.doc_str()}static {self.body}"
+            out.write(f"{self.doc_str()}static ")
         else:
-            return f"{self.doc_str()}{self.body}"
+            out.write(self.doc_str())
+        out.emit(self.body)
+
+    def __str__(self):
+        return self.render()
 
 class FieldDeclaration(Declaration, Member, Node):
     def __init__(self, *, type: 'Type', declarators: List[VariableDeclarator], doc=None, annotations=[], modifiers=[], parent=None):
@@ -1321,11 +1949,18 @@ class FieldDeclaration(Declaration, Member, Node):
     def accept(self, visitor, value):
         return visitor.visit_field_declaration(self, value)
     
+    def emit(self, out):
+        out.write(f"{self.doc_str()}{self.anno_str()}{self.mod_str()}")
+        out.emit(self.type)
+        out.write(' ')
+        out.emit_all(self.declarators, ', ')
+        out.write(';')
+
     def __str__(self):
-        return f"{self.doc_str()}{self.anno_str()}{self.mod_str()}{self.type} {', '.join(str(decl) for decl in self.declarators)};"
+        return self.render()
 
 class TypeArgument(Node, Annotated):
-    def __init__(self, *, base: Optional[Union['GenericType', 'ArrayType', 'TypeUnion']]=None, bound=None, annotations=[], parent=None):
+    def __init__(self, *, base: Optional[Union['GenericType', 'ArrayType', 'TypeUnion']]=None, bound: Optional[str]=None, annotations=[], parent=None):
         assert check_argument_types()
         # check_type('base', base, Optional[Union[GenericType, ArrayType, TypeUnion]])
         if base:
@@ -1345,11 +1980,14 @@ class TypeArgument(Node, Annotated):
     def accept(self, visitor, value):
         return visitor.visit_type_argument(self, value)
 
-    def __str__(self):
-        result = f'{self.anno_str(newlines=False)}?'
+    def emit(self, out):
+        out.write(f'{self.anno_str(newlines=False)}?')
         if self.base:
-            result += f" {self.bound} {self.base}"
-        return result
+            out.write(f" {self.bound} ")
+            out.emit(self.base)
+
+    def __str__(self):
+        return self.render()
 
 class TypeParameter(Node, Named, Annotated):
     def __init__(self, name, *, bound: Optional[Union['GenericType', 'ArrayType', 'TypeUnion']]=None, annotations=[], parent=None):
@@ -1365,11 +2003,14 @@ class TypeParameter(Node, Named, Annotated):
     def accept(self, visitor, value):
         return visitor.visit_type_parameter(self, value)
 
-    def __str__(self):
-        result = f"{self.anno_str(newlines=False)}{self.name}"
+    def emit(self, out):
+        out.write(f"{self.anno_str(newlines=False)}{self.name}")
         if self.bound:
-            result += f" extends {self.bound}"
-        return result
+            out.write(" extends ")
+            out.emit(self.bound)
+
+    def __str__(self):
+        return self.render()
 
 class Type(Node, Annotated):
     def __init__(self, annotations=[], parent=None):
@@ -1379,6 +2020,14 @@ class Type(Node, Annotated):
     def __eq__(self, other):
         return isinstance(other, str) and str(self) == other or super().__eq__(other)
 
+    def __hash__(self):
+        return self.structural_hash()
+
+    def _compute_hash(self):
+        # A Type is equal to its source code, so it must hash like it.
+        # Types which are structurally equal have the same source code too.
+        return hash(str(self))
+
 class PrimitiveType(Type):
     VALUES = {'boolean', 'byte', 'short', 'char', 'int', 'long', 'float', 'double'}
 
@@ -1406,10 +2055,6 @@ class VoidType(Type):
     def accept(self, visitor, value):
         return visitor.visit_void_type(self, value)
 
-    def copy(self, parent=None):
-        return VoidType(annotations=copy(self.annotations),
-                        parent=parent)
-
     def __str__(self):
         return self.anno_str(newlines=False) + 'void'
 
@@ -1432,8 +2077,13 @@ class ArrayType(Type, Dimension):
     def name(self):
         return self.base.name + '[]'*len(self.dimensions)
 
+    def emit(self, out):
+        out.write(self.anno_str(newlines=False))
+        out.emit(self.base)
+        out.write(self.dim_str())
+
     def __str__(self):
-        return f"{self.anno_str(newlines=False)}{self.base}{self.dim_str()}"
+        return self.render()
 
 class GenericType(Type):
     def __init__(self, name: Name, *, typeargs: Optional[List[Union['GenericType', ArrayType, TypeArgument]]]=None, container: Optional['GenericType']=None, annotations=[], parent=None):
@@ -1458,25 +2108,20 @@ class GenericType(Type):
         else:
             return str(self._name)
 
-    def copy(self, parent=None):
-        return GenericType(name=copy(self._name),
-                           typeargs=copy(self.typeargs),
-                           container=copy(self.container),
-                           annotations=copy(self.annotations),
-                           parent=parent)
-        
     @property
     def issimple(self):
         return self.typeargs is None and len(self.annotations) == 0 and (self.container is None or self.container.issimple)
 
-    def __str__(self):
-        result = self.anno_str(newlines=False) + self.name
+    def emit(self, out):
+        out.write(self.anno_str(newlines=False) + self.name)
         if self.typeargs is not None:
-            result += '<' + ', '.join(str(arg) for arg in self.typeargs) + '>'
-        return result
+            emit_type_list(out, self.typeargs)
+
+    def __str__(self):
+        return self.render()
 
 class TypeUnion(Type):
-    def __init__(self, *types, parent=None):
+    def __init__(self, *types: Union['GenericType', 'ArrayType', List[Union['GenericType', 'ArrayType']]], parent=None):
         check_type('types', types, Union[Tuple[List[Union[GenericType, ArrayType]]], Tuple[Union[GenericType, ArrayType], ...]])
         if len(types) == 1 and isinstance(types[0], list):
             types = types[0]
@@ -1496,11 +2141,14 @@ class TypeUnion(Type):
     def name(self):
         return ' & '.join(type_.name for type_ in self.types)
 
+    def emit(self, out):
+        out.emit_all(self.types, ' & ')
+
     def __str__(self):
-        return ' & '.join(str(type_) for type_ in self.types)
+        return self.render()
 
 class TypeIntersection(Type):
-    def __init__(self, *types, parent=None):
+    def __init__(self, *types: Union['GenericType', List['GenericType']], parent=None):
         check_type('types', types, Union[Tuple[List[GenericType]], Tuple[GenericType, ...]])
         if len(types) == 1 and isinstance(types[0], list):
             types = types[0]
@@ -1520,8 +2168,11 @@ class TypeIntersection(Type):
     def name(self):
         return ' | '.join(type_.name for type_ in self.types)
 
+    def emit(self, out):
+        out.emit_all(self.types, ' | ')
+
     def __str__(self):
-        return ' | '.join(str(type_) for type_ in self.types)
+        return self.render()
 
 class AnnotationValue(Node): pass
 
@@ -1578,8 +2229,11 @@ class ArrayInitializer(Initializer):
     def accept(self, visitor, value):
         return visitor.visit_array_initializer(self, value)
 
+    def emit(self, out):
+        emit_list(out, self.values, '{', '}')
+
     def __str__(self):
-        return '{' + ', '.join(str(init) for init in self.values) + '}'
+        return self.render()
 
 class Expression(Initializer): pass
 
@@ -1604,8 +2258,22 @@ class BinaryExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_binary_expression(self, value)
 
+    def emit(self, out):
+        # Left-nested chains such as a + b + c are written as one group, without recursing.
+        operands = []
+        expr = self
+        while isinstance(expr, BinaryExpression):
+            operands.append(expr)
+            expr = expr.lhs
+        with out.group():
+            out.emit(expr)
+            for expr in reversed(operands):
+                out.softline(' ')
+                out.write(expr.op + ' ')
+                out.emit(expr.rhs)
+
     def __str__(self):
-        return f"{self.lhs} {self.op} {self.rhs}"
+        return self.render()
 
 class UnaryExpression(Expression):
     OPS = {'!', '~', '+', '-'}
@@ -1625,8 +2293,12 @@ class UnaryExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_unary_expression(self, value)
 
+    def emit(self, out):
+        out.write(self.op)
+        out.emit(self.expr)
+
     def __str__(self):
-        return f"{self.op}{self.expr}"
+        return self.render()
 
 class ConditionalExpression(Expression):
     def __init__(self, *, condition: Expression, truepart: Expression, falsepart: Expression, parent=None):
@@ -1644,8 +2316,18 @@ class ConditionalExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_conditional_expression(self, value)
 
+    def emit(self, out):
+        with out.group():
+            out.emit(self.condition)
+            out.softline('')
+            out.write('? ')
+            out.emit(self.truepart)
+            out.softline(' ')
+            out.write(': ')
+            out.emit(self.falsepart)
+
     def __str__(self):
-        return f"{self.condition}? {self.truepart} : {self.falsepart}"
+        return self.render()
 
 class IncrementExpression(Expression):
     def __init__(self, *, op: str, expr: Expression, prefix: bool, parent=None):
@@ -1665,11 +2347,16 @@ class IncrementExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_increment_expression(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.prefix:
-            return f"{self.op}{self.expr}"
+            out.write(self.op)
+            out.emit(self.expr)
         else:
-            return f"{self.expr}{self.op}"
+            out.emit(self.expr)
+            out.write(self.op)
+
+    def __str__(self):
+        return self.render()
 
 class IndexExpression(Expression):
     def __init__(self, *, indexed: Expression, index: Expression, parent=None):
@@ -1685,8 +2372,14 @@ class IndexExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_index_expression(self, value)
 
+    def emit(self, out):
+        out.emit(self.indexed)
+        out.write('[')
+        out.emit(self.index)
+        out.write(']')
+
     def __str__(self):
-        return f"{self.indexed}[{self.index}]"
+        return self.render()
 
 class CastExpression(Expression):
     def __init__(self, *, type: Type, expr: Expression, parent=None):
@@ -1702,8 +2395,14 @@ class CastExpression(Expression):
     def accept(self, visitor, value):
         return visitor.visit_cast_expression(self, value)
 
+    def emit(self, out):
+        out.write('(')
+        out.emit(self.type)
+        out.write(')')
+        out.emit(self.expr)
+
     def __str__(self):
-        return f"({self.type}){self.expr}"
+        return self.render()
 
 class Assignment(Expression):
     OPS = {'=', '+=', '-=', '*=', '/=', '%=', '^=', '&=', '|=', '<<=', '>>=', '>>>='}
@@ -1725,8 +2424,13 @@ class Assignment(Expression):
     def accept(self, visitor, value):
         return visitor.visit_assignment(self, value)
 
+    def emit(self, out):
+        out.emit(self.lhs)
+        out.write(f" {self.op} ")
+        out.emit(self.rhs)
+
     def __str__(self):
-        return f"{self.lhs} {self.op} {self.rhs}"
+        return self.render()
 
 class MemberAccess(Expression):
     def __init__(self, *, object: Optional[Expression]=None, name: Name, parent=None):
@@ -1750,11 +2454,14 @@ class MemberAccess(Expression):
     def isfield(self):
         return self.object is not None or self.name.isdotted
 
-    def __str__(self):
+    def emit(self, out):
         if self.object:
-            return f"{self.object}.{self.name}"
-        else:
-            return str(self.name)
+            out.emit(self.object)
+            out.write('.')
+        out.write(str(self.name))
+
+    def __str__(self):
+        return self.render()
 
 class FunctionCall(Expression):
     def __init__(self, *, object: Optional[Expression]=None, name: Name, args: List[Expression]=[], typeargs: List[Union[GenericType, ArrayType, TypeArgument]]=[], parent=None):
@@ -1782,15 +2489,17 @@ class FunctionCall(Expression):
     def ismethod(self):
         return self.object is not None or self.name.isdotted
 
-    def __str__(self):
-        if self.typeargs:
-            result = '<' + ', '.join(str(arg) for arg in self.typeargs) + '>'
-        else:
-            result = ""
-        result += f"{self.name}({', '.join(str(arg) for arg in self.args)})"
+    def emit(self, out):
         if self.object:
-            result = f"{self.object}.{result}"
-        return result
+            out.emit(self.object)
+            out.write('.')
+        if self.typeargs:
+            emit_type_list(out, self.typeargs)
+        out.write(str(self.name))
+        emit_list(out, self.args)
+
+    def __str__(self):
+        return self.render()
 
 class ThisCall(Expression):
     def __init__(self, *, object: Optional[Expression]=None, args: List[Expression]=[], typeargs: List[Union[GenericType, ArrayType, TypeArgument]]=[], parent=None):
@@ -1812,15 +2521,17 @@ class ThisCall(Expression):
     def issimple(self):
         return self.object is None and not self.typeargs
 
-    def __str__(self):
-        if self.typeargs:
-            result = '<' + ', '.join(str(arg) for arg in self.typeargs) + '>'
-        else:
-            result = ""
-        result += f"this({', '.join(str(arg) for arg in self.args)})"
+    def emit(self, out):
         if self.object:
-            result = f"{self.object}.{result}"
-        return result
+            out.emit(self.object)
+            out.write('.')
+        if self.typeargs:
+            emit_type_list(out, self.typeargs)
+        out.write('this')
+        emit_list(out, self.args)
+
+    def __str__(self):
+        return self.render()
 
 class SuperCall(Expression):
     def __init__(self, *, object: Optional[Expression]=None, args: List[Expression]=[], typeargs: List[Union[GenericType, ArrayType, TypeArgument]]=[], parent=None):
@@ -1842,15 +2553,17 @@ class SuperCall(Expression):
     def issimple(self):
         return self.object is None and not self.typeargs
 
-    def __str__(self):
-        if self.typeargs:
-            result = '<' + ', '.join(str(arg) for arg in self.typeargs) + '>'
-        else:
-            result = ""
-        result += f"super({', '.join(str(arg) for arg in self.args)})"
+    def emit(self, out):
         if self.object:
-            result = f"{self.object}.{result}"
-        return result
+            out.emit(self.object)
+            out.write('.')
+        if self.typeargs:
+            emit_type_list(out, self.typeargs)
+        out.write('super')
+        emit_list(out, self.args)
+
+    def __str__(self):
+        return self.render()
 
 class Literal(Expression):
     def __init__(self, value: str, *, parent=None):
@@ -1960,8 +2673,12 @@ class TypeLiteral(Expression):
     def accept(self, visitor, value):
         return visitor.visit_type_literal(self, value)
 
+    def emit(self, out):
+        out.emit(self.type)
+        out.write(".class")
+
     def __str__(self):
-        return f"{self.type}.class"
+        return self.render()
 
 class ClassCreator(Expression):
     def __init__(self, *, type: GenericType, object: Optional[Expression]=None, args: List[Expression]=[], typeargs: List[Union[GenericType, ArrayType, TypeArgument]]=[], members: Optional[List[Member]]=None, parent=None):
@@ -1983,19 +2700,20 @@ class ClassCreator(Expression):
     def accept(self, visitor, value):
         return visitor.visit_class_creator(self, value)
 
-    def __str__(self):
-        result = "new "
+    def emit(self, out):
+        if self.object:
+            out.emit(self.object)
+            out.write('.')
+        out.write("new ")
         if self.typeargs:
-            result += '<' + ', '.join(str(arg) for arg in self.typeargs) + '> '
-        result += str(self.type) + '(' + ', '.join(str(arg) for arg in self.args) + ')'
+            emit_type_list(out, self.typeargs, '> ')
+        out.emit(self.type)
+        emit_list(out, self.args)
         if self.members is not None:
-            if self.members:
-                result += ' {\n' + '\n'.join(indent(str(member), INDENT_WITH) for member in self.members) + '\n}'
-            else:
-                result += r' {}'
-        if self.object:
-            result = f"{self.object}.{result}"
-        return result
+            emit_members(out, self.members)
+
+    def __str__(self):
+        return self.render()
 
 class ArrayCreator(Expression):
     def __init__(self, *, type: Type, dimensions: List['DimensionExpression'], initializer: Optional[ArrayInitializer]=None, parent=None):
@@ -2015,11 +2733,16 @@ class ArrayCreator(Expression):
     def accept(self, visitor, value):
         return visitor.visit_array_creator(self, value)
     
-    def __str__(self):
-        result = f"new {self.type}" + ''.join(str(dim) for dim in self.dimensions)
+    def emit(self, out):
+        out.write("new ")
+        out.emit(self.type)
+        out.write(''.join(str(dim) for dim in self.dimensions))
         if self.initializer:
-            result += f" {self.initializer}"
-        return result
+            out.write(' ')
+            out.emit(self.initializer)
+
+    def __str__(self):
+        return self.render()
 
 class DimensionExpression(Node, Annotated):
     def __init__(self, *, annotations=[], size: Optional[Expression]=None, parent=None):
@@ -2045,7 +2768,7 @@ class DimensionExpression(Node, Annotated):
         return result
 
 class MethodReference(Expression):
-    def __init__(self, *, name, object: Union[Expression, GenericType, ArrayType], parent=None):
+    def __init__(self, *, name: Union[str, Name], object: Union[Expression, GenericType, ArrayType], parent=None):
         assert check_argument_types()
         if isinstance(name, str):
             if name != 'new':
@@ -2062,8 +2785,12 @@ class MethodReference(Expression):
     def accept(self, visitor, value):
         return visitor.visit_method_reference(self, value)
 
+    def emit(self, out):
+        out.emit(self.object)
+        out.write(f"::{self.name}")
+
     def __str__(self):
-        return f"{self.object}::{self.name}"
+        return self.render()
 
 class TypeTest(Expression):
     def __init__(self, *, type: Type, expr: Expression, parent=None):
@@ -2079,8 +2806,13 @@ class TypeTest(Expression):
     def accept(self, visitor, value):
         return visitor.visit_type_test(self, value)
 
+    def emit(self, out):
+        out.emit(self.expr)
+        out.write(" instanceof ")
+        out.emit(self.type)
+
     def __str__(self):
-        return f"{self.expr} instanceof {self.type}"
+        return self.render()
 
 class Parenthesis(Expression):
     def __init__(self, expr: Expression, *, parent=None):
@@ -2094,8 +2826,13 @@ class Parenthesis(Expression):
     def accept(self, visitor, value):
         return visitor.visit_parenthesis(self, value)
 
+    def emit(self, out):
+        out.write('(')
+        out.emit(self.expr)
+        out.write(')')
+
     def __str__(self):
-        return f"({self.expr})"
+        return self.render()
 
 class This(Expression):
     def __init__(self, *, object: Optional[Expression]=None, parent=None):
@@ -2109,11 +2846,14 @@ class This(Expression):
     def accept(self, visitor, value):
         return visitor.visit_this(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.object:
-            return f"{self.object}.this"
-        else:
-            return 'this'
+            out.emit(self.object)
+            out.write('.')
+        out.write('this')
+
+    def __str__(self):
+        return self.render()
 
 class Super(Expression):
     def __init__(self, *, object: Optional[Expression]=None, parent=None):
@@ -2127,11 +2867,14 @@ class Super(Expression):
     def accept(self, visitor, value):
         return visitor.visit_super(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.object:
-            return f"{self.object}.super"
-        else:
-            return 'super'
+            out.emit(self.object)
+            out.write('.')
+        out.write('super')
+
+    def __str__(self):
+        return self.render()
 
 class Lambda(Expression):
     def __init__(self, *, params: Union[List[Name], List[FormalParameter]], body: Union['Block', Expression], parent=None):
@@ -2147,13 +2890,16 @@ class Lambda(Expression):
     def accept(self, visitor, value):
         return visitor.visit_lambda(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if len(self.params) == 1 and isinstance(self.params[0], Name):
-            result = str(self.params[0])
+            out.write(str(self.params[0]))
         else:
-            result = '(' + ', '.join(str(param) for param in self.params) + ')'
-        result += f" -> {self.body}"
-        return result
+            emit_list(out, self.params)
+        out.write(" -> ")
+        out.emit(self.body)
+
+    def __str__(self):
+        return self.render()
 
 class ExpressionStatement(Statement):
     def __init__(self, expr: Expression, *, parent=None):
@@ -2167,8 +2913,12 @@ class ExpressionStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_expression_statement(self, value)
     
+    def emit(self, out):
+        out.emit(self.expr)
+        out.write(';')
+
     def __str__(self):
-        return f"{self.expr};"
+        return self.render()
 
 class EmptyStatement(Statement):
     def accept(self, visitor, value):
@@ -2191,17 +2941,30 @@ class LabeledStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_labeled_statement(self, value)
 
+    def emit(self, out):
+        out.write(f"{self.label}: ")
+        out.emit(self.stmt)
+
     def __str__(self):
-        return f"{self.label}: {self.stmt}"
+        return self.render()
 
-def format_body(body, newline_in_empty_body=False):
+def emit_body(out: Emitter, body, newline_in_empty_body=False):
     if isinstance(body, Block):
         if newline_in_empty_body and len(body.stmts) == 0:
-            return ' {\n}'
+            out.open_brace()
+            out.write('\n}')
         else:
-            return ' ' + str(body)
+            out.write(' ')
+            out.emit(body)
     else:
-        return '\n' + indent(str(body), INDENT_WITH)
+        out.write('\n')
+        with out.indented():
+            out.emit(body)
+
+def format_body(body, newline_in_empty_body=False):
+    out = Emitter()
+    emit_body(out, body, newline_in_empty_body)
+    return out.getvalue()
 
 class IfStatement(Statement):
     def __init__(self, *, condition: Expression, body: Statement, elsebody: Optional[Statement]=None, parent=None):
@@ -2219,18 +2982,24 @@ class IfStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_if_statement(self, value)
 
-    def __str__(self):
-        result = f"if({self.condition}){format_body(self.body, newline_in_empty_body=self.elsebody or isinstance(self.parent, IfStatement))}"
+    def emit(self, out):
+        out.write("if(")
+        out.emit(self.condition)
+        out.write(")")
+        emit_body(out, self.body, newline_in_empty_body=self.elsebody or isinstance(self.parent, IfStatement))
         if self.elsebody:
             if isinstance(self.body, Block):
-                result += " else"
+                out.brace_gap()
+                out.write("else ")
             else:
-                result += "\nelse"
+                out.write("\nelse ")
             if isinstance(self.elsebody, IfStatement):
-                result += f" {self.elsebody}"
+                out.emit(self.elsebody)
             else:
-                result += ' ' + format_body(self.elsebody, newline_in_empty_body=True)
-        return result
+                emit_body(out, self.elsebody, newline_in_empty_body=True)
+
+    def __str__(self):
+        return self.render()
 
 class Block(Statement):
     def __init__(self, stmts: List[Statement]=[], *, parent=None):
@@ -2244,11 +3013,18 @@ class Block(Statement):
     def accept(self, visitor, value):
         return visitor.visit_block(self, value)
 
-    def __str__(self):
+    def emit(self, out):
+        out.open_brace('')
         if self.stmts:
-            return '{\n' + '\n'.join(indent(str(stmt), INDENT_WITH) for stmt in self.stmts) + '\n}'
+            out.write('\n')
+            with out.indented():
+                out.emit_all(self.stmts, '\n')
+            out.write('\n}')
         else:
-            return r'{}'
+            out.write('}')
+
+    def __str__(self):
+        return self.render()
         
 class Switch(Statement, Expression):
     def __init__(self, *, condition: Expression, cases: List['SwitchCase'], parent=None):
@@ -2264,13 +3040,21 @@ class Switch(Statement, Expression):
     def accept(self, visitor, value):
         return visitor.visit_switch(self, value)
 
-    def __str__(self):
-        result = f"switch({self.condition}) {{"
+    def emit(self, out):
+        out.write("switch(")
+        out.emit(self.condition)
+        out.write(")")
+        out.open_brace()
         if self.cases:
-            result += '\n' + '\n'.join(indent(str(case), INDENT_WITH) for case in self.cases) + '\n}'
+            out.write('\n')
+            with out.indented():
+                out.emit_all(self.cases, '\n')
+            out.write('\n}')
         else:
-            result += '}'
-        return result
+            out.write('}')
+
+    def __str__(self):
+        return self.render()
 
 class SwitchCase(Node):
     def __init__(self, *, labels: Optional[List[Union[Name, Expression]]]=None, stmts: List[Statement], arrow: bool=False, parent=None):
@@ -2293,31 +3077,35 @@ class SwitchCase(Node):
     def accept(self, visitor, value):
         return visitor.visit_switch_case(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.arrow:
             if self.labels:
-                result = "case " + ', '.join(str(label) for label in self.labels) + ' -> '
+                out.write("case " + ', '.join(str(label) for label in self.labels) + ' -> ')
             else:
-                result = "default -> "
+                out.write("default -> ")
         else:
             if self.labels:
-                result = "case " + ', '.join(str(label) for label in self.labels) + ':'
+                out.write("case " + ', '.join(str(label) for label in self.labels) + ':')
             else:
-                result = "default:"
+                out.write("default:")
 
         if self.stmts:
             if self.arrow:
                 stmt = self.stmts[0]
                 if isinstance(stmt, Block) and len(stmt.stmts) == 0:
-                    result += '{\n}'
+                    out.open_brace('')
+                    out.write('\n}')
                 else:
-                    result += str(stmt)
+                    out.emit(stmt)
             elif len(self.stmts) == 1:
-                result += format_body(self.stmts[0], newline_in_empty_body=True)
+                emit_body(out, self.stmts[0], newline_in_empty_body=True)
             else:
-                result += '\n' + '\n'.join(indent(str(stmt), INDENT_WITH) for stmt in self.stmts)
-        
-        return result
+                out.write('\n')
+                with out.indented():
+                    out.emit_all(self.stmts, '\n')
+
+    def __str__(self):
+        return self.render()
 
 class ThrowStatement(Statement):
     def __init__(self, error: Expression, *, parent=None):
@@ -2331,8 +3119,13 @@ class ThrowStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_throw_statement(self, value)
 
+    def emit(self, out):
+        out.write("throw ")
+        out.emit(self.error)
+        out.write(';')
+
     def __str__(self):
-        return f"throw {self.error};"
+        return self.render()
 
 class ReturnStatement(Statement):
     def __init__(self, value: Optional[Expression]=None, *, parent=None):
@@ -2346,11 +3139,16 @@ class ReturnStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_return_statement(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.value:
-            return f"return {self.value};"
+            out.write("return ")
+            out.emit(self.value)
+            out.write(';')
         else:
-            return 'return;'
+            out.write('return;')
+
+    def __str__(self):
+        return self.render()
 
 class BreakStatement(Statement):
     def __init__(self, label: Optional[Name]=None, *, parent=None):
@@ -2402,8 +3200,13 @@ class YieldStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_yield_statement(self, value)
 
+    def emit(self, out):
+        out.write(f"{YieldStatement.KEYWORD} ")
+        out.emit(self.value)
+        out.write(';')
+
     def __str__(self):
-        return f"{YieldStatement.KEYWORD} {self.value};"
+        return self.render()
 
 class ForLoop(Statement):
     def __init__(self, *, control: Union['ForControl', 'EnhancedForControl'], body: Statement, parent=None):
@@ -2419,8 +3222,14 @@ class ForLoop(Statement):
     def accept(self, visitor, value):
         return visitor.visit_for_loop(self, value)
 
+    def emit(self, out):
+        out.write("for(")
+        out.emit(self.control)
+        out.write(")")
+        emit_body(out, self.body)
+
     def __str__(self):
-        return f"for({self.control}){format_body(self.body)}"
+        return self.render()
 
 class ForControl(Node):
     def __init__(self, *, init: Optional[Union[VariableDeclaration, 'ExpressionStatement']]=None, condition: Optional[Expression]=None, update: List[Expression]=[], parent=None):
@@ -2438,24 +3247,26 @@ class ForControl(Node):
     def accept(self, visitor, value):
         return visitor.visit_for_control(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if self.init:
             if isinstance(self.init, VariableDeclaration):
-                result = self.init.__str__(newlines=False)
+                self.init.emit(out, newlines=False)
             else:
-                result = str(self.init)
+                out.emit(self.init)
         else:
-            result = ';'
+            out.write(';')
 
         if self.condition:
-            result += f' {self.condition};'
-        else:
-            result += ';'
+            out.write(' ')
+            out.emit(self.condition)
+        out.write(';')
 
         if self.update:
-            result += ' ' + ', '.join(str(update) for update in self.update)
-        
-        return result
+            out.write(' ')
+            out.emit_all(self.update, ', ')
+
+    def __str__(self):
+        return self.render()
 
 class EnhancedForControl(Node):
     def __init__(self, *, var: VariableDeclaration, iterable: Expression, parent=None):
@@ -2475,10 +3286,13 @@ class EnhancedForControl(Node):
     def accept(self, visitor, value):
         return visitor.visit_enhanced_for_control(self, value)
 
+    def emit(self, out):
+        self.var.emit(out, semicolon=False)
+        out.write(" : ")
+        out.emit(self.iterable)
+
     def __str__(self):
-        result = str(self.var)[0:-1]
-        result += f" : {self.iterable}"
-        return result
+        return self.render()
 
 class WhileLoop(Statement):
     def __init__(self, *, condition: Expression, body: Statement, parent=None):
@@ -2494,8 +3308,14 @@ class WhileLoop(Statement):
     def accept(self, visitor, value):
         return visitor.visit_while_loop(self, value)
 
+    def emit(self, out):
+        out.write("while(")
+        out.emit(self.condition)
+        out.write(")")
+        emit_body(out, self.body)
+
     def __str__(self):
-        return f"while({self.condition}){format_body(self.body)}"
+        return self.render()
 
 class DoWhileLoop(Statement):
     def __init__(self, *, condition: Expression, body: Statement, parent=None):
@@ -2511,11 +3331,22 @@ class DoWhileLoop(Statement):
     def accept(self, visitor, value):
         return visitor.visit_do_while_loop(self, value)
 
-    def __str__(self):
+    def emit(self, out):
         if isinstance(self.body, Block):
-            return f"do{format_body(self.body, newline_in_empty_body=True)} while({self.condition});"
+            out.write("do")
+            emit_body(out, self.body, newline_in_empty_body=True)
+            out.brace_gap()
+            out.write("while(")
+            out.emit(self.condition)
+            out.write(");")
         else:
-            return "do\n" + indent(str(self.body), INDENT_WITH) + "\nwhile({self.condition});"
+            out.write("do\n")
+            with out.indented():
+                out.emit(self.body)
+            out.write("\nwhile({self.condition});")
+
+    def __str__(self):
+        return self.render()
 
 class SynchronizedBlock(Statement):
     def __init__(self, *, lock: Expression, body: Block, parent=None):
@@ -2531,8 +3362,14 @@ class SynchronizedBlock(Statement):
     def accept(self, visitor, value):
         return visitor.visit_synchronized_block(self, value)
 
+    def emit(self, out):
+        out.write("synchronized(")
+        out.emit(self.lock)
+        out.write(") ")
+        out.emit(self.body)
+
     def __str__(self):
-        return f"synchronized({self.lock}) {self.body}"
+        return self.render()
 
 class TryStatement(Statement):
     def __init__(self, *, resources: Optional[List[Union['TryResource', Expression]]]=None, body: Block, catches: List['CatchClause'], finallybody: Optional[Block]=None, parent=None):
@@ -2552,16 +3389,21 @@ class TryStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_try_statement(self, value)
 
-    def __str__(self):
-        result = "try"
+    def emit(self, out):
+        out.write("try")
         if self.resources is not None:
-            result += '(' + '; '.join(str(resource) for resource in self.resources) + ')'
-        result += format_body(self.body, newline_in_empty_body=self.catches or self.finallybody)
-        if self.catches:
-            result += ' ' + ' '.join(str(catch) for catch in self.catches)
+            out.write('(' + '; '.join(str(resource) for resource in self.resources) + ')')
+        emit_body(out, self.body, newline_in_empty_body=self.catches or self.finallybody)
+        for catch in self.catches:
+            out.brace_gap()
+            out.emit(catch)
         if self.finallybody:
-            result += ' finally' + format_body(self.finallybody, newline_in_empty_body=True)
-        return result
+            out.brace_gap()
+            out.write('finally')
+            emit_body(out, self.finallybody, newline_in_empty_body=True)
+
+    def __str__(self):
+        return self.render()
 
 class TryResource(Node, Named, Documented, Dimension, Declaration):
     def __init__(self, *, type: Type, name, dimensions=[], init: Expression, doc=None, modifiers=[], annotations=[], parent=None):
@@ -2598,8 +3440,12 @@ class CatchClause(Node):
     def accept(self, visitor, value):
         return visitor.visit_catch_clause(self, value)
 
+    def emit(self, out):
+        out.write(f"catch({self.var})")
+        emit_body(out, self.body, newline_in_empty_body=True)
+
     def __str__(self):
-        return f"catch({self.var})" + format_body(self.body, newline_in_empty_body=True)
+        return self.render()
     
 class CatchVar(Node, Named, Documented, Declaration):
     def __init__(self, *, name, type: Union[TypeIntersection, GenericType], doc=None, modifiers=[], annotations=[], parent=None):
@@ -2633,29 +3479,270 @@ class AssertStatement(Statement):
     def accept(self, visitor, value):
         return visitor.visit_assert_statement(self, value)
 
-    def __str__(self):
-        result = f"assert {self.condition}"
+    def emit(self, out):
+        out.write("assert ")
+        out.emit(self.condition)
         if self.message:
-            result += f" : {self.message}"
-        result += ';'
-        return result
+            out.write(" : ")
+            out.emit(self.message)
+        out.write(';')
+
+    def __str__(self):
+        return self.render()
+
+
+def _node_subclasses() -> List[type]:
+    """ Returns Node and all of its subclasses. """
+    result = [Node]
+    stack = [Node]
+    while stack:
+        for subclass in stack.pop().__subclasses__():
+            if subclass not in result:
+                result.append(subclass)
+                stack.append(subclass)
+    return result
+
+def _hinted_node_types(hint, subclasses: dict) -> Optional[set]:
+    """ Returns the Node classes a value of the given type hint can contain,
+        or None if it could contain any Node.
+    """
+    if isinstance(hint, type):
+        if hint is object or issubclass(hint, (list, tuple, set, dict)):
+            return None
+        if hint not in subclasses:
+            # Mixins such as Member are not Nodes, but their Node subclasses are
+            subclasses[hint] = {cls for cls in subclasses[Node] if issubclass(cls, hint)}
+        return subclasses[hint]
+    if hint is Any or isinstance(hint, TypeVar):
+        return None
+    args = getattr(hint, '__args__', None)
+    if not args:
+        return None
+    result = set()
+    for arg in args:
+        types = _hinted_node_types(arg, subclasses)
+        if types is None:
+            return None
+        result |= types
+    return result
 
+def _child_node_types(nodetype: type, subclasses: dict) -> Optional[set]:
+    """ Returns the Node classes which can be direct children of nodetype, judging by the
+        type hints of the parameters of its __init__ methods, or None if there could be any.
+    """
+    from inspect import signature
+    result = set()
+    annotated = set()
+    unannotated = set()
+    for base in nodetype.__mro__:
+        init = base.__dict__.get('__init__')
+        if init is None or base is object:
+            continue
+        try:
+            hints = get_type_hints(init)
+        except Exception:
+            hints = {}
+        for name, param in signature(init).parameters.items():
+            if name == 'self' or name == 'parent' or param.kind == param.VAR_KEYWORD or name in annotated:
+                continue
+            if name not in hints:
+                unannotated.add(name)
+                continue
+            annotated.add(name)
+            types = _hinted_node_types(hints[name], subclasses)
+            if types is None:
+                return None
+            result |= types
+    if unannotated - annotated:
+        return None
+    return result
+
+_reachability = {}
+
+def _build_reachability():
+    classes = _node_subclasses()
+    subclasses = {cls: {sub for sub in classes if issubclass(sub, cls)} for cls in classes}
+    everything = frozenset(classes)
+    children = {cls: _child_node_types(cls, subclasses) for cls in classes}
+
+    _reachability.clear()
+    for cls in classes:
+        reached = set()
+        stack = [cls]
+        while stack:
+            types = children[stack.pop()]
+            if types is None:
+                reached = everything
+                break
+            for child in types:
+                if child not in reached:
+                    reached.add(child)
+                    stack.append(child)
+        _reachability[cls] = frozenset(reached)
+
+    for visitor in [NodeVisitor, *_node_visitor_subclasses()]:
+        visitor._dispatch = {}
+        visitor._handled = None
+
+def _node_visitor_subclasses():
+    stack = [NodeVisitor]
+    while stack:
+        for subclass in stack.pop().__subclasses__():
+            yield subclass
+            stack.append(subclass)
+
+def reachable_node_types(nodetype: type) -> FrozenSet[type]:
+    """ Returns the Node classes which can appear anywhere below a Node of the given class.
+        The table is worked out once from the type hints of each class's __init__ parameters.
+    """
+    try:
+        return _reachability[nodetype]
+    except KeyError:
+        _build_reachability()
+        return _reachability[nodetype]
+
+def _child_refs(node: Node):
+    """ Returns (owner, key, child) for each child Node of node, in the order the
+        fields were assigned. owner is either node itself, with key the attribute
+        name, or a NodeList, with key the index in it.
+    """
+    refs = []
+    for name, value in node.__dict__.items():
+        if name == 'parent' or name == 'children':
+            continue
+        if isinstance(value, Node):
+            refs.append((node, name, value))
+        elif isinstance(value, NodeList):
+            lists = [value]
+            while lists:
+                nodelist = lists.pop()
+                for i, elem in enumerate(nodelist._list):
+                    if isinstance(elem, Node):
+                        refs.append((nodelist, i, elem))
+                    elif isinstance(elem, list):
+                        lists.append(elem)
+    return refs
+
+def iter_child_nodes(node: Node):
+    """ Yields the direct child Nodes of node, including the elements of its NodeList fields. """
+    for name, value in node.__dict__.items():
+        if name == 'parent' or name == 'children':
+            continue
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, NodeList):
+            lists = [value]
+            while lists:
+                nodelist = lists.pop()
+                for elem in nodelist._list:
+                    if isinstance(elem, Node):
+                        yield elem
+                    elif isinstance(elem, list):
+                        lists.append(elem)
+
+def _accept(visitor, node, value):
+    return node.accept(visitor, value)
+
+_SNAKE_CASE_REGEX = re.compile(r'(?<!^)(?=[A-Z])')
 
 class NodeVisitor:
+    """ Visits every Node of a tree in pre-order, calling the visit_* method for each
+    Node's type, and then in post-order, calling the leave_* method.
+
+    The traversal uses an explicit stack, so deeply nested trees do not hit the
+    recursion limit. Which methods handle which Node types is worked out once
+    per visitor class: types whose visit_* method is not overridden go
+    straight to visit_node(), and types with neither a leave_* method nor an
+    overridden leave_node() have nothing to do in post-order. The children of
+    a Node are skipped when none of the types the visitor handles can appear
+    below it, according to reachable_node_types().
+    """
+    _dispatch = {}
+    _handled = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+        cls._handled = None
+
+    @classmethod
+    def _handlers(cls, nodetype):
+        """ Returns the (visit, leave, descend) handlers for Nodes of the given type.
+            leave may be None, and descend is whether the Node's children need to be visited.
+        """
+        try:
+            return cls._dispatch[nodetype]
+        except KeyError:
+            pass
+
+        reachable = reachable_node_types(nodetype)
+        if cls._handled is None:
+            cls._handled = frozenset(other for other in _node_subclasses() if cls._handles(other))
+        descend = not cls._handled.isdisjoint(reachable)
+
+        visit, leave = cls._resolve(nodetype)
+        cls._dispatch[nodetype] = handlers = (visit, leave, descend)
+        return handlers
+
+    @classmethod
+    def _handles(cls, nodetype) -> bool:
+        """ Returns whether this visitor does anything for Nodes of the given type. """
+        visit, leave = cls._resolve(nodetype)
+        return leave is not None or visit is not NodeVisitor.visit_node and visit is not NodeModifier.visit_node
+
+    @classmethod
+    def _resolve(cls, nodetype):
+        """ Returns the (visit, leave) functions for Nodes of the given type. leave may be None. """
+        for base in nodetype.__mro__:
+            if 'accept' in base.__dict__:
+                name = _SNAKE_CASE_REGEX.sub('_', base.__name__).lower()
+                break
+        visit = getattr(cls, 'visit_' + name, None)
+        if visit is None:
+            visit = _accept
+        elif visit is getattr(NodeVisitor, 'visit_' + name, None):
+            visit = cls.visit_node
+        leave = getattr(cls, 'leave_' + name, None)
+        if leave is None:
+            leave = cls.leave_node
+        if leave is NodeVisitor.leave_node or leave is NodeModifier.leave_node:
+            leave = None
+        return visit, leave
+
     def __call__(self, node: Node, value=None):
         assert check_argument_types()
-        proceed = node.accept(self, value)
-        if not isinstance(proceed, bool):
-            raise TypeError('Node.accept(NodeVisitor) did not return True or False')
-        if proceed:
-            for child in node.children:
-                self(child, value)
+        dispatch = type(self)._dispatch
+        handlers = type(self)._handlers
+        stack = [node]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node = pop()
+            if type(node) is tuple:
+                leave, node = node
+                leave(self, node, value)
+                continue
+            visit, leave, descend = dispatch.get(type(node)) or handlers(type(node))
+            proceed = visit(self, node, value)
+            if not isinstance(proceed, bool):
+                raise TypeError('Node.accept(NodeVisitor) did not return True or False')
+            if leave is not None:
+                push((leave, node))
+            if proceed and descend:
+                children = list(iter_child_nodes(node))
+                children.reverse()
+                stack.extend(children)
         return value
 
     def visit_node(self, node: Node, value=None):
         """ The default method that is called whenever a Node does not override Node.accept() """
         return True
 
+    def leave_node(self, node: Node, value=None):
+        """ The default method that is called after a Node and its children have been visited,
+            unless there is a leave_* method for the Node's type.
+        """
+
   # ------------------------------------------------------------------------------------
 
     def visit_annotation(self, node: Annotation, value=None):
@@ -2905,24 +3992,823 @@ class NodeVisitor:
         return self.visit_node(node, value)
     
 class NodeModifier(NodeVisitor):
+    """ A NodeVisitor whose visit_* methods return a tuple of whether to visit the
+    Node's children and the Node to replace it with, and whose leave_* methods
+    return the Node to replace it with.
+    """
     def __call__(self, node: Node):
         assert check_argument_types()
-        proceed, node = node.accept(self, None)
-        if not isinstance(proceed, bool):
-            raise TypeError('Node.accept(NodeModifier) first return value must be True or False')
-        if not isinstance(node, Node):
-            raise TypeError('Node.accept(NodeModifier) second return value must be Node')
-        if proceed:
-            for name, child in node.__dict__.items():
-                if isinstance(child, Node):
-                    newchild = self(child)
-                    if newchild is not child:
-                        setattr(node, name, newchild)
-            
-        return node
+        dispatch = type(self)._dispatch
+        handlers = type(self)._handlers
+        root = node
+        stack = [(None, None, node)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            entry = pop()
+            if len(entry) == 4:
+                leave, owner, key, node = entry
+                newnode = leave(self, node, None)
+                if not isinstance(newnode, Node):
+                    raise TypeError('NodeModifier.leave_node() must return Node')
+            else:
+                owner, key, node = entry
+                visit, leave, descend = dispatch.get(type(node)) or handlers(type(node))
+                proceed, newnode = visit(self, node, None)
+                if not isinstance(proceed, bool):
+                    raise TypeError('Node.accept(NodeModifier) first return value must be True or False')
+                if not isinstance(newnode, Node):
+                    raise TypeError('Node.accept(NodeModifier) second return value must be Node')
+                if leave is not None:
+                    push((leave, owner, key, newnode))
+                if newnode is not node:
+                    descend = (dispatch.get(type(newnode)) or handlers(type(newnode)))[2]
+                if proceed and descend:
+                    children = _child_refs(newnode)
+                    children.reverse()
+                    stack.extend(children)
+
+            if newnode is not node:
+                if owner is None:
+                    root = newnode
+                elif isinstance(owner, NodeList):
+                    owner[key] = newnode
+                else:
+                    setattr(owner, key, newnode)
+
+        return root
         
     def visit_node(self, node: Node, value=None):
         return True, node
 
+    def leave_node(self, node: Node, value=None):
+        return node
+
+class ModifierPipeline:
+    """ Applies several NodeModifiers to a tree in a single traversal, instead of one
+    traversal per modifier.
+
+    Each Node is visited once. The visit_* methods of the modifiers are called in order,
+    each with the Node returned by the one before, and then the children of the Node the
+    last one returned are visited. After the children, the leave_* methods are called in
+    the same order, again each with the Node returned by the one before. A modifier only
+    sees the children of a Node if its visit_* method returned True for it and, as when it
+    runs on its own, if they can contain a Node type it handles.
+
+    The result is the same as applying the modifiers one after another as long as their
+    visit_* methods do not depend on what earlier modifiers do below the Node they are
+    given, since a later modifier visits a Node before the earlier ones have visited its
+    children. Modifiers which need to see the finished children of a Node should do
+    their work in leave_* methods.
+
+    :ivar modifiers: The modifiers, in the order they are applied
+    :vartype modifiers: Tuple[NodeModifier, ...]
+    """
+    def __init__(self, modifiers: List[NodeModifier]):
+        assert check_argument_types()
+        self.modifiers = tuple(modifiers)
+        self._tables = {}
+        self._all = (1 << len(self.modifiers)) - 1
+        # The modifiers with a leave_* method for any Node type
+        self._leaving = 0
+        for i, modifier in enumerate(self.modifiers):
+            cls = type(modifier)
+            if cls.leave_node is not NodeModifier.leave_node or any(name.startswith('leave_') and name != 'leave_node' for name in dir(cls)):
+                self._leaving |= 1 << i
+
+    def _table(self, nodetype):
+        """ Returns the visits and leaves of the modifiers for Nodes of the given type, as
+            (bit, modifier, method) triples, and the bits of the modifiers which descend into them.
+        """
+        visits = []
+        leaves = []
+        descend = 0
+        for i, modifier in enumerate(self.modifiers):
+            visit, leave, descends = type(modifier)._handlers(nodetype)
+            if visit is not NodeModifier.visit_node:
+                visits.append((1 << i, modifier, visit))
+            if leave is not None:
+                leaves.append((1 << i, modifier, leave))
+            if descends:
+                descend |= 1 << i
+        self._tables[nodetype] = table = (tuple(visits), tuple(leaves), descend)
+        return table
+
+    def _chain(self, node: Node, mask: int, leaving: int):
+        """ Calls the visit_* methods, or the leave_* methods if leaving is 1, of the modifiers
+            whose bits are in mask, each with the Node the one before returned. Returns the last
+            Node and the bits of mask whose visit_* methods did not return False.
+        """
+        tables = self._tables
+        nodetype = type(node)
+        handlers = (tables.get(nodetype) or self._table(nodetype))[leaving]
+        proceed_mask = mask
+        last = 0
+        while True:
+            for bit, modifier, handler in handlers:
+                if bit <= last or not mask & bit:
+                    continue
+                last = bit
+                if leaving:
+                    result = handler(modifier, node, None)
+                    if not isinstance(result, Node):
+                        raise TypeError('NodeModifier.leave_node() must return Node')
+                else:
+                    proceed, result = handler(modifier, node, None)
+                    if not isinstance(proceed, bool):
+                        raise TypeError('Node.accept(NodeModifier) first return value must be True or False')
+                    if not isinstance(result, Node):
+                        raise TypeError('Node.accept(NodeModifier) second return value must be Node')
+                    if not proceed:
+                        proceed_mask &= ~bit
+                if result is not node:
+                    node = result
+                    if type(node) is not nodetype:
+                        nodetype = type(node)
+                        handlers = (tables.get(nodetype) or self._table(nodetype))[leaving]
+                        break
+            else:
+                return node, proceed_mask
+
+    def __call__(self, node: Node):
+        assert check_argument_types()
+        tables = self._tables
+        table = self._table
+        chain = self._chain
+        leaving = self._leaving
+        root = node
+        stack = [(None, None, node, self._all)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            entry = pop()
+            if len(entry) == 5:
+                owner, key, node, mask, _ = entry
+                newnode = chain(node, mask, 1)[0]
+            else:
+                owner, key, node, mask = entry
+                newnode, proceed = chain(node, mask, 0)
+                if mask & leaving:
+                    push((owner, key, newnode, mask, None))
+                descend = proceed & (tables.get(type(newnode)) or table(type(newnode)))[2]
+                if descend:
+                    children = _child_refs(newnode)
+                    children.reverse()
+                    stack.extend((child_owner, child_key, child, descend) for child_owner, child_key, child in children)
+
+            if newnode is not node:
+                if owner is None:
+                    root = newnode
+                elif isinstance(owner, NodeList):
+                    owner[key] = newnode
+                else:
+                    setattr(owner, key, newnode)
+
+        return root
+
+#region Diff
+
+class Edit:
+    """ One step of the edit script returned by diff().
+
+    :ivar op: ``'insert'``, ``'delete'`` or ``'replace'``
+    :vartype op: str
+
+    :ivar old: The Node of the old tree which is deleted or replaced, or None if op is ``'insert'``
+    :vartype old: Node
+
+    :ivar new: The Node of the new tree which is inserted or replaces old, or None if op is ``'delete'``.
+        An inserted Node goes wherever it is in the new tree.
+    :vartype new: Node
+    """
+    __slots__ = ('op', 'old', 'new')
+
+    OPS = ('insert', 'delete', 'replace')
+
+    def __init__(self, op: str, old: Optional[Node], new: Optional[Node]):
+        if op not in Edit.OPS:
+            raise ValueError(f"invalid edit operation: {op!r}")
+        if (old is None) != (op == 'insert') or (new is None) != (op == 'delete'):
+            raise ValueError(f"wrong nodes given for {op!r} edit")
+        self.op = op
+        self.old = old
+        self.new = new
+
+    def __eq__(self, other):
+        return isinstance(other, Edit) and self.op == other.op and self.old is other.old and self.new is other.new
+
+    def __repr__(self):
+        def describe(node):
+            if isinstance(node, Named):
+                return f"<{typename(node)} {node.name}>"
+            elif node is None:
+                return "None"
+            else:
+                return f"<{typename(node)}>"
+        return f"Edit({self.op!r}, {describe(self.old)}, {describe(self.new)})"
+
+def _diff_children(node: Node) -> Optional[list]:
+    """ Returns the children diff() matches up between the old and new versions of node,
+        or None if node is compared as a whole.
+    """
+    if isinstance(node, CompilationUnit):
+        children = [node.package] if node.package else []
+        children.extend(node.imports)
+        children.extend(node.types)
+        return children
+    elif isinstance(node, TypeDeclaration):
+        return list(node.members)
+    else:
+        return None
+
+def _diff_key(node: Node):
+    if isinstance(node, (FunctionDeclaration, ConstructorDeclaration)):
+        return (type(node), str(node.name), tuple(str(param.type) if isinstance(param, FormalParameter) else str(param) for param in node.params))
+    elif isinstance(node, FieldDeclaration):
+        return (type(node), tuple(str(declarator.name) for declarator in node.declarators))
+    elif isinstance(node, (Package, Import)):
+        return (type(node), str(node))
+    elif isinstance(node, Named):
+        return (type(node), str(node.name))
+    else:
+        return (type(node), node.structural_hash())
+
+def _same_header(old: Node, new: Node) -> bool:
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, CompilationUnit):
+        return True
+    keys = old.__dict__.keys()
+    if keys != new.__dict__.keys():
+        return False
+    for key in keys:
+        if key not in ('parent', 'children', 'members') and old.__dict__[key] != new.__dict__[key]:
+            return False
+    return True
+
+def _match(olds: list, news: list):
+    """ Pairs up the old and new Nodes which have the same key, without changing their order.
+        Returns (old, new) pairs in document order, where old is None for an inserted Node
+        and new is None for a deleted Node.
+    """
+    def keys(nodes):
+        counts = {}
+        result = []
+        for node in nodes:
+            key = _diff_key(node)
+            count = counts.get(key, 0)
+            counts[key] = count + 1
+            result.append((key, count))
+        return result
+
+    new_indices = {key: j for j, key in enumerate(keys(news))}
+    candidates = [(i, new_indices[key]) for i, key in enumerate(keys(olds)) if key in new_indices]
+
+    # Keep the longest run of pairs whose new indices increase with their old indices
+    tails = []
+    tail_pairs = []
+    previous = [None]*len(candidates)
+    for c, (i, j) in enumerate(candidates):
+        k = bisect.bisect_left(tails, j)
+        previous[c] = tail_pairs[k-1] if k else None
+        if k == len(tails):
+            tails.append(j)
+            tail_pairs.append(c)
+        else:
+            tails[k] = j
+            tail_pairs[k] = c
+    matched = []
+    c = tail_pairs[-1] if tail_pairs else None
+    while c is not None:
+        matched.append(candidates[c])
+        c = previous[c]
+    matched.reverse()
+
+    result = []
+    i = j = 0
+    for mi, mj in matched + [(len(olds), len(news))]:
+        while i < mi:
+            result.append((olds[i], None))
+            i += 1
+        while j < mj:
+            result.append((None, news[j]))
+            j += 1
+        if mi < len(olds):
+            result.append((olds[mi], news[mj]))
+        i, j = mi + 1, mj + 1
+    return result
+
+def diff(old: Node, new: Node) -> List[Edit]:
+    """ Returns the edits which turn old into new.
+        The package, imports and types of compilation units and the members of type declarations
+        are matched up by kind and name (and parameter types, for methods and constructors),
+        and matching type declarations whose headers are the same are compared member by member.
+        Everything else which differs is replaced as a whole.
+    """
+    assert check_argument_types()
+    edits = []
+    stack = [(old, new)]
+    while stack:
+        old, new = stack.pop()
+        if old is None:
+            edits.append(Edit('insert', None, new))
+        elif new is None:
+            edits.append(Edit('delete', old, None))
+        elif old == new:
+            continue
+        elif _diff_children(old) is not None and _same_header(old, new):
+            stack.extend(reversed(_match(_diff_children(old), _diff_children(new))))
+        else:
+            edits.append(Edit('replace', old, new))
+    return edits
+
+class _SpanEmitter(Emitter):
+    """ An Emitter which records where in its output the given Nodes were written. """
+    def __init__(self, containers, nodes):
+        super().__init__()
+        self._containers = {id(node) for node in containers}
+        self._nodes = {id(node) for node in nodes}
+        self.spans = {}
+        # How many characters have been written, kept up to date by _write
+        self._length = 0
+        append = self.sink.append
+        def write(text):
+            self._length += len(text)
+            append(text)
+        self._write = write
+
+    def tell(self) -> int:
+        return self._length
+
+    def emit(self, node):
+        if not isinstance(node, Node) or id(node) not in self._nodes:
+            super().emit(node)
+            return
+        start = self.tell()
+        if id(node) in self._containers:
+            node.emit(self)
+        else:
+            super().emit(node)
+        self.spans[id(node)] = (start, self.tell())
+
+def _anchors(root: Node, touched: set):
+    """ Returns (anchors, containers, nodes): the Nodes diff() looked at which were left unchanged,
+        in document order, the ones which contain changes, and all of them.
+    """
+    touched_ids = {id(node) for node in touched}
+    changed = set()
+    for node in touched:
+        while node is not None and id(node) not in changed:
+            changed.add(id(node))
+            node = node.parent
+
+    anchors = []
+    containers = []
+    nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if id(node) not in changed:
+            anchors.append(node)
+        elif id(node) not in touched_ids:
+            containers.append(node)
+            stack.extend(reversed(_diff_children(node)))
+    return anchors, containers, nodes
+
+def patch_text(old_text: str, old: Node, new: Node, edits: Optional[List[Edit]]=None):
+    """ Works out which regions of old_text, the source code emitted for old, need to be rewritten
+        to turn it into the source code of new, using the edit script from diff(old, new).
+
+        :return: A tuple of the new text and a list of (start, end, replacement) regions of old_text,
+            in order, which do not overlap.
+    """
+    assert check_argument_types()
+    if edits is None:
+        edits = diff(old, new)
+
+    old_anchors, old_containers, old_nodes = _anchors(old, {edit.old for edit in edits if edit.old is not None})
+    new_anchors, new_containers, new_nodes = _anchors(new, {edit.new for edit in edits if edit.new is not None})
+
+    outputs = []
+    for root, containers, nodes in ((old, old_containers, old_nodes), (new, new_containers, new_nodes)):
+        out = _SpanEmitter(containers, nodes)
+        out.emit(root)
+        outputs.append((out.getvalue(), out.spans))
+    (rendered, old_spans), (new_text, new_spans) = outputs
+
+    if rendered != old_text or len(old_anchors) != len(new_anchors):
+        return new_text, [(0, len(old_text), new_text)] if new_text != old_text else []
+
+    # Everything between two anchors which are written the same way has changed
+    spans = [(old_spans[id(old_anchor)], new_spans[id(new_anchor)]) for old_anchor, new_anchor in zip(old_anchors, new_anchors)]
+    spans.append(((len(old_text), len(old_text)), (len(new_text), len(new_text))))
+    regions = []
+    old_pos = new_pos = 0
+    for (old_start, old_end), (new_start, new_end) in spans:
+        if old_text[old_start:old_end] != new_text[new_start:new_end]:
+            continue
+        old_gap = old_text[old_pos:old_start]
+        new_gap = new_text[new_pos:new_start]
+        if old_gap != new_gap:
+            prefix = len(os.path.commonprefix([old_gap, new_gap]))
+            suffix = len(os.path.commonprefix([old_gap[prefix:][::-1], new_gap[prefix:][::-1]]))
+            regions.append((old_pos + prefix, old_start - suffix, new_gap[prefix:len(new_gap)-suffix]))
+        old_pos, new_pos = old_end, new_end
+
+    return new_text, regions
+
+def patch_file(path, old: Node, new: Node, edits: Optional[List[Edit]]=None, encoding: str='utf-8') -> int:
+    """ Rewrites the file at path, which holds the source code emitted for old, to hold the source
+        code of new, writing only the regions patch_text() finds have changed. If every region keeps
+        its length the regions are overwritten in place. Otherwise the new contents are written to
+        a temporary file which is renamed over path, so that a failed write leaves the file as it was.
+
+        :return: The number of bytes written
+    """
+    with open(path, 'rb') as file:
+        old_data = file.read()
+    old_text = old_data.decode(encoding)
+    new_text, regions = patch_text(old_text, old, new, edits)
+    if not regions:
+        return 0
+
+    byte_regions = []
+    char_pos = byte_pos = 0
+    for start, end, replacement in regions:
+        byte_pos += len(old_text[char_pos:start].encode(encoding))
+        byte_start = byte_pos
+        byte_pos += len(old_text[start:end].encode(encoding))
+        char_pos = end
+        byte_regions.append((byte_start, byte_pos, replacement.encode(encoding)))
+
+    if not all(len(data) == byte_end - byte_start for byte_start, byte_end, data in byte_regions):
+        from pathlib import Path
+        from javapy.cache import _replace
+        new_data = new_text.encode(encoding)
+        _replace(Path(path), new_data)
+        return len(new_data)
+
+    written = 0
+    with open(path, 'r+b') as file:
+        for byte_start, byte_end, data in byte_regions:
+            file.seek(byte_start)
+            written += file.write(data)
+    return written
+
+#endregion Diff
+
+#region Snapshots
+
+# The Snapshots which have not been released yet, oldest first, as weak references keyed by the
+# id of the root of their tree and of every Node and NodeList they saved. A Snapshot holds on to
+# these, so their ids are not reused while they are keys. The roots of frozen trees are kept
+# here too, with _FROZEN, until they are freed.
+_snapshots = {}
+_snapshots_lock = threading.RLock()
+_FROZEN = object()
+
+def _state(obj):
+    if isinstance(obj, NodeList):
+        return list(obj._list), obj._parent
+    else:
+        return dict(obj.__dict__), obj._parent
+
+def _record(obj):
+    """ Saves the fields of the given Node or NodeList in every Snapshot whose tree contains it,
+        unless they have already been saved. Called before it is changed. The ancestors of obj
+        are walked once, so a change pays nothing for the Snapshots of other trees.
+    """
+    with _snapshots_lock:
+        refs = []
+        node = obj
+        while node is not None:
+            found = _snapshots.get(id(node))
+            if found:
+                refs.extend(found)
+            node = getattr(node, 'parent', None)
+        if _FROZEN in refs:
+            raise TypeError(f"cannot change {typename(obj)} object of a frozen tree")
+        for ref in refs:
+            snapshot = ref()
+            if snapshot is not None and id(obj) not in snapshot._saved:
+                snapshot._save(obj)
+
+def _forget(ref, keys):
+    with _snapshots_lock:
+        for key in keys:
+            refs = _snapshots.get(key)
+            if refs is None:
+                continue
+            refs[:] = [other for other in refs if other is not ref]
+            if not refs:
+                del _snapshots[key]
+
+def freeze(root: Node):
+    """ Makes the tree rooted at the given Node read-only, for trees which are shared, so that
+        changing any Node or NodeList in it raises a TypeError. A frozen tree stays frozen,
+        but its copies can be changed. While any tree is frozen, every change to a tree walks
+        the ancestors of what is changed once, as while a Snapshot is taken.
+    """
+    assert check_argument_types()
+    with _snapshots_lock:
+        if not is_frozen(root):
+            _snapshots.setdefault(id(root), []).append(_FROZEN)
+            weakref.finalize(root, _forget, _FROZEN, {id(root)}).atexit = False
+
+def is_frozen(node: Node) -> bool:
+    """ Returns whether the given Node is part of a frozen tree. """
+    while node is not None:
+        if _FROZEN in _snapshots.get(id(node), ()):
+            return True
+        node = node.parent
+    return False
+
+class Snapshot:
+    """ The state of a tree at one point in time, which the tree can be restored to.
+        Taking a Snapshot copies nothing. Instead, the first time each Node or NodeList of
+        the tree is changed afterwards, its previous fields are saved, so restoring the tree
+        costs as much as the number of Nodes which were changed.
+        The Snapshots of a tree are nested: restoring or releasing one also releases the ones
+        taken of the same root after it. A Snapshot which is garbage-collected is released.
+        :ivar root: the root Node of the tree
+    """
+    def __init__(self, root: Node):
+        assert check_argument_types()
+        self.root = root
+        self._saved = {}
+        self._ref = weakref.ref(self)
+        # The ids this Snapshot is kept under in _snapshots
+        self._keys = {id(root)}
+        with _snapshots_lock:
+            _snapshots.setdefault(id(root), []).append(self._ref)
+        self._release = weakref.finalize(self, _forget, self._ref, self._keys)
+        self._release.atexit = False
+
+    @property
+    def active(self) -> bool:
+        """ Whether this Snapshot has not been released yet. """
+        return self._release.alive
+
+    def _save(self, obj):
+        key = id(obj)
+        self._saved[key] = (obj, _state(obj))
+        if key not in self._keys:
+            self._keys.add(key)
+            _snapshots.setdefault(key, []).append(self._ref)
+
+    def _later(self) -> list:
+        """ Returns the active Snapshots of the same root taken after this one. """
+        if not self.active:
+            raise ValueError('this Snapshot has been released')
+        refs = _snapshots[id(self.root)]
+        later = refs[next(i for i, ref in enumerate(refs) if ref is self._ref)+1:]
+        return [snapshot for snapshot in (ref() for ref in later if ref is not _FROZEN) if snapshot is not None]
+
+    def restore(self):
+        """ Returns the tree to the state it was in when this Snapshot was taken.
+            This Snapshot stays active, so the tree can be restored to it again.
+        """
+        with _snapshots_lock:
+            for snapshot in self._later():
+                snapshot.release()
+            saved, self._saved = self._saved, {}
+            root_key = id(self.root)
+            _forget(self._ref, self._keys - {root_key})
+            self._keys.intersection_update((root_key,))
+        for obj, state in saved.values():
+            if isinstance(obj, NodeList):
+                items, parent = state
+                obj._list[:] = items
+                object.__setattr__(obj, '_parent', parent)
+            else:
+                fields, parent = state
+                obj.__dict__.clear()
+                obj.__dict__.update(fields)
+                object.__setattr__(obj, '_parent', parent)
+        for obj, state in saved.values():
+            if isinstance(obj, NodeList):
+                obj._invalidate()
+            else:
+                obj.invalidate()
+
+    def release(self):
+        """ Stops saving the changes made to the tree, keeping them. """
+        with _snapshots_lock:
+            for snapshot in self._later():
+                snapshot.release()
+            self._release()
+        self._saved = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            self.release()
+
+#endregion Snapshots
+
+#region Query
+
+class NodeIndex:
+    """ The Nodes of a tree grouped by their types, collected in a single walk over the tree.
+        Queries and Selectors look Nodes up in the index instead of walking the tree again,
+        and return them in the order they appear in the source code.
+        The index does not follow changes made to the tree after it was built.
+        :ivar root: the root Node of the indexed tree
+    """
+    def __init__(self, root: Node):
+        assert check_argument_types()
+        self.root = root
+        order = self._order = {}
+        nodes = self._nodes = []
+        by_type = self._by_type = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order[id(node)] = len(nodes)
+            nodes.append(node)
+            by_type.setdefault(type(node), []).append(node)
+            children = list(iter_child_nodes(node))
+            children.reverse()
+            stack.extend(children)
+        self._types = {}
+        self._attributes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        i = self._order.get(id(node))
+        return i is not None and self._nodes[i] is node
+
+    def _of_type(self, nodetype: type) -> list:
+        result = self._types.get(nodetype)
+        if result is None:
+            lists = [nodes for cls, nodes in self._by_type.items() if issubclass(cls, nodetype)]
+            if len(lists) == 1:
+                result = lists[0]
+            else:
+                order = self._order
+                result = sorted((node for nodes in lists for node in nodes), key=lambda node: order[id(node)])
+            self._types[nodetype] = result
+        return result
+
+    def _with_attribute(self, nodetype: type, attr: str, value: str) -> list:
+        table = self._attributes.get((nodetype, attr))
+        if table is None:
+            table = self._attributes[(nodetype, attr)] = {}
+            for node in self._of_type(nodetype):
+                key = getattr(node, attr, None)
+                if key is not None:
+                    table.setdefault(str(key), []).append(node)
+        return table.get(value, [])
+
+    def of_type(self, nodetype: type) -> List[Node]:
+        """ Returns the Nodes which are instances of the given type. """
+        return list(self._of_type(nodetype))
+
+    def with_attribute(self, nodetype: type, attr: str, value: str) -> List[Node]:
+        """ Returns the Nodes which are instances of the given type and whose attribute attr
+            has the given value when converted to a string, such as the FunctionCalls with a
+            given name or the FieldDeclarations of a given type.
+        """
+        return list(self._with_attribute(nodetype, attr, value))
+
+    def select(self, selector: Union[str, 'Selector']) -> List[Node]:
+        """ Returns the Nodes matched by the given Selector. """
+        if isinstance(selector, str):
+            selector = Selector.compile(selector)
+        return selector.select(self)
+
+_SELECTOR_TOKEN_REGEX = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<child>>)
+  | (?P<type>\*|[A-Za-z_]\w*)
+  | \[\s*(?P<attr>[A-Za-z_]\w*)\s*(?:=\s*(?:"(?P<dquoted>[^"]*)"|'(?P<squoted>[^']*)'|(?P<bare>[^\]\s]+))\s*)?\]
+""", re.VERBOSE)
+
+class Selector:
+    """ A pattern matching Nodes, written like a CSS selector. A Selector is a sequence of
+        Node type names, each optionally followed by attribute tests, separated by combinators:
+
+            FunctionDeclaration Block > ReturnStatement
+            FunctionCall[name=of]
+            FieldDeclaration[type=String]
+            ClassDeclaration[doc] *[name="main"]
+
+        'A > B' matches B whose parent is A, and 'A B' matches B with an ancestor A. '*' matches
+        any Node, '[attr]' matches Nodes whose attribute attr is neither None nor empty, and
+        '[attr=value]' Nodes whose attribute attr is value when converted to a string.
+        Type names may be any class of this module, including mixins such as Member.
+    """
+    def __init__(self, selector: str):
+        assert check_argument_types()
+        self.selector = selector
+        # Each step is (combinator, type, [(attr, value or None), ...]), the combinator
+        # joining it to the step before it being None, '>' or ' '
+        self._steps = steps = []
+        combinator = None
+        pos = 0
+        while pos < len(selector):
+            match = _SELECTOR_TOKEN_REGEX.match(selector, pos)
+            if not match:
+                raise ValueError(f"invalid selector {selector!r} at position {pos}")
+            pos = match.end()
+            if match.group('space'):
+                if steps and combinator is None:
+                    combinator = ' '
+            elif match.group('child'):
+                if not steps:
+                    raise ValueError(f"selector {selector!r} starts with a combinator")
+                combinator = '>'
+            elif match.group('type'):
+                if steps and combinator is None:
+                    raise ValueError(f"invalid selector {selector!r} at position {match.start()}")
+                steps.append((combinator, self._resolve(match.group('type')), []))
+                combinator = None
+            else:
+                if not steps or combinator is not None:
+                    steps.append((combinator, Node, []))
+                    combinator = None
+                value = match.group('dquoted')
+                if value is None:
+                    value = match.group('squoted')
+                if value is None:
+                    value = match.group('bare')
+                steps[-1][2].append((match.group('attr'), value))
+        if not steps:
+            raise ValueError('empty selector')
+        if combinator == '>':
+            raise ValueError(f"selector {selector!r} ends with a combinator")
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def compile(selector: str) -> 'Selector':
+        """ Returns the Selector for the given string, reusing the ones compiled before. """
+        return Selector(selector)
+
+    @staticmethod
+    def _resolve(name: str) -> type:
+        if name == '*':
+            return Node
+        cls = globals().get(name)
+        if not isinstance(cls, type) or cls.__module__ != __name__:
+            raise ValueError(f"unknown node type {name!r}")
+        return cls
+
+    @staticmethod
+    def _test(node, step) -> bool:
+        combinator, nodetype, attrs = step
+        if not isinstance(node, nodetype):
+            return False
+        for attr, expected in attrs:
+            value = getattr(node, attr, None)
+            if expected is None:
+                if value is None or isinstance(value, list) and not value:
+                    return False
+            elif value is None or str(value) != expected:
+                return False
+        return True
+
+    def _match_before(self, node, k: int) -> bool:
+        """ Whether the steps before step k match the ancestors of the given Node, which matches step k. """
+        if k == 0:
+            return True
+        combinator = self._steps[k][0]
+        step = self._steps[k-1]
+        ancestor = node.parent
+        if combinator == '>':
+            return ancestor is not None and self._test(ancestor, step) and self._match_before(ancestor, k-1)
+        while ancestor is not None:
+            if self._test(ancestor, step) and self._match_before(ancestor, k-1):
+                return True
+            ancestor = ancestor.parent
+        return False
+
+    def matches(self, node: Node) -> bool:
+        """ Whether this Selector matches the given Node. """
+        k = len(self._steps) - 1
+        return self._test(node, self._steps[k]) and self._match_before(node, k)
+
+    def select(self, index: NodeIndex) -> List[Node]:
+        """ Returns the Nodes in the given NodeIndex which this Selector matches. """
+        assert check_argument_types()
+        k = len(self._steps) - 1
+        combinator, nodetype, attrs = self._steps[k]
+        for attr, value in attrs:
+            if value is not None:
+                candidates = index._with_attribute(nodetype, attr, value)
+                break
+        else:
+            candidates = index._of_type(nodetype)
+        return [node for node in candidates if self._test(node, self._steps[k]) and self._match_before(node, k)]
+
+    def __repr__(self):
+        return f"Selector({self.selector!r})"
+
+#endregion Query
+
 if __name__ == "__main__":
     print("Complete")
\ No newline at end of file
@@ -1,15 +1,71 @@
 import re
-import inspect
+import os
+import sys
 import math
 from enum import Enum
 from collections import OrderedDict
 from numbers import Number
 from typing import _GenericAlias, Optional, Tuple
 from Lib.tokenize import TokenInfo
-from typeguard import check_type, check_argument_types
 from javapy.tokenize import simple_token_str
 from functools import wraps
 
+#region validation
+# Validation is turned off if this environment variable is 0
+VALIDATION_ENV_VAR = 'JAVAPY_VALIDATE'
+
+_validation = os.environ.get(VALIDATION_ENV_VAR, '1') != '0'
+
+def set_validation(enabled: bool):
+    """ Turns the type checks of arguments and values throughout javapy on or off. They are on
+        unless the JAVAPY_VALIDATE environment variable is 0. typeguard, which does them, is only
+        imported once the first check is made, so with validation off it is never imported.
+        Running Python with -O also turns off the checks of arguments, which are asserts.
+    """
+    global _validation
+    _validation = enabled
+
+def validation_enabled() -> bool:
+    return _validation
+
+# The module last checked by _typeguard()
+_checked_typeguard = None
+
+def _typeguard():
+    """ Imports typeguard, which must be version 2: later versions changed check_type() and
+        no longer have the helpers check_argument_types() uses to find its caller.
+    """
+    global _checked_typeguard
+    import typeguard
+    if typeguard is not _checked_typeguard:
+        missing = [name for name in ('check_type', 'check_argument_types', 'find_function', '_CallMemo') if not hasattr(typeguard, name)]
+        if missing:
+            raise ImportError(f"javapy's type checks need typeguard>=2.2,<3, which has {', '.join(missing)}; "
+                              f"install it or set {VALIDATION_ENV_VAR}=0")
+        _checked_typeguard = typeguard
+    return typeguard
+
+def check_type(argname: str, value, expected_type, memo=None):
+    """ Calls typeguard.check_type() if validation is on. """
+    if _validation:
+        _typeguard().check_type(argname, value, expected_type, memo)
+
+def check_argument_types(memo=None) -> bool:
+    """ Calls typeguard.check_argument_types() for the function which called this if validation is on. """
+    if not _validation:
+        return True
+    typeguard = _typeguard()
+    if memo is None:
+        # What typeguard.check_argument_types() does itself, one frame further up
+        frame = sys._getframe(1)
+        try:
+            func = typeguard.find_function(frame)
+        except LookupError:
+            return True
+        memo = typeguard._CallMemo(func, frame.f_locals)
+    return typeguard.check_argument_types(memo)
+#endregion validation
+
 class JavaSyntaxError(SyntaxError):
     def __init__(self, msg: str='', at: Optional[Tuple[str, int, int, str]]=None, token: Optional[TokenInfo]=None, got: Optional[TokenInfo]=None):
         """        
@@ -127,6 +183,7 @@ def isname(value):
         return bool(NAME_REGEX.match(value))
 
 def get_calling_function_name():
+    import inspect
     stack = inspect.stack()
     try:
         element = stack[2]
@@ -0,0 +1,257 @@
+"""
+Translating the javapy files in a directory again whenever they change.
+
+A watcher keeps one process running and polls the source directory for .javapy files which
+have been added, changed or deleted. A file is only translated once its size and modification
+time have stayed the same for a short while, so a burst of saves is translated once. Since
+javapy is already imported, translating a file costs only the parse and the emit, and the tree
+of each file translated so far is kept, so that a later change only parses the members which
+changed again (see javapy.parser.reparse).
+
+The watcher keeps the manifest of javapy.build up to date, so it starts by building whatever
+changed since the last build, and a build run afterwards skips everything it translated.
+
+    python javapy.py watch src --out build/java
+"""
+import os
+import io
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+from .util import check_argument_types
+from .build import Options, Manifest, build, target_path, write_if_changed, _remove_output, _stat
+from .cache import Cache, tool_hash, _digest
+
+__all__ = ['Change', 'Watcher']
+
+class Change:
+    """ What the watcher did about one changed file.
+
+    :ivar source: The source file
+    :vartype source: Path
+
+    :ivar target: The output file
+    :vartype target: Path
+
+    :ivar action: ``'written'`` or ``'unchanged'`` if the file was translated and its output was
+        written or already held the translation, ``'failed'`` if it could not be translated, or
+        ``'removed'`` if the source file was deleted
+    :vartype action: str
+
+    :ivar seconds: How long it took, from reading the source file to writing the output
+    :vartype seconds: float
+
+    :ivar reparsed: Whether only the changed members of the file were parsed again
+    :vartype reparsed: bool
+
+    :ivar error: The error message if the file could not be translated
+    :vartype error: str
+    """
+    __slots__ = ('source', 'target', 'action', 'seconds', 'reparsed', 'error')
+
+    ACTIONS = ('written', 'unchanged', 'failed', 'removed')
+
+    def __init__(self, source: Path, target: Path, action: str, seconds: float=0.0, reparsed: bool=False, error: Optional[str]=None):
+        assert check_argument_types()
+        if action not in Change.ACTIONS:
+            raise ValueError(f"invalid action: {action!r}")
+        self.source = source
+        self.target = target
+        self.action = action
+        self.seconds = seconds
+        self.reparsed = reparsed
+        self.error = error
+
+    def __repr__(self):
+        return f"Change({str(self.source)!r}, {self.action!r}, seconds={self.seconds:.4f})"
+
+class Watcher:
+    """ Translates the .javapy files below a directory whenever they change.
+
+    :ivar src: The directory containing the javapy files
+    :vartype src: Path
+
+    :ivar out: The directory the Java files are written to
+    :vartype out: Path
+
+    :ivar options: How the files are translated
+    :vartype options: Options
+
+    :ivar debounce: How many seconds a file's stat must stay the same before it is translated
+    :vartype debounce: float
+    """
+    def __init__(self, src: Path, out: Path, options: Optional[Options]=None, *, debounce: float=0.1,
+                 manifest: Optional[Path]=None, cache: Optional[Cache]=None):
+        assert check_argument_types()
+        if debounce < 0:
+            raise ValueError('debounce must not be negative')
+        self.src = src
+        self.out = out
+        self.options = Options() if options is None else options
+        self.debounce = debounce
+        self.manifest = Manifest.load(out / Manifest.FILENAME if manifest is None else manifest)
+        self._cache = cache
+        # The stat of each source file as of when it was last translated
+        self._stats: Dict[Path, list] = {}
+        # The stat of each changed source file and since when it has been unchanged
+        self._pending: Dict[Path, Tuple[list, float]] = {}
+        # The CompilationUnit and Parser of each source file translated so far
+        self._trees = {}
+
+    def start(self):
+        """ Builds the files which changed since the last build and records the stats to watch from. """
+        result = build(self.src, self.out, self.options, jobs=1, manifest=self.manifest.path, cache=self._cache)
+        self.manifest = Manifest.load(self.manifest.path)
+        self._stats = self._scan()
+        self._pending.clear()
+        return result
+
+    def _scan(self) -> Dict[Path, list]:
+        stats = {}
+        for dirpath, dirnames, filenames in os.walk(self.src):
+            for filename in filenames:
+                if filename.endswith('.javapy'):
+                    path = Path(dirpath, filename)
+                    try:
+                        stats[path] = _stat(path)
+                    except OSError:
+                        # Deleted in the meantime
+                        pass
+        return stats
+
+    def poll(self) -> List[Change]:
+        """ Looks for changed files once, and translates those whose stat has stayed the same for
+            debounce seconds and deletes the outputs of those which were deleted.
+        """
+        now = time.monotonic()
+        stats = self._scan()
+        ready = []
+        for path in set(stats) | set(self._stats):
+            stat = stats.get(path)
+            if stat == self._stats.get(path):
+                self._pending.pop(path, None)
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != stat:
+                self._pending[path] = pending = (stat, now)
+            if now - pending[1] >= self.debounce:
+                ready.append(path)
+
+        changes = []
+        for path in sorted(ready):
+            del self._pending[path]
+            if path in stats:
+                # A file which fails to translate is tried again once it changes again
+                self._stats[path] = stats[path]
+                changes.append(self._translate(path))
+            else:
+                changes.append(self._remove(path))
+        if changes:
+            self.manifest.save()
+        return changes
+
+    def _key(self, source: Path) -> str:
+        return source.relative_to(self.src).as_posix()
+
+    def _translate(self, source: Path) -> Change:
+        from .parser import reparse
+        from .tokenize import tokenize
+        target = target_path(self.src, self.out, source)
+        started = time.perf_counter()
+        previous = self._trees.pop(source, None)
+        try:
+            source_stat = _stat(source)
+            with source.open('rb') as file:
+                data = file.read()
+            file = io.BytesIO(data)
+            file.name = str(source)
+            if previous is None:
+                parser = self.options.parser()(tokenize(file.readline), file.name, spans=True)
+                unit = parser.parse_compilation_unit()
+            else:
+                unit, parser = reparse(*previous, file)
+            out = self.options.emitter()
+            out.emit(unit)
+            out.flush()
+            output = out.getvalue().encode('utf-8')
+            written = write_if_changed(target, output)
+        except Exception as e:
+            self.manifest.entries.pop(self._key(source), None)
+            return Change(source, target, 'failed', time.perf_counter() - started, previous is not None, f"{type(e).__name__}: {e}")
+        self._trees[source] = (unit, parser)
+        self.manifest.entries[self._key(source)] = {
+            'source': _digest(data), 'source_stat': source_stat, 'tool': tool_hash(),
+            'options': self.options.key(), 'output': _digest(output), 'output_stat': _stat(target)}
+        return Change(source, target, 'written' if written else 'unchanged', time.perf_counter() - started, previous is not None)
+
+    def _remove(self, source: Path) -> Change:
+        target = target_path(self.src, self.out, source)
+        started = time.perf_counter()
+        del self._stats[source]
+        self._trees.pop(source, None)
+        self.manifest.entries.pop(self._key(source), None)
+        _remove_output(target, self.out)
+        return Change(source, target, 'removed', time.perf_counter() - started)
+
+    def watch(self, interval: float=0.25, report=None):
+        """ Calls poll() every interval seconds until interrupted, passing each Change to report. """
+        assert check_argument_types()
+        while True:
+            for change in self.poll():
+                if report is not None:
+                    report(change)
+            time.sleep(interval)
+
+def _report(change: Change):
+    if change.action == 'failed':
+        print(f"Failed to convert {change.source}: {change.error}", file=sys.stderr)
+    elif change.action == 'removed':
+        print(f"Deleted {change.target}")
+    else:
+        how = 'reparsed' if change.reparsed else 'parsed'
+        print(f"{change.source}: {change.seconds*1e3:.1f} ms, {how}, output {change.action}")
+    sys.stdout.flush()
+
+def main(args=None):
+    import argparse
+    from .tree import PrettyEmitter
+
+    parser = argparse.ArgumentParser(prog='javapy watch', description='Translate the javapy files in a directory whenever they change')
+    parser.add_argument('src', type=Path,
+                        help='The directory containing the javapy files')
+    parser.add_argument('--out', metavar='DIR', type=Path, required=True,
+                        help='The directory to write the Java files to, in the same layout as the source directory')
+    parser.add_argument('--interval', metavar='SECONDS', type=float, default=0.25,
+                        help='How often to look for changed files')
+    parser.add_argument('--debounce', metavar='SECONDS', type=float, default=0.1,
+                        help='How long a file must stay unchanged before it is translated, so a burst of saves is translated once')
+    parser.add_argument('--manifest', metavar='FILE', type=Path,
+                        help=f'Where to keep the record of what has been built. Defaults to {Manifest.FILENAME} in the output directory.')
+    parser.add_argument('--cache', metavar='DIR', type=Path, default=os.environ.get(Cache.ENV_VAR),
+                        help=f'A directory of cached translations to use for the first build. Defaults to ${Cache.ENV_VAR}.')
+    parser.add_argument('--type', choices=Options.SYNTAXES, default='JavaPy',
+                        help='What syntax to use')
+    parser.add_argument('--width', type=int,
+                        help='Format the output to fit within this many columns')
+    parser.add_argument('--brace-style', choices=PrettyEmitter.BRACE_STYLES,
+                        help='Where to put opening braces. Implies formatting the output.')
+
+    args = parser.parse_args(args)
+
+    if not args.src.is_dir():
+        parser.error(f"{args.src} is not a directory")
+
+    watcher = Watcher(args.src, args.out, Options(args.type, args.width, args.brace_style), debounce=args.debounce,
+                      manifest=args.manifest, cache=Cache(args.cache) if args.cache else None)
+    result = watcher.start()
+    for source, error in result.failed.items():
+        print(f"Failed to convert {source}: {error}", file=sys.stderr)
+    print(f"Converted {len(result.converted)} files, {len(result.skipped)} up to date, {len(result.failed)} failed")
+    print(f"Watching {args.src} for changes, press Ctrl+C to stop")
+    sys.stdout.flush()
+    try:
+        watcher.watch(args.interval, _report)
+    except KeyboardInterrupt:
+        pass
+    return 0